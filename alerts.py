@@ -0,0 +1,342 @@
+"""
+Streaming alert engine attached to sensor data ingest.
+
+Rules are evaluated incrementally as samples arrive: each rule keeps a
+small state per device, and rules are indexed by metric so a sample only
+touches the rules of its own metric. Rule kinds:
+
+- threshold: value above/below a limit for at least `duration` seconds
+- rate: value changes faster than `max_rate` units per minute, measured over
+  at least `window` seconds (default 60)
+- flatline: value stays within `epsilon` for at least `duration` seconds
+- offline: the device's status (last will on TOPIC_SYSTEM_STATUS) is offline
+
+An alert is raised once when its condition has held long enough, stays
+active (deduplicated) while the condition holds, is resolved when it
+clears, and cannot be raised again for the same device before `cooldown`
+seconds have passed. Alerts are stored in the alerts table, which the
+dashboard reads through /api/alerts and /api/alerts/stream.
+
+Rules come from ALERT_RULES (JSON list, default alerts.json) or
+DEFAULT_RULES. A threshold's "above"/"below" limit may name a setting
+instead of a number (e.g. "temperature_max"); settings are re-read every
+ALERT_SETTINGS_REFRESH seconds.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from collections import defaultdict, deque
+from sqlalchemy import select, func
+
+from models import db, Alert
+from processing import QUALITY_OK
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+ALERT_RULES = os.environ.get(
+    "ALERT_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alerts.json")
+)
+ALERT_SETTINGS_REFRESH = float(os.environ.get("ALERT_SETTINGS_REFRESH", 60))  # seconds
+
+# Shortest interval in seconds a rate rule computes the rate of change over
+DEFAULT_RATE_WINDOW = 60.0
+
+DEFAULT_RULES = [
+    {'name': 'temperature_high', 'kind': 'threshold', 'metric': 'temperature', 'above': 'temperature_max',
+     'duration': 300, 'severity': 'warning'},
+    {'name': 'temperature_low', 'kind': 'threshold', 'metric': 'temperature', 'below': 'temperature_min',
+     'duration': 300, 'severity': 'warning'},
+    {'name': 'humidity_high', 'kind': 'threshold', 'metric': 'humidity', 'above': 'humidity_max',
+     'duration': 600, 'severity': 'warning'},
+    {'name': 'humidity_low', 'kind': 'threshold', 'metric': 'humidity', 'below': 'humidity_min',
+     'duration': 600, 'severity': 'warning'},
+    {'name': 'temperature_rate', 'kind': 'rate', 'metric': 'temperature', 'max_rate': 2.0,
+     'severity': 'warning'},
+    {'name': 'temperature_stuck', 'kind': 'flatline', 'metric': 'temperature', 'epsilon': 0.05,
+     'duration': 3600, 'severity': 'warning'},
+    {'name': 'device_offline', 'kind': 'offline', 'severity': 'critical'},
+]
+
+class RuleState:
+    """Per (rule, device) evaluation state"""
+
+    __slots__ = ('condition_since', 'alert_id', 'cooldown_until', 'samples', 'anchor_value')
+
+    def __init__(self):
+        self.condition_since = None
+        self.alert_id = None
+        self.cooldown_until = 0.0
+        # Recent (ts, value) samples of a rate rule
+        self.samples = None
+        self.anchor_value = None
+
+class AlertRule:
+    """Base class: evaluate() returns whether the rule's condition holds for a sample"""
+
+    def __init__(self, config):
+        self.name = config['name']
+        self.kind = config['kind']
+        self.metric = config.get('metric')
+        self.device = config.get('device')
+        self.severity = config.get('severity', 'warning')
+        self.duration = float(config.get('duration', 0))
+        self.cooldown = float(config.get('cooldown', 900))
+        self.config = config
+
+    def evaluate(self, state, ts, value, settings):
+        raise NotImplementedError
+
+    def message(self, device, value, settings):
+        return f"{self.name} on {device}: {self.metric} = {value}"
+
+class ThresholdRule(AlertRule):
+    def _limit(self, key, settings):
+        limit = self.config.get(key)
+        if isinstance(limit, str):
+            limit = settings.get(limit)
+        return float(limit) if limit is not None else None
+
+    def evaluate(self, state, ts, value, settings):
+        above, below = self._limit('above', settings), self._limit('below', settings)
+        return (above is not None and value > above) or (below is not None and value < below)
+
+    def message(self, device, value, settings):
+        above, below = self._limit('above', settings), self._limit('below', settings)
+        limit = f"above {above}" if above is not None and value > above else f"below {below}"
+        return f"{self.metric} on {device} is {value} ({limit}) for {self.duration:.0f} s"
+
+class RateRule(AlertRule):
+    def evaluate(self, state, ts, value, settings):
+        # Compare against the newest sample at least `window` seconds old, so
+        # noise between closely spaced samples is not divided by a tiny interval
+        window = float(self.config.get('window', DEFAULT_RATE_WINDOW))
+        if state.samples is None:
+            state.samples = deque()
+        samples = state.samples
+        if samples and ts <= samples[-1][0]:
+            return False
+        samples.append((ts, value))
+        while len(samples) > 2 and ts - samples[1][0] >= window:
+            samples.popleft()
+        
+        reference_ts, reference_value = samples[0]
+        if ts - reference_ts < window:
+            return False
+        rate = abs(value - reference_value) / (ts - reference_ts) * 60.0
+        return rate > float(self.config['max_rate'])
+
+    def message(self, device, value, settings):
+        return f"{self.metric} on {device} changes faster than {self.config['max_rate']} per minute (now {value})"
+
+class FlatlineRule(AlertRule):
+    def evaluate(self, state, ts, value, settings):
+        # The condition holds while values stay within epsilon of the anchor
+        if state.anchor_value is None or abs(value - state.anchor_value) > float(self.config.get('epsilon', 0.0)):
+            state.anchor_value = value
+            return False
+        return True
+
+    def message(self, device, value, settings):
+        return f"{self.metric} on {device} has been stuck at {value} for {self.duration:.0f} s"
+
+class OfflineRule(AlertRule):
+    def evaluate(self, state, ts, value, settings):
+        return value == 'offline'
+
+    def message(self, device, value, settings):
+        return f"{device} is offline"
+
+RULE_KINDS = {
+    'threshold': ThresholdRule,
+    'rate': RateRule,
+    'flatline': FlatlineRule,
+    'offline': OfflineRule,
+}
+
+class AlertEngine:
+    """Evaluate alert rules per sample and persist raised/resolved alerts"""
+
+    def __init__(self, rules):
+        self.rules_by_metric = defaultdict(list)
+        self.offline_rules = []
+        for config in rules:
+            rule_class = RULE_KINDS.get(config.get('kind'))
+            if rule_class is None:
+                logger.error(f"Unknown alert rule kind {config.get('kind')!r} in {config.get('name')}")
+                continue
+            rule = rule_class(config)
+            if rule.kind == 'offline':
+                self.offline_rules.append(rule)
+            else:
+                self.rules_by_metric[rule.metric].append(rule)
+        self.states = {}
+        self.lock = threading.Lock()
+        self.settings = {}
+        self.settings_loaded = 0.0
+
+    def _settings(self):
+        """Settings referenced by threshold rules, refreshed every ALERT_SETTINGS_REFRESH seconds"""
+        now = time.monotonic()
+        if now - self.settings_loaded > ALERT_SETTINGS_REFRESH:
+            self.settings_loaded = now
+            try:
+                from data_storage import get_all_settings
+                from hardware import app_context
+                with app_context():
+                    self.settings = get_all_settings()
+            except Exception as e:
+                logger.error(f"Error loading settings for alert rules: {e}")
+        return self.settings
+
+    def on_sample(self, device, metric, ts, value, quality=QUALITY_OK):
+        """Evaluate the rules of a metric for one processed sample (ts in epoch seconds)"""
+        rules = self.rules_by_metric.get(metric)
+        if not rules or value is None or quality != QUALITY_OK:
+            return
+        settings = self._settings()
+        with self.lock:
+            for rule in rules:
+                if rule.device is None or rule.device == device:
+                    self._evaluate(rule, device, ts, value, settings)
+
+    def on_status(self, device, status, ts=None):
+        """Evaluate the offline rules for a device status update"""
+        ts = ts if ts is not None else time.time()
+        with self.lock:
+            for rule in self.offline_rules:
+                if rule.device is None or rule.device == device:
+                    self._evaluate(rule, device, ts, status, {})
+
+    def _evaluate(self, rule, device, ts, value, settings):
+        state = self.states.get((rule.name, device))
+        if state is None:
+            state = self.states[(rule.name, device)] = RuleState()
+
+        if not rule.evaluate(state, ts, value, settings):
+            state.condition_since = None
+            if state.alert_id is not None:
+                resolve_alert(state.alert_id, ts)
+                logger.info(f"Alert {rule.name} on {device} resolved")
+                state.alert_id = None
+                state.cooldown_until = ts + rule.cooldown
+            return
+
+        if state.condition_since is None:
+            state.condition_since = ts
+        if state.alert_id is None and ts - state.condition_since >= rule.duration and ts >= state.cooldown_until:
+            message = rule.message(device, value, settings)
+            state.alert_id = raise_alert(rule, device, message, value, state.condition_since)
+            logger.warning(f"Alert {rule.name}: {message}")
+
+def load_rules(path=ALERT_RULES):
+    """Alert rules from the rules file, falling back to DEFAULT_RULES"""
+    if not os.path.exists(path):
+        return DEFAULT_RULES
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading alert rules {path}: {e}")
+        return DEFAULT_RULES
+
+alert_engine = None
+
+def get_alert_engine():
+    """The process-wide alert engine, created on first use"""
+    global alert_engine
+    if alert_engine is None:
+        alert_engine = AlertEngine(load_rules())
+    return alert_engine
+
+def raise_alert(rule, device, message, value, started_ts):
+    """Store a new alert and return its id"""
+    from hardware import app_context
+
+    try:
+        with app_context():
+            alert = Alert(
+                rule=rule.name, kind=rule.kind, severity=rule.severity, device=device,
+                metric=rule.metric, message=message,
+                value=value if isinstance(value, (int, float)) else None,
+                started_at=datetime.utcfromtimestamp(started_ts)
+            )
+            db.session.add(alert)
+            db.session.commit()
+            return alert.id
+    except Exception as e:
+        logger.error(f"Error saving alert {rule.name}: {e}")
+        # Keep the alert active in memory so it is not raised again every sample
+        return -1
+
+def resolve_alert(alert_id, ts):
+    """Mark a stored alert as resolved"""
+    from hardware import app_context
+
+    if alert_id < 0:
+        return
+    try:
+        with app_context():
+            alert = db.session.get(Alert, alert_id)
+            if alert and alert.resolved_at is None:
+                alert.resolved_at = datetime.utcfromtimestamp(ts)
+                db.session.commit()
+    except Exception as e:
+        logger.error(f"Error resolving alert {alert_id}: {e}")
+
+def _alert_to_dict(alert):
+    return {
+        'id': alert.id,
+        'rule': alert.rule,
+        'kind': alert.kind,
+        'severity': alert.severity,
+        'device': alert.device,
+        'metric': alert.metric,
+        'message': alert.message,
+        'value': alert.value,
+        'started_at': alert.started_at.isoformat(),
+        'resolved_at': alert.resolved_at.isoformat() if alert.resolved_at else None,
+        'acknowledged': alert.acknowledged
+    }
+
+def get_alerts(active_only=False, limit=50):
+    """Get the most recent alerts, newest first"""
+
+    try:
+        query = select(Alert).order_by(Alert.id.desc()).limit(limit)
+        if active_only:
+            query = query.where(Alert.resolved_at.is_(None))
+        return [_alert_to_dict(alert) for alert in db.session.execute(query).scalars()]
+    except Exception as e:
+        logger.error(f"Error retrieving alerts: {e}")
+        return []
+
+def get_alerts_version():
+    """Version of the alerts table: changes when alerts are raised, resolved or acknowledged"""
+
+    try:
+        row = db.session.execute(
+            select(func.max(Alert.id), func.count(Alert.resolved_at),
+                   func.sum(db.case((Alert.acknowledged.is_(True), 1), else_=0)))
+        ).first()
+        return f"{row[0]}-{row[1]}-{row[2]}"
+    except Exception as e:
+        logger.error(f"Error retrieving alerts version: {e}")
+        return None
+
+def acknowledge_alert(alert_id):
+    """Mark an alert as acknowledged by the user"""
+    try:
+        alert = db.session.get(Alert, alert_id)
+        if alert is None:
+            return False
+        alert.acknowledged = True
+        db.session.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Error acknowledging alert {alert_id}: {e}")
+        return False
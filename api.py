@@ -1,27 +1,153 @@
+import io
+import os
+import json
+import time
 import logging
-from flask import Blueprint, jsonify, request
-from app import app
+import tempfile
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
 from hardware import (
-    control_fan, control_light, control_water_pump, 
-    get_current_sensor_data, get_current_control_state
+    control_fan, control_light, control_water_pump, control_actuators,
+    get_current_sensor_data, get_current_control_state,
+    get_control_state_version
 )
 from sensor_data import (
     get_latest_reading, get_readings_time_range, 
-    get_hourly_average, get_daily_min_max
+    get_hourly_average, get_daily_min_max, get_readings_version,
+    get_readings_time_range_columnar, get_hourly_average_columnar,
+    get_metrics, get_metric_series, get_metric_hourly_average, get_device_version,
+    get_aggregate, BUCKETS, STATISTICS, LEGACY_DEVICE
 )
 from data_storage import (
     get_all_settings, get_setting, update_setting, 
-    export_settings, import_settings
+    export_settings, import_settings, get_settings_version, get_timezone
+)
+from models import db
+from alerts import get_alerts, get_alerts_version, acknowledge_alert
+from control_rules import ACTUATORS, SCENE_HOLD, publish_rules, get_decisions, get_scenes
+from api_cache import cached_response, response_cache, make_etag
+from data_import import (
+    SUPPORTED_FORMATS, DEFAULT_CHUNK_SIZE, detect_format,
+    import_readings, iter_csv, iter_ndjson, iter_parquet
 )
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Create Blueprint for API routes
-api_bp = Blueprint('api', __name__, url_prefix='/api')
+# Seconds between alert checks of an /api/alerts/stream connection
+ALERT_STREAM_INTERVAL = float(os.environ.get("ALERT_STREAM_INTERVAL", 5))
+# Seconds a stream stays open; it holds a worker thread meanwhile, and the
+# client reconnects after ALERT_STREAM_RETRY seconds
+ALERT_STREAM_MAX_AGE = float(os.environ.get("ALERT_STREAM_MAX_AGE", 300))
+ALERT_STREAM_RETRY = float(os.environ.get("ALERT_STREAM_RETRY", 30))
+
+def windowed_readings_version():
+    """Version for time-window aggregates: changes with new readings and as the window slides"""
+    return (get_readings_version(), int(time.time() // 60))
+
+def aggregate_version():
+    """Version for /api/sensors/aggregate: new readings of the device, the sliding window and the timezone setting"""
+    return (windowed_readings_version(), get_device_version(request.args.get('device', LEGACY_DEVICE)),
+            get_settings_version())
+
+# Most buckets one aggregation request may return per metric
+MAX_AGGREGATE_BUCKETS = 10000
+
+def since_arg():
+    """The since cursor of an incremental request (reading id or epoch milliseconds), or None"""
+    try:
+        return int(request.args['since'])
+    except (KeyError, ValueError):
+        return None
+
+def control_response(payload, command):
+    """
+    JSON response of a control request.
+
+    While the sensor Pi has not acknowledged the command yet, or deferred
+    it until the minimum on/off time has passed, the response is 202 with
+    the command and its status URL in Location.
+    """
+    if command is not None:
+        payload['command'] = command
+    response = jsonify(payload)
+    if command is not None and command['state'] in ('pending', 'deferred'):
+        response.status_code = 202
+        response.headers['Location'] = f"/api/controls/commands/{command['id']}"
+    return response
+
+def hold_arg(data, default=None):
+    """The hold in seconds of a control request body; raises ValueError if invalid"""
+    hold = data.get('hold', default)
+    if hold is None:
+        return None
+    if isinstance(hold, bool) or not isinstance(hold, (int, float)) or hold < 0:
+        raise ValueError('hold must be a number of seconds')
+    return float(hold)
+
+def _device_hourly(device, since=None):
+    """Hourly averages of the last 24 hours of every metric of a device"""
+    return {entry['metric']: get_metric_hourly_average(entry['metric'], 24, device, since)
+            for entry in get_metrics(device)}
+
+# Dashboard snapshot sections: (version function, data function), each
+# taking the device (None = the original wide readings)
+SNAPSHOT_SECTIONS = {
+    'sensors': (
+        lambda device: get_readings_version() if device is None else get_device_version(device),
+        lambda device: get_latest_reading() if device is None else get_metrics(device)
+    ),
+    'controls': (lambda device: get_control_state_version(), lambda device: get_current_control_state()),
+    'settings': (lambda device: get_settings_version(), lambda device: get_all_settings()),
+    'hourly': (
+        lambda device: (windowed_readings_version() if device is None
+                        else (get_device_version(device), int(time.time() // 60))),
+        lambda device: get_hourly_average_columnar(24) if device is None else _device_hourly(device)
+    ),
+}
+
+# Sections that can be sent incrementally: data function taking (device, since)
+SNAPSHOT_INCREMENTAL = {
+    'hourly': lambda device, since: (get_hourly_average_columnar(24, since) if device is None
+                                     else _device_hourly(device, since)),
+}
+
+def build_snapshot(sections, device=None, known_versions=None, since=None):
+    """
+    Build the dashboard snapshot of the requested sections.
+
+    Every section gets a short version tag; sections whose tag matches
+    known_versions (what the client already has) are left out of 'sections'.
+    Section data is kept in the shared response cache under its version.
+    With a since cursor (epoch milliseconds), changed incremental sections
+    the client already holds only carry their buckets from since on and are
+    listed in 'partial'.
+    """
+    known_versions = known_versions or {}
+    snapshot = {'device': device, 'versions': {}, 'sections': {}, 'partial': []}
+    for name in sections:
+        version_func, data_func = SNAPSHOT_SECTIONS[name]
+        version = version_func(device)
+        tag = make_etag(name, device, version)
+        snapshot['versions'][name] = tag
+        if known_versions.get(name) == tag:
+            continue
+        if since is not None and name in known_versions and name in SNAPSHOT_INCREMENTAL:
+            snapshot['sections'][name] = SNAPSHOT_INCREMENTAL[name](device, since)
+            snapshot['partial'].append(name)
+            continue
+        key = ('snapshot', name, device)
+        data = response_cache.get(key, version)
+        if data is None:
+            data = data_func(device)
+            response_cache.set(key, version, data)
+        snapshot['sections'][name] = data
+    return snapshot
 
 def register_api_routes(app):
     """Register API routes with the Flask app"""
+    # Create Blueprint for API routes (per app, so several apps can be created)
+    api_bp = Blueprint('api', __name__, url_prefix='/api')
     
     # Sensor data endpoints
     @api_bp.route('/sensors/current', methods=['GET'])
@@ -43,10 +169,15 @@ def register_api_routes(app):
         except ValueError:
             hours = 24
         
-        readings = get_readings_time_range(hours)
+        # since is the id of the newest reading the client has
+        if request.args.get('format') == 'columnar':
+            return jsonify(get_readings_time_range_columnar(hours, since_arg()))
+        
+        readings = get_readings_time_range(hours, since_arg())
         return jsonify(readings)
     
     @api_bp.route('/sensors/hourly', methods=['GET'])
+    @cached_response(windowed_readings_version)
     def get_hourly_data():
         """Get hourly averaged sensor data"""
         hours = request.args.get('hours', '24')
@@ -57,10 +188,15 @@ def register_api_routes(app):
         except ValueError:
             hours = 24
         
-        data = get_hourly_average(hours)
+        # since (epoch ms) limits the result to the hour holding it and later hours
+        if request.args.get('format') == 'columnar':
+            return jsonify(get_hourly_average_columnar(hours, since_arg()))
+        
+        data = get_hourly_average(hours, since_arg())
         return jsonify(data)
     
     @api_bp.route('/sensors/daily', methods=['GET'])
+    @cached_response(windowed_readings_version)
     def get_daily_data():
         """Get daily min/max sensor data"""
         days = request.args.get('days', '7')
@@ -71,16 +207,281 @@ def register_api_routes(app):
         except ValueError:
             days = 7
         
-        data = get_daily_min_max(days)
+        data = get_daily_min_max(days, since_arg())
         return jsonify(data)
     
+    @api_bp.route('/sensors/charts', methods=['GET'])
+    @cached_response(windowed_readings_version)
+    def get_chart_data():
+        """Get everything the history page charts need in one response"""
+        hours = request.args.get('hours', '24')
+        try:
+            hours = int(hours)
+            if hours < 1 or hours > 168:  # Max one week
+                hours = 24
+        except ValueError:
+            hours = 24
+        
+        days = request.args.get('days', '7')
+        try:
+            days = int(days)
+            if days < 1 or days > 30:  # Max one month
+                days = 7
+        except ValueError:
+            days = 7
+        
+        since = since_arg()
+        return jsonify({
+            'hourly': get_hourly_average_columnar(hours, since),
+            'daily': get_daily_min_max(days, since)
+        })
+    
+    @api_bp.route('/sensors/aggregate', methods=['GET'])
+    @cached_response(aggregate_version)
+    def get_aggregate_data():
+        """
+        Get bucketed statistics of a device's metrics.
+        
+        bucket=1m|5m|15m|1h|1d, hours=<window>, tz=<IANA name> (default: the
+        timezone setting), device=<name>, metrics=a,b (default: all),
+        stats=mean,min,max,stddev,p95,count (default: mean,min,max,count),
+        since=<epoch ms>.
+        """
+        bucket = request.args.get('bucket', '1h')
+        if bucket not in BUCKETS:
+            return jsonify({'error': f'Bucket must be one of: {", ".join(BUCKETS)}'}), 400
+        
+        hours = request.args.get('hours', '24')
+        try:
+            hours = int(hours)
+            if hours < 1 or hours > 8784:  # Max one year
+                hours = 24
+        except ValueError:
+            hours = 24
+        if hours * 3600 // BUCKETS[bucket] > MAX_AGGREGATE_BUCKETS:
+            return jsonify({'error': f'Too many {bucket} buckets in {hours} hours, use a wider bucket'}), 400
+        
+        stats = request.args.get('stats')
+        stats = stats.split(',') if stats else ['mean', 'min', 'max', 'count']
+        unknown = [stat for stat in stats if stat not in STATISTICS]
+        if unknown:
+            return jsonify({'error': f'Unknown statistics: {", ".join(unknown)}'}), 400
+        
+        tz_name = request.args.get('tz')
+        if tz_name:
+            try:
+                tz = ZoneInfo(tz_name)
+            except (ZoneInfoNotFoundError, ValueError):
+                return jsonify({'error': f'Unknown time zone: {tz_name}'}), 400
+        else:
+            tz = get_timezone()
+        
+        metrics = request.args.get('metrics')
+        return jsonify(get_aggregate(
+            bucket, hours, request.args.get('device', LEGACY_DEVICE),
+            metrics.split(',') if metrics else None, stats, tz, since_arg()
+        ))
+    
+    @api_bp.route('/metrics', methods=['GET'])
+    def list_metrics():
+        """Get all metrics of all devices with their latest value"""
+        return jsonify(get_metrics())
+    
+    @api_bp.route('/metrics/<device>/<metric>', methods=['GET'])
+    def get_metric_data(device, metric):
+        """Get one metric of one device as parallel arrays (bucket=raw or hour, since=epoch ms)"""
+        hours = request.args.get('hours', '24')
+        try:
+            hours = int(hours)
+            if hours < 1 or hours > 168:  # Max one week
+                hours = 24
+        except ValueError:
+            hours = 24
+        
+        if request.args.get('bucket') == 'hour':
+            return jsonify(get_metric_hourly_average(metric, hours, device, since_arg()))
+        return jsonify(get_metric_series(metric, hours, device, since_arg()))
+    
+    @api_bp.route('/dashboard/snapshot', methods=['GET'])
+    def get_dashboard_snapshot():
+        """
+        Get sensors, controls, settings and hourly chart data in one response.
+        
+        sections=a,b limits the sections; device=<name> scopes sensor data to
+        one device; <section>=<version> leaves out sections the client
+        already has at that version; since=<epoch ms> sends changed hourly
+        data from the hour before the one holding since on.
+        """
+        sections = request.args.get('sections')
+        sections = sections.split(',') if sections else list(SNAPSHOT_SECTIONS)
+        unknown = [name for name in sections if name not in SNAPSHOT_SECTIONS]
+        if unknown:
+            return jsonify({'error': f'Unknown sections: {", ".join(unknown)}'}), 400
+        
+        known_versions = {name: request.args[name] for name in sections if name in request.args}
+        snapshot = build_snapshot(sections, request.args.get('device') or None, known_versions, since_arg())
+        response = jsonify(snapshot)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    @api_bp.route('/sensors/import', methods=['POST'])
+    def import_sensor_data():
+        """Bulk import sensor readings from an uploaded CSV, NDJSON or Parquet file"""
+        upload = request.files.get('file')
+        fmt = request.args.get('format') or (detect_format(upload.filename) if upload else None)
+        if fmt not in SUPPORTED_FORMATS:
+            return jsonify({'error': f'Format must be one of: {", ".join(SUPPORTED_FORMATS)}'}), 400
+        
+        try:
+            chunk_size = int(request.args.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        except ValueError:
+            return jsonify({'error': 'chunk_size must be an integer'}), 400
+        if chunk_size < 1:
+            return jsonify({'error': 'chunk_size must be at least 1'}), 400
+        
+        # Stream the upload (or raw request body) instead of reading it into memory
+        source = upload.stream if upload else request.stream
+        try:
+            if fmt == 'parquet':
+                # Parquet needs a seekable file
+                with tempfile.NamedTemporaryFile(suffix='.parquet') as tmp:
+                    if upload:
+                        upload.save(tmp)
+                    else:
+                        tmp.write(source.read())
+                    tmp.flush()
+                    stats = import_readings(iter_parquet(tmp.name, chunk_size), chunk_size)
+            else:
+                text = io.TextIOWrapper(source, encoding='utf-8', newline='')
+                records = iter_csv(text) if fmt == 'csv' else iter_ndjson(text)
+                stats = import_readings(records, chunk_size)
+        except Exception as e:
+            logger.error(f"Error importing sensor data: {e}")
+            return jsonify({'error': f'Failed to import sensor data: {e}'}), 400
+        
+        return jsonify({'success': True, **stats})
+    
+    @api_bp.route('/sensors/backfill', methods=['POST'])
+    def request_sensor_backfill():
+        """Ask a Sensor Pi in edge mode for the raw samples of a time range (epoch milliseconds)"""
+        data = request.get_json(silent=True) or {}
+        try:
+            start, end = int(data['start']), int(data['end'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'start and end must be epoch milliseconds'}), 400
+        if end <= start:
+            return jsonify({'error': 'end must be after start'}), 400
+        channels = data.get('channels')
+        if channels is not None and not (isinstance(channels, list) and all(isinstance(c, str) for c in channels)):
+            return jsonify({'error': 'channels must be a list of channel names'}), 400
+    
+        try:
+            from mqtt_client import request_backfill
+        except ImportError:
+            return jsonify({'error': 'MQTT client not available'}), 503
+        request_id = request_backfill(data.get('device') or LEGACY_DEVICE, start, end, channels)
+        if request_id is None:
+            return jsonify({'error': 'Backfill request could not be sent'}), 503
+        return jsonify({'success': True, 'id': request_id}), 202
+    
+    # Alert endpoints
+    @api_bp.route('/alerts', methods=['GET'])
+    @cached_response(get_alerts_version)
+    def list_alerts():
+        """Get recent alerts (active=1 for unresolved alerts only)"""
+        try:
+            limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        except ValueError:
+            limit = 50
+        return jsonify(get_alerts(request.args.get('active') == '1', limit))
+    
+    @api_bp.route('/alerts/stream', methods=['GET'])
+    def stream_alerts():
+        """
+        Server-sent events with the active alerts, sent whenever they change.
+
+        Each connection occupies a worker thread, so it is closed after
+        ALERT_STREAM_MAX_AGE and the client told to reconnect after
+        ALERT_STREAM_RETRY. The dashboard pages poll /api/alerts instead.
+        """
+        def generate():
+            version = None
+            closes_at = time.monotonic() + ALERT_STREAM_MAX_AGE
+            yield f"retry: {int(ALERT_STREAM_RETRY * 1000)}\n\n"
+            while time.monotonic() < closes_at:
+                current = get_alerts_version()
+                if current != version:
+                    version = current
+                    yield f"event: alerts\ndata: {json.dumps(get_alerts(active_only=True))}\n\n"
+                else:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                # Release the connection between checks
+                db.session.remove()
+                time.sleep(ALERT_STREAM_INTERVAL)
+        
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    @api_bp.route('/alerts/<int:alert_id>/acknowledge', methods=['POST'])
+    def acknowledge(alert_id):
+        """Acknowledge an alert"""
+        if acknowledge_alert(alert_id):
+            return jsonify({'success': True})
+        return jsonify({'error': f'Alert not found: {alert_id}'}), 404
+    
     # Control endpoints
     @api_bp.route('/controls/status', methods=['GET'])
+    @cached_response(get_control_state_version)
     def get_control_status():
         """Get current status of all controls"""
         control_state = get_current_control_state()
         return jsonify(control_state)
     
+    @api_bp.route('/controls/commands', methods=['GET'])
+    def get_command_status():
+        """Get control command round-trip statistics"""
+        try:
+            from mqtt_client import get_command_stats
+        except ImportError:
+            return jsonify({'error': 'MQTT client not available'}), 503
+        return jsonify(get_command_stats())
+    
+    @api_bp.route('/controls/commands/<command_id>', methods=['GET'])
+    def get_control_command(command_id):
+        """Get a recent control command: pending, acknowledged (with the status) or timeout"""
+        try:
+            from mqtt_client import get_command
+        except ImportError:
+            return jsonify({'error': 'MQTT client not available'}), 503
+        command = get_command(command_id)
+        if command is None:
+            return jsonify({'error': f'Command not found: {command_id}'}), 404
+        return jsonify(command)
+    
+    @api_bp.route('/controls/decisions', methods=['GET'])
+    def get_control_decisions():
+        """Get the decisions reported by the Sensor Pi's local control rules"""
+        try:
+            limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        except ValueError:
+            limit = 50
+        return jsonify(get_decisions(limit, request.args.get('device')))
+    
+    @api_bp.route('/mqtt/status', methods=['GET'])
+    def get_mqtt_status():
+        """Get MQTT connection state and transition metrics"""
+        try:
+            from mqtt_client import get_connection_stats
+        except ImportError:
+            return jsonify({'error': 'MQTT client not available'}), 503
+        return jsonify(get_connection_stats())
+    
+    @api_bp.route('/system/startup', methods=['GET'])
+    def get_startup_timings():
+        """Get how long application startup and each subsystem took"""
+        return jsonify(current_app.extensions.get('growbox_startup', {}))
+    
     @api_bp.route('/controls/fan', methods=['POST'])
     def set_fan():
         """Control fan state"""
@@ -96,8 +497,8 @@ def register_api_routes(app):
         if isinstance(state, str):
             state = state.lower() == 'true'
         
-        result = control_fan(state)
-        return jsonify({'success': True, 'fan_state': result})
+        result, command = control_fan(state)
+        return control_response({'success': True, 'fan_state': result}, command)
     
     @api_bp.route('/controls/light', methods=['POST'])
     def set_light():
@@ -114,8 +515,8 @@ def register_api_routes(app):
         if isinstance(state, str):
             state = state.lower() == 'true'
         
-        result = control_light(state)
-        return jsonify({'success': True, 'light_state': result})
+        result, command = control_light(state)
+        return control_response({'success': True, 'light_state': result}, command)
     
     @api_bp.route('/controls/water', methods=['POST'])
     def set_water_pump():
@@ -132,11 +533,61 @@ def register_api_routes(app):
         if isinstance(state, str):
             state = state.lower() == 'true'
         
-        result = control_water_pump(state)
-        return jsonify({'success': True, 'water_pump_state': result})
+        result, command = control_water_pump(state)
+        return control_response({'success': True, 'water_pump_state': result}, command)
+    
+    @api_bp.route('/controls/batch', methods=['POST'])
+    def set_controls_batch():
+        """Set several actuators at once, optionally on some devices only"""
+        data = request.get_json(silent=True) or {}
+        states = data.get('states')
+        if not isinstance(states, dict) or not states:
+            return jsonify({'error': 'states must map actuators to true or false'}), 400
+        unknown = [name for name in states if name not in ACTUATORS]
+        if unknown:
+            return jsonify({'error': f"Unknown actuators: {', '.join(unknown)}"}), 400
+        if any(not isinstance(state, bool) and state not in ['true', 'false'] for state in states.values()):
+            return jsonify({'error': 'State must be true or false'}), 400
+        devices = data.get('devices')
+        if devices is not None and not (isinstance(devices, list) and all(isinstance(d, str) for d in devices)):
+            return jsonify({'error': 'devices must be a list of device names'}), 400
+        try:
+            hold = hold_arg(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Convert strings to booleans if needed
+        states = {name: state.lower() == 'true' if isinstance(state, str) else state
+                  for name, state in states.items()}
+        control_state, command = control_actuators(states, devices or None, hold)
+        return control_response({'success': True, 'control_state': control_state}, command)
+    
+    @api_bp.route('/controls/scenes', methods=['GET'])
+    def list_scenes():
+        """Get the configured scenes"""
+        return jsonify(get_scenes())
+    
+    @api_bp.route('/controls/scenes/<name>', methods=['POST'])
+    def apply_scene(name):
+        """Apply a scene, optionally on some devices only, holding it against the rules"""
+        states = get_scenes().get(name)
+        if states is None:
+            return jsonify({'error': f'Scene not found: {name}'}), 404
+        data = request.get_json(silent=True) or {}
+        devices = data.get('devices')
+        if devices is not None and not (isinstance(devices, list) and all(isinstance(d, str) for d in devices)):
+            return jsonify({'error': 'devices must be a list of device names'}), 400
+        try:
+            hold = hold_arg(data, SCENE_HOLD)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        control_state, command = control_actuators(states, devices or None, hold)
+        return control_response({'success': True, 'scene': name, 'control_state': control_state}, command)
     
     # Settings endpoints
     @api_bp.route('/settings', methods=['GET'])
+    @cached_response(get_settings_version)
     def get_settings():
         """Get all settings"""
         settings = get_all_settings()
@@ -159,6 +610,7 @@ def register_api_routes(app):
         
         result = update_setting(name, data['value'])
         if result:
+            publish_rules()
             return jsonify({'success': True, name: data['value']})
         else:
             return jsonify({'error': f'Failed to update setting: {name}'}), 500
@@ -178,6 +630,7 @@ def register_api_routes(app):
         
         result = import_settings(data)
         if result:
+            publish_rules()
             return jsonify({'success': True})
         else:
             return jsonify({'error': 'Failed to import settings'}), 500
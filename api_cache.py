@@ -0,0 +1,98 @@
+import os
+import time
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, current_app
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# How long a rendered response may be reused (seconds) and how many to keep
+API_CACHE_TTL = float(os.environ.get("API_CACHE_TTL", 30))
+API_CACHE_SIZE = int(os.environ.get("API_CACHE_SIZE", 256))
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after a fixed time"""
+
+    def __init__(self, ttl=API_CACHE_TTL, maxsize=API_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """Return the cached value for key if it has not expired and matches version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, version, value):
+        """Store a value for key, evicting the least recently used entries"""
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+# Shared cache for rendered API responses
+response_cache = TTLCache()
+
+def make_etag(*parts):
+    """Build a compact ETag value from version parts"""
+    return format(zlib.crc32(repr(parts).encode()), '08x')
+
+def cached_response(version_func):
+    """
+    Decorate a read-only JSON view with ETag handling and response caching.
+
+    version_func returns a cheap value that changes whenever the view's
+    output would change. A request whose If-None-Match matches the current
+    ETag gets a 304 without running the view; otherwise the rendered body is
+    reused from the TTL cache while the version is unchanged.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = version_func()
+            params = tuple(sorted(request.args.items(multi=True)))
+            etag = make_etag(request.endpoint, params, kwargs, version)
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+
+            key = (request.endpoint, params, tuple(sorted(kwargs.items())))
+            body = response_cache.get(key, version)
+            if body is None:
+                result = current_app.make_response(view(*args, **kwargs))
+                if result.status_code != 200:
+                    return result
+                body = result.get_data()
+                response_cache.set(key, version, body)
+
+            response = current_app.response_class(body, mimetype='application/json')
+            response.set_etag(etag)
+            # Let browsers keep the body but revalidate it on every poll
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
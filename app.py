@@ -1,56 +1,131 @@
-
 import os
+import time
 import logging
 from flask import Flask
 from models import db
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Create Flask application
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
+def env_flag(name, default):
+    """Read a boolean flag from the environment"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
 
-# Configure PostgreSQL database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///growbox.db")
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+def default_config():
+    """Configuration read from the environment when the app is created"""
+    return {
+        "SECRET_KEY": os.environ.get("SESSION_SECRET", "dev-secret-key"),
+        # Configure PostgreSQL database
+        "SQLALCHEMY_DATABASE_URI": os.environ.get("DATABASE_URL", "sqlite:///growbox.db"),
+        "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        "SQLALCHEMY_ENGINE_OPTIONS": {
+            "pool_recycle": 300,
+            "pool_pre_ping": True,
+        },
+        # Subsystems started by start_subsystems()
+        "GROWBOX_INIT_DB": env_flag("GROWBOX_INIT_DB", True),
+        "GROWBOX_HARDWARE": env_flag("GROWBOX_HARDWARE", True),
+        "GROWBOX_MQTT": env_flag("GROWBOX_MQTT", True),
+        "GROWBOX_AUTOMATION": env_flag("GROWBOX_AUTOMATION", False),
+    }
 
-# Initialize the database with the app
-db.init_app(app)
+def create_app(config=None, start=True):
+    """
+    Create and configure the Flask application.
 
-# Import and register routes after app initialization to avoid circular imports
-with app.app_context():
+    Importing this module has no side effects; the database schema,
+    hardware, MQTT and automation are only started by start_subsystems(),
+    which create_app() calls unless start=False. Each subsystem can be
+    switched off with its GROWBOX_* config flag.
+    """
+    started = time.perf_counter()
+    
+    app = Flask(__name__)
+    app.config.update(default_config())
+    if config:
+        app.config.update(config)
+    
+    # Initialize the database with the app
+    db.init_app(app)
+    
+    # Import and register routes here to avoid circular imports
     from routes import register_routes
     from api import register_api_routes
+    from data_import import register_cli_commands
+    from rollups import register_rollup_commands
+    from derived_metrics import register_derived_commands
     
     # Register route blueprints
     register_routes(app)
     register_api_routes(app)
     
-    # Create tables
+    # Register CLI commands (e.g. `flask import-readings`)
+    register_cli_commands(app)
+    register_rollup_commands(app)
+    register_derived_commands(app)
+    
+    app.extensions['growbox_startup'] = {'create_app_ms': round((time.perf_counter() - started) * 1000, 1)}
+    
+    if start:
+        start_subsystems(app)
+    return app
+
+def init_db_schema(app):
+    """Create missing tables and default settings"""
+    from data_storage import initialize_settings
+    from models import add_missing_columns
+    from rollups import backfill_rollups
     db.create_all()
+    add_missing_columns()
+    initialize_settings()
+    backfill_rollups()
+
+def init_hardware(app):
+    """Initialize GPIO hardware (if available)"""
+    from hardware import initialize_hardware
+    initialize_hardware(app)
+
+def init_mqtt(app):
+    """Initialize the MQTT client for communication with the Sensor Pi"""
+    from mqtt_client import initialize_mqtt
+    initialize_mqtt()
+
+def init_automation(app):
+    """Start evaluating the automatic control rules"""
+    from automation import start_automation
+    start_automation(app)
+
+# Subsystems in start order: (name, config flag, initializer)
+SUBSYSTEMS = (
+    ('db_schema', 'GROWBOX_INIT_DB', init_db_schema),
+    ('hardware', 'GROWBOX_HARDWARE', init_hardware),
+    ('mqtt', 'GROWBOX_MQTT', init_mqtt),
+    ('automation', 'GROWBOX_AUTOMATION', init_automation),
+)
+
+def start_subsystems(app):
+    """Start the enabled subsystems and record how long each one took"""
+    from mqtt_ipc import is_proxy
+    from hardware import bind_app
+    
+    timings = app.extensions['growbox_startup']
+    bind_app(app)
+    with app.app_context():
+        for name, flag, initializer in SUBSYSTEMS:
+            # In proxy mode the ingest process owns the hardware and automation
+            if not app.config[flag] or (is_proxy() and name in ('hardware', 'automation')):
+                continue
+            
+            started = time.perf_counter()
+            try:
+                initializer(app)
+                logger.info(f"Started {name}")
+            except Exception as e:
+                logger.warning(f"Could not start {name}: {e}")
+            timings[f'{name}_ms'] = round((time.perf_counter() - started) * 1000, 1)
     
-    # Initialize hardware (if available)
-    try:
-        from hardware import initialize_hardware
-        initialize_hardware()
-        logger.info("Hardware initialized successfully")
-    except Exception as e:
-        logger.warning(f"Could not initialize hardware: {e}")
-        logger.warning("Running in simulation mode - hardware controls will be simulated")
-    
-    # Initialize MQTT client for communication with Sensor Pi
-    try:
-        from mqtt_client import initialize_mqtt
-        initialize_mqtt()
-        logger.info("MQTT client initialized successfully")
-    except Exception as e:
-        logger.warning(f"Could not initialize MQTT client: {e}")
-        logger.warning("Running without MQTT - using local sensors only")
-
-logger.info("Application initialized successfully")
+    timings['total_ms'] = round(sum(timings.values()), 1)
+    logger.info(f"Application started in {timings['total_ms']} ms: {timings}")
+    return timings
@@ -0,0 +1,59 @@
+import os
+import time
+import logging
+import threading
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Seconds between evaluations of the automatic control rules
+AUTOMATION_INTERVAL = float(os.environ.get("AUTOMATION_INTERVAL", 30))
+
+automation_thread = None
+should_run = False
+
+def apply_automation_rules():
+    """Evaluate the automatic control rules once and switch actuators that disagree"""
+    from data_storage import should_fan_be_on, should_light_be_on, should_water_pump_be_on
+    from hardware import control_fan, control_light, control_water_pump, get_current_control_state, is_held
+    
+    current = get_current_control_state()
+    rules = (
+        ('fan', should_fan_be_on, control_fan),
+        ('light', should_light_be_on, control_light),
+        ('water_pump', should_water_pump_be_on, control_water_pump),
+    )
+    for name, rule, control in rules:
+        # Scenes hold their actuators for a while
+        if is_held(name):
+            continue
+        desired = rule()
+        # None means "keep the current state" (auto control off or inside the hysteresis band)
+        if desired is not None and desired != current.get(name):
+            logger.info(f"Automation switching {name} {'ON' if desired else 'OFF'}")
+            control(desired)
+
+def automation_loop(app):
+    """Thread function evaluating the automation rules every AUTOMATION_INTERVAL seconds"""
+    while should_run:
+        started = time.monotonic()
+        try:
+            with app.app_context():
+                apply_automation_rules()
+        except Exception as e:
+            logger.error(f"Error in automation loop: {e}")
+        time.sleep(max(AUTOMATION_INTERVAL - (time.monotonic() - started), 1.0))
+
+def start_automation(app):
+    """Start the automation thread"""
+    global automation_thread, should_run
+    
+    should_run = True
+    automation_thread = threading.Thread(target=automation_loop, args=(app,), daemon=True)
+    automation_thread.start()
+    logger.info("Automation thread started")
+
+def stop_automation():
+    """Stop the automation thread"""
+    global should_run
+    should_run = False
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for the dashboard application.
+
+Starts a fresh interpreter per run (so nothing is cached in sys.modules)
+and times importing the app module and create_app() with different
+subsystems switched on, against a temporary SQLite database. The per
+subsystem timings come from create_app() itself (also served at
+/api/system/startup).
+
+    python benchmarks/cold_start.py --repeat 5
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a child interpreter: import time, create_app() time, subsystem timings
+CHILD = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000,
+                  'create_ms': (created - imported) * 1000,
+                  'subsystems': app.extensions['growbox_startup']}))
+"""
+
+# Subsystem flags per scenario
+SCENARIOS = {
+    'bare': {'GROWBOX_INIT_DB': '0', 'GROWBOX_HARDWARE': '0', 'GROWBOX_MQTT': '0'},
+    'db': {'GROWBOX_INIT_DB': '1', 'GROWBOX_HARDWARE': '0', 'GROWBOX_MQTT': '0'},
+    'db+hardware': {'GROWBOX_INIT_DB': '1', 'GROWBOX_HARDWARE': '1', 'GROWBOX_MQTT': '0'},
+    'full': {'GROWBOX_INIT_DB': '1', 'GROWBOX_HARDWARE': '1', 'GROWBOX_MQTT': '1'},
+}
+
+def run_once(flags, database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, GROWBOX_AUTOMATION='0', **flags)
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='cold starts per scenario')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='growbox-bench-')
+    database_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    print(f"{'scenario':<14}{'import ms':>11}{'create ms':>11}  subsystems (best run)")
+    for name, flags in SCENARIOS.items():
+        runs = [run_once(flags, database_url) for _ in range(args.repeat)]
+        best = min(runs, key=lambda run: run['import_ms'] + run['create_ms'])
+        import_ms = min(run['import_ms'] for run in runs)
+        create_ms = min(run['create_ms'] for run in runs)
+        print(f"{name:<14}{import_ms:>11.1f}{create_ms:>11.1f}  {best['subsystems']}")
+
+if __name__ == '__main__':
+    main()
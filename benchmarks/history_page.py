@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark for a view of the history page.
+
+Seeds a temporary SQLite database with simulated readings and replays
+the requests one view of /history makes, comparing the previous page (the
+server aggregated hourly and daily data to render the template, then the
+browser fetched both again from /api/sensors/hourly and /api/sensors/daily;
+reproduced below for reference) with the shell page that loads its charts
+from /api/sensors/charts. Reports the page's time to first byte, the total
+time and the SQL statements per view, with the response cache cleared
+before every view.
+
+    python benchmarks/history_page.py --days 7 --hours 168 --repeat 20
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def legacy_history(hours):
+    """The previous /history view"""
+    from flask import render_template
+    from sensor_data import get_latest_reading, get_hourly_average, get_daily_min_max
+
+    latest = get_latest_reading()
+    hourly_data = get_hourly_average(hours)
+    daily_data = get_daily_min_max(7)
+    return render_template('history.html', latest=latest, hourly_data=hourly_data,
+                           daily_data=daily_data, selected_range=f'{hours}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=7, help='days of 30 s readings to seed')
+    parser.add_argument('--hours', type=int, default=168, help='chart range of the page view')
+    parser.add_argument('--repeat', type=int, default=20, help='timed page views per variant')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='growbox-bench-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    from sqlalchemy import event
+    from app import create_app
+    app = create_app({'GROWBOX_HARDWARE': False, 'GROWBOX_MQTT': False, 'GROWBOX_AUTOMATION': False})
+    app.add_url_rule('/history-legacy', 'history_legacy', lambda: legacy_history(args.hours))
+    from models import db
+    from simulation import generate_history
+    from data_import import import_readings
+    from api_cache import response_cache
+    import sensor_data
+
+    steps = args.days * 2880
+    with app.app_context():
+        history = generate_history(time.time() - steps * 30, steps, step_seconds=30, seed=1)
+        records = (
+            {'timestamp': history['timestamp'][i],
+             **{name: float(history[name][i][0]) for name in sensor_data.METRICS}}
+            for i in range(steps)
+        )
+        stats = import_readings(records)
+        print(f"Seeded {stats['rows']} readings ({stats['rows_per_second']} rows/s)\n")
+
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: statements.append(a[2]))
+
+    variants = [
+        ('before', '/history-legacy', [f'/api/sensors/hourly?hours={args.hours}&format=columnar',
+                                       '/api/sensors/daily?days=7']),
+        ('after', '/history?range=7d', [f'/api/sensors/charts?hours={args.hours}&days=7']),
+    ]
+
+    client = app.test_client()
+    print(f"{'variant':<10}{'requests':>9}{'TTFB ms':>10}{'view ms':>10}{'queries':>9}")
+    for name, page, data_urls in variants:
+        ttfb = total = 0.0
+        queries = 0
+        for i in range(args.repeat + 1):
+            response_cache.clear()
+            statements.clear()
+            started = time.perf_counter()
+            assert client.get(page).status_code == 200
+            first_byte = time.perf_counter()
+            for url in data_urls:
+                assert client.get(url).status_code == 200
+            finished = time.perf_counter()
+            if i:  # the first view warms up templates and compiled statements
+                ttfb += first_byte - started
+                total += finished - started
+                queries += len(statements)
+        print(f"{name:<10}{1 + len(data_urls):>9}{ttfb / args.repeat * 1000:>10.2f}"
+              f"{total / args.repeat * 1000:>10.2f}{queries / args.repeat:>9.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the sensor_data read paths.
+
+Seeds a temporary SQLite database with simulated readings and compares the
+Core select() implementations in sensor_data with the previous ORM-based
+ones (kept below for reference): latency per call and memory allocated per
+call, measured with tracemalloc.
+
+    python benchmarks/sensor_queries.py --days 7 --repeat 20
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def orm_latest_reading(SensorReading):
+    reading = SensorReading.query.order_by(SensorReading.timestamp.desc()).first()
+    return reading.to_dict() if reading else None
+
+def orm_readings_time_range(SensorReading, hours):
+    end_time = datetime.utcnow()
+    start_time = end_time - timedelta(hours=hours)
+    readings = SensorReading.query.filter(
+        SensorReading.timestamp.between(start_time, end_time)
+    ).order_by(SensorReading.timestamp.asc()).all()
+    return [reading.to_dict() for reading in readings]
+
+def _orm_group(readings, key_func):
+    groups = {}
+    for reading in readings:
+        data = groups.setdefault(key_func(reading.timestamp), {
+            'temperature': [], 'humidity': [], 'light_level': [], 'soil_moisture': []
+        })
+        data['temperature'].append(reading.temperature)
+        data['humidity'].append(reading.humidity)
+        data['light_level'].append(reading.light_level)
+        if reading.soil_moisture is not None:
+            data['soil_moisture'].append(reading.soil_moisture)
+    return groups
+
+def orm_hourly_average(SensorReading, hours):
+    end_time = datetime.utcnow()
+    start_time = end_time - timedelta(hours=hours)
+    readings = SensorReading.query.filter(SensorReading.timestamp.between(start_time, end_time)).all()
+    groups = _orm_group(readings, lambda ts: ts.replace(minute=0, second=0, microsecond=0))
+    return [
+        {'timestamp': hour.isoformat(),
+         **{name: sum(values) / len(values) if values else None for name, values in data.items()}}
+        for hour, data in sorted(groups.items())
+    ]
+
+def orm_daily_min_max(SensorReading, days):
+    end_time = datetime.utcnow()
+    start_time = end_time - timedelta(days=days)
+    readings = SensorReading.query.filter(SensorReading.timestamp.between(start_time, end_time)).all()
+    groups = _orm_group(readings, lambda ts: ts.date())
+    return [
+        {'date': day.isoformat(),
+         **{name: {'min': min(values) if values else None,
+                   'max': max(values) if values else None,
+                   'avg': sum(values) / len(values) if values else None}
+            for name, values in data.items()}}
+        for day, data in sorted(groups.items())
+    ]
+
+def measure(func, repeat):
+    """Return (mean seconds per call, KiB allocated per call, peak KiB)"""
+    func()  # warm up caches and compiled statements
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - started) / repeat
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, (current - before) / 1024, (peak - before) / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=7, help='days of 30 s readings to seed')
+    parser.add_argument('--repeat', type=int, default=20, help='timed calls per query')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='growbox-bench-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    from app import create_app
+    app = create_app({'GROWBOX_HARDWARE': False, 'GROWBOX_MQTT': False, 'GROWBOX_AUTOMATION': False})
+    from models import SensorReading
+    from simulation import generate_history
+    from data_import import import_readings
+    import sensor_data
+
+    steps = args.days * 2880
+    with app.app_context():
+        history = generate_history(time.time() - steps * 30, steps, step_seconds=30, seed=1)
+        records = (
+            {'timestamp': history['timestamp'][i],
+             **{name: float(history[name][i][0]) for name in sensor_data.METRICS}}
+            for i in range(steps)
+        )
+        stats = import_readings(records)
+        print(f"Seeded {stats['rows']} readings ({stats['rows_per_second']} rows/s)\n")
+
+        hours = args.days * 24
+        cases = [
+            ('latest reading', lambda: orm_latest_reading(SensorReading), sensor_data.get_latest_reading),
+            (f'time range ({hours}h)', lambda: orm_readings_time_range(SensorReading, hours),
+             lambda: sensor_data.get_readings_time_range(hours)),
+            (f'hourly average ({hours}h)', lambda: orm_hourly_average(SensorReading, hours),
+             lambda: sensor_data.get_hourly_average(hours)),
+            (f'daily min/max ({args.days}d)', lambda: orm_daily_min_max(SensorReading, args.days),
+             lambda: sensor_data.get_daily_min_max(args.days)),
+        ]
+
+        print(f"{'query':<24}{'impl':<6}{'ms/call':>10}{'KiB alloc':>12}{'KiB peak':>12}")
+        for name, before, after in cases:
+            for label, func in (('orm', before), ('core', after)):
+                seconds, allocated, peak = measure(func, args.repeat)
+                print(f"{name:<24}{label:<6}{seconds * 1000:>10.2f}{allocated:>12.1f}{peak:>12.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+import os
+import logging
+import time
+import threading
+from sqlalchemy import insert, select, delete
+from models import db, Device, Metric, MetricSample, EdgeAggregate
+from processing import process_value, QUALITY_AGGREGATED
+from alerts import get_alert_engine
+from rollups import rebuild_rollups
+from derived_metrics import get_derived_metrics, store_derived
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Channel readings are buffered and written in batches: at most every
+# CHANNEL_FLUSH_INTERVAL seconds, or as soon as CHANNEL_BATCH_SIZE are waiting
+CHANNEL_FLUSH_INTERVAL = float(os.environ.get("CHANNEL_FLUSH_INTERVAL", 1.0))
+CHANNEL_BATCH_SIZE = int(os.environ.get("CHANNEL_BATCH_SIZE", 500))
+# Readings kept for the next attempt while the database is unavailable
+CHANNEL_MAX_PENDING = int(os.environ.get("CHANNEL_MAX_PENDING", 100000))
+
+pending_readings = []
+pending_condition = threading.Condition()
+writer_thread = None
+
+# Small integer ids of devices and metrics by name
+device_ids = {}
+metric_ids = {}
+
+def add_channel_reading(device, channel, ts, value, quality=0):
+    """Queue a channel reading (ts in epoch milliseconds) for the next batch insert"""
+    with pending_condition:
+        pending_readings.append((device, channel, ts, value, quality))
+        if len(pending_readings) >= CHANNEL_BATCH_SIZE:
+            pending_condition.notify()
+
+def process_channel_message(device, channel, payload):
+    """Process and queue a reading received on opengrow/sensors/channels/<device>/<channel>"""
+    value = payload.get('value')
+    if value is None:
+        return False
+    ts = payload.get('ts')
+    ts = float(ts) if ts is not None else time.time()
+    value, quality = process_value(device, channel, value, bool(payload.get('substituted')))
+    add_channel_reading(device, channel, int(ts * 1000), value, quality)
+    get_alert_engine().on_sample(device, channel, ts, value, quality)
+    store_derived(device, get_derived_metrics().on_sample(device, channel, ts, value, quality))
+    return True
+
+def process_aggregate_message(device, payload):
+    """
+    Store the window aggregates received on opengrow/sensors/aggregates/<device>
+    from a Sensor Pi in edge mode. The window mean is also queued as a
+    QUALITY_AGGREGATED sample so the series endpoints show the channel.
+    """
+    # Import here to avoid circular imports
+    from hardware import app_context
+    
+    start, interval = int(payload['start']), int(payload['interval'])
+    channels = payload.get('channels') or {}
+    try:
+        with app_context():
+            for channel, stats in channels.items():
+                count, mean, stddev = int(stats['count']), float(stats['mean']), float(stats.get('stddev', 0.0))
+                db.session.merge(EdgeAggregate(
+                    metric_id=resolve_id(Metric, metric_ids, channel),
+                    device_id=resolve_id(Device, device_ids, device),
+                    start=start, interval=interval, count=count, sum=mean * count,
+                    sumsq=count * (stddev * stddev + mean * mean),
+                    min=float(stats['min']), max=float(stats['max'])
+                ))
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"Error saving edge aggregates of {device}: {e}")
+        # Ids created in the failed transaction were rolled back
+        device_ids.clear()
+        metric_ids.clear()
+        return False
+    
+    # The writer's flush rebuilds the rollups of the window
+    for channel, stats in channels.items():
+        mean = float(stats['mean'])
+        add_channel_reading(device, channel, start, mean, QUALITY_AGGREGATED)
+        get_alert_engine().on_sample(device, channel, start / 1000, mean)
+        store_derived(device, get_derived_metrics().on_sample(device, channel, start / 1000, mean))
+    return True
+
+def store_backfill(device, payload):
+    """
+    Store one part of the raw samples a Sensor Pi sent for a backfill
+    request. The window means of the requested range are replaced by the
+    raw samples, and the rollups recomputed from them.
+    """
+    # Import here to avoid circular imports
+    from hardware import app_context
+    
+    start, end = int(payload['start']), int(payload['end'])
+    samples = payload.get('samples') or []
+    try:
+        with app_context():
+            device_id = resolve_id(Device, device_ids, device)
+            if payload.get('part', 0) == 0:
+                statement = delete(MetricSample).where(
+                    MetricSample.device_id == device_id,
+                    MetricSample.ts >= start, MetricSample.ts < end,
+                    MetricSample.quality.op('&')(QUALITY_AGGREGATED) != 0
+                )
+                if payload.get('channels'):
+                    statement = statement.where(MetricSample.metric_id.in_(
+                        [resolve_id(Metric, metric_ids, channel) for channel in payload['channels']]
+                    ))
+                db.session.execute(statement)
+            if samples:
+                insert_samples([
+                    {'metric_id': resolve_id(Metric, metric_ids, channel), 'device_id': device_id,
+                     'ts': int(ts), 'value': value, 'quality': 0}
+                    for channel, ts, value in samples
+                ])
+            if payload.get('part', 0) == 0 or samples:
+                channels = payload.get('channels') or [None]
+                rebuild_rollups(start, end - 1, [(device, channel) for channel in channels])
+            db.session.commit()
+        logger.info(f"Stored {len(samples)} backfilled samples of {device} (request {payload.get('id')})")
+        return len(samples)
+    except Exception as e:
+        logger.error(f"Error saving backfilled samples of {device}: {e}")
+        # Ids created in the failed transaction were rolled back
+        device_ids.clear()
+        metric_ids.clear()
+        return 0
+
+def resolve_id(model, cache, name):
+    """Id of the device or metric with this name, creating it on first use"""
+    if name not in cache:
+        row_id = db.session.execute(select(model.id).where(model.name == name)).scalar()
+        if row_id is None:
+            row = model(name=name)
+            db.session.add(row)
+            db.session.flush()
+            row_id = row.id
+        cache[name] = row_id
+    return cache[name]
+
+def insert_samples(rows):
+    """Insert metric sample dicts, skipping duplicates of (metric, device, ts)"""
+    statement = insert(MetricSample)
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        statement = statement.prefix_with('OR IGNORE')
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        statement = pg_insert(MetricSample).on_conflict_do_nothing()
+    db.session.execute(statement, rows)
+
+def flush_channel_readings():
+    """
+    Write all queued channel readings in one transaction, then update the
+    rollups of the series and minutes they cover in a second one.
+
+    Readings that could not be written are queued again for the next
+    flush (up to CHANNEL_MAX_PENDING); returns None in that case, else the
+    number of readings written.
+    """
+    global pending_readings
+    
+    with pending_condition:
+        rows, pending_readings = pending_readings, []
+    if not rows:
+        return 0
+    
+    # Import here to avoid circular imports
+    from hardware import app_context
+    from rollups import update_rollups
+    
+    try:
+        with app_context():
+            insert_samples([
+                {'metric_id': resolve_id(Metric, metric_ids, channel),
+                 'device_id': resolve_id(Device, device_ids, device),
+                 'ts': ts, 'value': value, 'quality': quality}
+                for device, channel, ts, value, quality in rows
+            ])
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"Error saving channel readings to database, keeping them for the next attempt: {e}")
+        db.session.rollback()
+        # Ids created in the failed transaction were rolled back
+        device_ids.clear()
+        metric_ids.clear()
+        with pending_condition:
+            pending_readings = rows + pending_readings
+            if len(pending_readings) > CHANNEL_MAX_PENDING:
+                logger.warning(f"Dropping {len(pending_readings) - CHANNEL_MAX_PENDING} oldest channel readings")
+                pending_readings = pending_readings[-CHANNEL_MAX_PENDING:]
+        return None
+    
+    with app_context():
+        update_rollups(min(row[2] for row in rows), max(row[2] for row in rows),
+                       {(device, channel) for device, channel, _, _, _ in rows})
+    logger.debug(f"Stored {len(rows)} channel readings")
+    return len(rows)
+
+def channel_writer_loop():
+    """Thread function flushing the channel reading buffer"""
+    while True:
+        with pending_condition:
+            if len(pending_readings) < CHANNEL_BATCH_SIZE:
+                pending_condition.wait(CHANNEL_FLUSH_INTERVAL)
+        if flush_channel_readings() is None:
+            # Give the database time to come back before retrying
+            time.sleep(CHANNEL_FLUSH_INTERVAL)
+
+def start_channel_writer():
+    """Start the channel writer thread if it is not running"""
+    global writer_thread
+    if writer_thread is None or not writer_thread.is_alive():
+        writer_thread = threading.Thread(target=channel_writer_loop, daemon=True)
+        writer_thread.start()
@@ -0,0 +1,150 @@
+"""
+Control rules pushed to the Sensor Pi, and control scenes.
+
+The automation settings are compiled into a rule set and published as a
+retained message, so a Sensor Pi receives the current rules whenever it
+connects and evaluates them locally (see edge_control.py). The decisions it
+takes are reported back and stored in the control_decisions table.
+
+Scenes are named sets of actuator states (e.g. "night") applied together
+through /api/controls/scenes/<name>. They come from SCENES_CONFIG (JSON
+object, default scenes.json) or DEFAULT_SCENES. A scene holds its
+actuators for SCENE_HOLD seconds: the automation rules and the Sensor Pi's
+local rules do not switch them back before the hold ends.
+"""
+
+import os
+import json
+import zlib
+import logging
+from datetime import datetime
+from sqlalchemy import select
+from models import db, ControlDecision
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+ACTUATORS = ('fan', 'light', 'water_pump')
+
+SCENES_CONFIG = os.environ.get(
+    "SCENES_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenes.json")
+)
+
+# Seconds the rules leave the actuators of an applied scene alone
+SCENE_HOLD = float(os.environ.get("SCENE_HOLD", 3600))
+
+DEFAULT_SCENES = {
+    'day': {'light': True},
+    'night': {'light': False, 'water_pump': False},
+    'flush': {'water_pump': True, 'fan': True},
+    'off': {'fan': False, 'light': False, 'water_pump': False}
+}
+
+def compile_rules(settings=None):
+    """Rule set for the Sensor Pi from the automation settings"""
+    from data_storage import DEFAULT_SETTINGS, FAN_HYSTERESIS, get_all_settings
+
+    settings = {**DEFAULT_SETTINGS, **(settings if settings is not None else get_all_settings())}
+    temp_max = float(settings['temperature_max'])
+    rules = {
+        'timezone': settings['timezone'],
+        'fan': {
+            'auto': settings['fan_auto'] == 'true',
+            'metric': 'temperature',
+            'on_above': temp_max,
+            'off_below': temp_max - FAN_HYSTERESIS
+        },
+        'light': {
+            'auto': settings['light_auto'] == 'true',
+            'start_hour': int(settings['light_hours_start']),
+            'end_hour': int(settings['light_hours_end'])
+        },
+        'water_pump': {
+            'auto': settings['water_auto'] == 'true',
+            'schedule': settings['water_schedule'],
+            'hour': int(settings['water_time']),
+            'duration': int(settings['water_duration'])
+        }
+    }
+    rules['version'] = f"{zlib.crc32(json.dumps(rules, sort_keys=True).encode()):08x}"
+    return rules
+
+def publish_rules():
+    """Publish the compiled rule set as a retained message; returns its version or None"""
+    try:
+        from mqtt_client import TOPIC_CONTROL_RULES, command_channel_available, publish_message
+    except ImportError:
+        return None
+
+    if not command_channel_available():
+        logger.debug("Not publishing control rules - not connected to MQTT broker")
+        return None
+    try:
+        rules = compile_rules()
+    except (KeyError, ValueError) as e:
+        logger.error(f"Error compiling control rules: {e}")
+        return None
+    if not publish_message(TOPIC_CONTROL_RULES, rules, qos=1, retain=True):
+        return None
+    logger.info(f"Published control rules {rules['version']}")
+    return rules['version']
+
+def store_decisions(payload):
+    """Store the decisions reported by a Sensor Pi"""
+    try:
+        timestamp = datetime.fromisoformat(payload['timestamp']) if payload.get('timestamp') else datetime.now()
+        for decision in payload.get('decisions') or []:
+            db.session.add(ControlDecision(
+                timestamp=timestamp,
+                device=payload.get('device') or 'unknown',
+                actuator=decision['actuator'],
+                state=bool(decision['state']),
+                reason=str(decision.get('reason') or '')[:255],
+                value=decision.get('value'),
+                rules_version=payload.get('rules_version')
+            ))
+        db.session.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Error storing control decisions: {e}")
+        db.session.rollback()
+        return False
+
+def get_decisions(limit=50, device=None):
+    """The most recent control decisions, newest first"""
+    try:
+        query = select(ControlDecision).order_by(ControlDecision.id.desc()).limit(limit)
+        if device:
+            query = query.where(ControlDecision.device == device)
+        return [decision.to_dict() for decision in db.session.execute(query).scalars()]
+    except Exception as e:
+        logger.error(f"Error retrieving control decisions: {e}")
+        return []
+
+def load_scenes(path=SCENES_CONFIG):
+    """Scenes from the scenes file, falling back to DEFAULT_SCENES"""
+    if not os.path.exists(path):
+        return DEFAULT_SCENES
+    try:
+        with open(path) as f:
+            loaded = json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading scenes {path}: {e}")
+        return DEFAULT_SCENES
+    
+    valid = {}
+    for name, states in loaded.items():
+        if not isinstance(states, dict) or not states or any(actuator not in ACTUATORS for actuator in states):
+            logger.error(f"Ignoring scene '{name}': states must map {', '.join(ACTUATORS)} to true/false")
+            continue
+        valid[name] = {actuator: bool(state) for actuator, state in states.items()}
+    return valid
+
+scenes = None
+
+def get_scenes():
+    """The configured scenes, loaded on first use"""
+    global scenes
+    if scenes is None:
+        scenes = load_scenes()
+    return scenes
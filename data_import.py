@@ -0,0 +1,257 @@
+import io
+import csv
+import json
+import math
+import time
+import logging
+from datetime import datetime, timezone
+from itertools import islice
+
+import click
+from models import db, SensorReading
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Columns loaded into sensor_readings, in COPY/insert order
+IMPORT_COLUMNS = ('timestamp', 'temperature', 'humidity', 'light_level', 'soil_moisture')
+REQUIRED_COLUMNS = ('timestamp', 'temperature', 'humidity', 'light_level')
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# Plausible ranges; rows outside them are rejected rather than stored
+VALUE_RANGES = {
+    'temperature': (-40.0, 80.0),
+    'humidity': (0.0, 100.0),
+    'light_level': (0.0, 200000.0),
+    'soil_moisture': (0.0, 100.0),
+}
+
+SUPPORTED_FORMATS = ('csv', 'ndjson', 'parquet')
+
+def detect_format(filename):
+    """Guess the input format from a file name"""
+    name = filename.lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    if name.endswith(('.parquet', '.pq')):
+        return 'parquet'
+    return None
+
+def iter_csv(stream):
+    """Stream records from a CSV text stream with a header row"""
+    yield from csv.DictReader(stream)
+
+def iter_ndjson(stream):
+    """
+    Stream the lines of a newline-delimited JSON text stream.
+
+    Lines are decoded by convert_record(), so a malformed line is rejected
+    like any other invalid record instead of aborting the import.
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+def iter_parquet(path, batch_size=DEFAULT_CHUNK_SIZE):
+    """Stream records from a Parquet file in row batches (requires pyarrow)"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet import requires the pyarrow package")
+
+    parquet_file = pq.ParquetFile(path)
+    columns = [c for c in IMPORT_COLUMNS if c in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield from batch.to_pylist()
+
+def open_records(path, fmt=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Return an iterator of raw records for a file path; Parquet is read in batches of chunk_size rows"""
+    fmt = fmt or detect_format(path)
+    if fmt == 'parquet':
+        return iter_parquet(path, chunk_size)
+
+    stream = open(path, newline='', encoding='utf-8')
+    if fmt == 'csv':
+        return _closing(iter_csv(stream), stream)
+    if fmt == 'ndjson':
+        return _closing(iter_ndjson(stream), stream)
+    stream.close()
+    raise ValueError(f"Unsupported import format: {fmt}")
+
+def _closing(records, stream):
+    try:
+        yield from records
+    finally:
+        stream.close()
+
+def parse_timestamp(value):
+    """Convert an ISO string, epoch seconds/milliseconds or datetime to naive UTC"""
+    if isinstance(value, datetime):
+        timestamp = value
+    elif isinstance(value, (int, float)):
+        timestamp = _from_epoch(value)
+    elif isinstance(value, str):
+        value = value.strip()
+        try:
+            timestamp = _from_epoch(float(value))
+        except ValueError:
+            timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    else:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def _from_epoch(value):
+    # Values past the year 5138 in seconds are taken to be milliseconds
+    if value > 1e11:
+        value = value / 1000.0
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+
+def _parse_value(name, value):
+    if value is None or value == '':
+        if name in REQUIRED_COLUMNS:
+            raise ValueError(f"Missing {name}")
+        return None
+
+    number = float(value)
+    low, high = VALUE_RANGES[name]
+    if not math.isfinite(number) or not low <= number <= high:
+        raise ValueError(f"{name} out of range: {number}")
+    return number
+
+def convert_record(record):
+    """Validate a raw record (a mapping or an NDJSON line) and convert it to an IMPORT_COLUMNS tuple"""
+    if isinstance(record, str):
+        record = json.loads(record)
+    if not isinstance(record, dict):
+        raise ValueError(f"Expected a JSON object, got {type(record).__name__}")
+    if record.get('timestamp') in (None, ''):
+        raise ValueError("Missing timestamp")
+
+    return (parse_timestamp(record['timestamp']),) + tuple(
+        _parse_value(name, record.get(name)) for name in IMPORT_COLUMNS[1:]
+    )
+
+def iter_chunks(records, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """Validate records and group the valid rows into lists of chunk_size"""
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, got {chunk_size}")
+    records = iter(records)
+    while True:
+        raw = list(islice(records, chunk_size))
+        if not raw:
+            return
+
+        rows = []
+        for record in raw:
+            try:
+                rows.append(convert_record(record))
+            except (ValueError, TypeError, KeyError) as e:
+                if stats is not None:
+                    stats['rejected'] += 1
+                    if stats['rejected'] <= 10:
+                        logger.warning(f"Rejected import row {record!r}: {e}")
+        if rows:
+            yield rows
+
+def _copy_chunk(cursor, rows):
+    """Load one chunk into PostgreSQL with COPY"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow((row[0].isoformat(' '),) + row[1:])
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {SensorReading.__tablename__} ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+def _load_postgresql(engine, chunks, stats):
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for rows in chunks:
+            _copy_chunk(cursor, rows)
+            _track_chunk(stats, rows)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+def _load_executemany(engine, chunks, stats):
+    table = SensorReading.__table__
+    with engine.begin() as connection:
+        for rows in chunks:
+            connection.execute(table.insert(), [dict(zip(IMPORT_COLUMNS, row)) for row in rows])
+            _track_chunk(stats, rows)
+
+def _track_chunk(stats, rows):
+    timestamps = [row[0] for row in rows]
+    stats['rows'] += len(rows)
+    stats['start'] = min(stats['start'] or timestamps[0], min(timestamps))
+    stats['end'] = max(stats['end'] or timestamps[0], max(timestamps))
+    logger.debug(f"Imported {stats['rows']} sensor readings so far")
+
+def import_readings(records, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Bulk load sensor readings from an iterable of raw records.
+
+    Rows are validated in chunks and written in a single transaction, using
+    COPY on PostgreSQL and batched executemany elsewhere, then the rollups
+    of the imported time range are recomputed. Returns a summary
+    with the number of rows loaded and rejected, the covered time range and
+    the throughput.
+    """
+    stats = {'rows': 0, 'rejected': 0, 'start': None, 'end': None}
+    started = time.perf_counter()
+
+    engine = db.engine
+    chunks = iter_chunks(records, chunk_size, stats)
+    if engine.dialect.name == 'postgresql':
+        _load_postgresql(engine, chunks, stats)
+    else:
+        _load_executemany(engine, chunks, stats)
+
+    # Recompute the aggregation rollups of the imported time range
+    if stats['rows']:
+        from rollups import update_rollups
+        from sensor_data import LEGACY_DEVICE, to_epoch_ms
+        update_rollups(to_epoch_ms(stats['start']), to_epoch_ms(stats['end']),
+                       [(LEGACY_DEVICE, metric) for metric in IMPORT_COLUMNS[1:]])
+
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = round(elapsed, 3)
+    stats['rows_per_second'] = round(stats['rows'] / elapsed, 1) if elapsed > 0 else None
+    stats['start'] = stats['start'].isoformat() if stats['start'] else None
+    stats['end'] = stats['end'].isoformat() if stats['end'] else None
+
+    logger.info(f"Imported {stats['rows']} sensor readings ({stats['rejected']} rejected) "
+                f"in {stats['seconds']}s, {stats['rows_per_second']} rows/s")
+    return stats
+
+def register_cli_commands(app):
+    """Register data import commands with the Flask CLI"""
+
+    @app.cli.command('import-readings')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(SUPPORTED_FORMATS),
+                  help='Input format (detected from the file extension by default)')
+    @click.option('--chunk-size', type=click.IntRange(min=1), default=DEFAULT_CHUNK_SIZE, show_default=True,
+                  help='Rows validated and written per batch')
+    def import_readings_command(path, fmt, chunk_size):
+        """Bulk import sensor readings from a CSV, NDJSON or Parquet file"""
+        fmt = fmt or detect_format(path)
+        if fmt is None:
+            raise click.UsageError("Cannot detect the input format, use --format")
+
+        stats = import_readings(open_records(path, fmt, chunk_size), chunk_size)
+        click.echo(f"Imported {stats['rows']} rows ({stats['rejected']} rejected) "
+                   f"in {stats['seconds']}s - {stats['rows_per_second']} rows/s")
@@ -1,9 +1,10 @@
 import os
 import json
+import zlib
 import logging
 from datetime import datetime
-from models import Settings
-from app import db
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from models import db, Settings
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -21,9 +22,16 @@ DEFAULT_SETTINGS = {
     'water_duration': '30',    # seconds
     'fan_auto': 'true',        # true/false
     'light_auto': 'true',      # true/false
-    'water_auto': 'true'       # true/false
+    'water_auto': 'true',      # true/false
+    'timezone': ''             # IANA name, empty = server local time
 }
 
+# Degrees below temperature_max at which the fan is switched off again
+FAN_HYSTERESIS = 2.0
+# Seconds after which the latest stored reading is too old to control by; the
+# Sensor Pi reports by exception but at least every PUBLISH_MAX_SILENCE (300)
+AUTOMATION_MAX_AGE = float(os.environ.get("AUTOMATION_MAX_AGE", 600))
+
 def initialize_settings():
     """Initialize settings with default values if they don't exist"""
     try:
@@ -52,6 +60,15 @@ def get_all_settings():
         logger.error(f"Error retrieving settings: {e}")
         return DEFAULT_SETTINGS
 
+def get_settings_version():
+    """Return a checksum of all settings, used to version cached responses"""
+    try:
+        rows = db.session.query(Settings.name, Settings.value).order_by(Settings.name).all()
+        return zlib.crc32(repr([tuple(row) for row in rows]).encode())
+    except Exception as e:
+        logger.error(f"Error retrieving settings version: {e}")
+        return None
+
 def get_setting(name, default=None):
     """Get a specific setting by name"""
     try:
@@ -97,18 +114,37 @@ def import_settings(settings_json):
         logger.error(f"Error importing settings: {e}")
         return False
 
+def get_timezone(name=None):
+    """Time zone of the grow box from the timezone setting; None means the server's local time"""
+    name = get_setting('timezone', '') if name is None else name
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.error(f"Unknown time zone '{name}', using the server's local time")
+        return None
+
+def local_now():
+    """Current time in the grow box's time zone"""
+    return datetime.now(get_timezone())
+
 def should_fan_be_on():
-    """Determine if fan should be on based on settings and current conditions"""
-    from hardware import get_current_sensor_data
+    """Determine if fan should be on based on settings and the latest stored reading"""
+    from sensor_data import get_latest_reading
     
     # If auto control is disabled, don't change state
     if get_setting('fan_auto', 'true') != 'true':
         return None
     
-    # Get current sensor data
-    sensor_data = get_current_sensor_data()
+    # Use the processed reading the dashboard shows, not a fresh sensor read
+    sensor_data = get_latest_reading()
     if not sensor_data:
         return None
+    age = (datetime.utcnow() - datetime.fromisoformat(sensor_data['timestamp'])).total_seconds()
+    if age > AUTOMATION_MAX_AGE:
+        logger.debug(f"Latest sensor reading is {age:.0f} s old, leaving the fan as it is")
+        return None
     
     # Get temperature thresholds
     temp_max = float(get_setting('temperature_max', '30.0'))
@@ -117,8 +153,8 @@ def should_fan_be_on():
     if sensor_data['temperature'] > temp_max:
         return True
     
-    # If temperature is more than 2 degrees below max, turn off fan
-    if sensor_data['temperature'] < (temp_max - 2.0):
+    # If temperature is more than FAN_HYSTERESIS degrees below max, turn off fan
+    if sensor_data['temperature'] < (temp_max - FAN_HYSTERESIS):
         return False
     
     # Otherwise maintain current state
@@ -134,8 +170,8 @@ def should_light_be_on():
     light_start = int(get_setting('light_hours_start', '6'))
     light_end = int(get_setting('light_hours_end', '18'))
     
-    # Get current hour
-    current_hour = datetime.now().hour
+    # Get current hour in the grow box's time zone
+    current_hour = local_now().hour
     
     # Check if current hour is within light hours
     if light_start <= current_hour < light_end:
@@ -156,8 +192,8 @@ def should_water_pump_be_on():
     if schedule == 'off':
         return False
     
-    # Get current time
-    now = datetime.now()
+    # Get current time in the grow box's time zone
+    now = local_now()
     water_time = int(get_setting('water_time', '8'))
     water_duration = int(get_setting('water_duration', '30'))
     
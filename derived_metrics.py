@@ -0,0 +1,362 @@
+"""
+Horticulture metrics derived from the measured ones at ingest.
+
+- vpd: vapour pressure deficit in kPa, from temperature (°C) and relative
+  humidity (%) with the Tetens saturation vapour pressure
+- dew_point: dew point in °C (Magnus formula)
+- dli: daily light integral in mol/m²/day accumulated since the start of
+  the current photoperiod, from light_level (lux converted to PPFD with
+  LUX_TO_PPFD)
+
+DerivedMetrics keeps a constant amount of state per device and channel
+prefix ("dht_top.temperature" derives "dht_top.vpd"): the last unpaired
+temperature or humidity sample and a running DLI total, so every update is
+O(1). Derived samples are stored as channels of the device in
+metric_samples and evaluated by the alert engine like measured ones, so
+the metric, aggregation and alert APIs serve them unchanged. Substituted
+inputs are skipped; other input quality flags are carried over.
+
+derive_history() computes the same series over stored history (vectorized
+when NumPy is installed) for `flask backfill-derived`.
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+import click
+from datetime import datetime, timedelta
+from sqlalchemy import select
+
+from models import db, Device, Metric
+from processing import QUALITY_SUBSTITUTED
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+LUX_TO_PPFD = float(os.environ.get("LUX_TO_PPFD", 0.0185))  # µmol/m²/s per lux (sunlight; LEDs ~0.015)
+DERIVED_MAX_AGE = float(os.environ.get("DERIVED_MAX_AGE", 120))  # seconds between paired temperature and humidity
+DLI_MAX_GAP = float(os.environ.get("DLI_MAX_GAP", 600))  # seconds; longer light gaps are not integrated
+DERIVED_SETTINGS_REFRESH = 60  # seconds
+
+# Magnus coefficients for the dew point over water
+MAGNUS_A = 17.62
+MAGNUS_B = 243.12
+
+def saturation_vapour_pressure(temperature):
+    """Saturation vapour pressure in kPa at a temperature in °C (Tetens)"""
+    return 0.6108 * math.exp(17.27 * temperature / (temperature + 237.3))
+
+def vapour_pressure_deficit(temperature, humidity):
+    """Vapour pressure deficit in kPa"""
+    return saturation_vapour_pressure(temperature) * (1.0 - humidity / 100.0)
+
+def dew_point(temperature, humidity):
+    """Dew point in °C"""
+    gamma = math.log(max(humidity, 0.1) / 100.0) + MAGNUS_A * temperature / (MAGNUS_B + temperature)
+    return MAGNUS_B * gamma / (MAGNUS_A - gamma)
+
+def _split_channel(channel):
+    """('dht_top.', 'temperature') for 'dht_top.temperature', ('', 'temperature') for 'temperature'"""
+    prefix, _, measurement = channel.rpartition('.')
+    return (prefix + '.' if prefix else ''), measurement
+
+def photoperiod_start(ts, light_start, tz):
+    """Start (epoch seconds) of the photoperiod holding ts; photoperiods begin at light_start local hour"""
+    local = datetime.fromtimestamp(ts, tz) - timedelta(hours=light_start)
+    day = datetime(local.year, local.month, local.day, tzinfo=tz)
+    return (day + timedelta(hours=light_start)).timestamp()
+
+class DerivedMetrics:
+    """Incremental VPD, dew point and DLI per device"""
+
+    def __init__(self):
+        # (device, prefix) -> {'temperature' or 'humidity': (ts, value, quality)} not yet paired
+        self.unpaired = {}
+        # (device, prefix) -> [photoperiod start, last ts, last PPFD, total mol/m²]
+        self.dli = {}
+        # (device, channel) pairs that arrive as channel messages
+        self.channels = set()
+        self.lock = threading.Lock()
+        self.light_start = 6.0
+        self.tz = None
+        self.settings_loaded = 0.0
+
+    def _refresh_settings(self):
+        """Photoperiod start and time zone, re-read every DERIVED_SETTINGS_REFRESH seconds"""
+        now = time.monotonic()
+        if now - self.settings_loaded > DERIVED_SETTINGS_REFRESH:
+            self.settings_loaded = now
+            try:
+                from data_storage import get_all_settings, get_timezone
+                from hardware import app_context
+                with app_context():
+                    settings = get_all_settings()
+                self.light_start = float(settings.get('light_hours_start', 6))
+                self.tz = get_timezone(settings.get('timezone', ''))
+            except Exception as e:
+                logger.error(f"Error loading settings for derived metrics: {e}")
+
+    def _pair(self, device, prefix, measurement, ts, value, quality):
+        """Pair a temperature or humidity sample with the other one; returns derived samples"""
+        key = (device, prefix)
+        other_name = 'humidity' if measurement == 'temperature' else 'temperature'
+        state = self.unpaired.setdefault(key, {})
+        other = state.get(other_name)
+        if other is None or abs(ts - other[0]) > DERIVED_MAX_AGE:
+            state[measurement] = (ts, value, quality)
+            return []
+
+        # Each sample is used in one pair only
+        del state[other_name]
+        state.pop(measurement, None)
+        temperature, humidity = (value, other[1]) if measurement == 'temperature' else (other[1], value)
+        ts, quality = max(ts, other[0]), quality | other[2]
+        return [
+            (prefix + 'vpd', ts, round(vapour_pressure_deficit(temperature, humidity), 3), quality),
+            (prefix + 'dew_point', ts, round(dew_point(temperature, humidity), 2), quality),
+        ]
+
+    def _integrate(self, device, prefix, ts, value, quality):
+        """Add a light sample to the running DLI of its photoperiod"""
+        self._refresh_settings()
+        period = photoperiod_start(ts, self.light_start, self.tz)
+        ppfd = max(value, 0.0) * LUX_TO_PPFD
+        state = self.dli.get((device, prefix))
+        if state is None or state[0] != period:
+            state = self.dli[(device, prefix)] = [period, None, None, 0.0]
+        elif ts <= state[1]:
+            return []
+        elif ts - state[1] <= DLI_MAX_GAP:
+            state[3] += (ppfd + state[2]) / 2.0 * (ts - state[1]) / 1e6
+        state[1], state[2] = ts, ppfd
+        return [(prefix + 'dli', ts, round(state[3], 4), quality)]
+
+    def _derive(self, device, channel, ts, value, quality):
+        if value is None or quality & QUALITY_SUBSTITUTED:
+            return []
+        prefix, measurement = _split_channel(channel)
+        with self.lock:
+            if measurement in ('temperature', 'humidity'):
+                return self._pair(device, prefix, measurement, ts, value, quality)
+            if measurement == 'light_level':
+                return self._integrate(device, prefix, ts, value, quality)
+        return []
+
+    def on_sample(self, device, channel, ts, value, quality=0):
+        """
+        Derived samples for one processed channel sample (ts in epoch
+        seconds), as (channel, ts, value, quality) tuples
+        """
+        self.channels.add((device, channel))
+        return self._derive(device, channel, ts, value, quality)
+
+    def on_reading(self, device, ts, values, flags):
+        """
+        Derived samples for a combined reading of the four wide metrics; the
+        metrics a device also sends as channels are derived from those only
+        """
+        derived = []
+        for metric in ('temperature', 'humidity', 'light_level'):
+            if (device, metric) not in self.channels:
+                derived += self._derive(device, metric, ts, values.get(metric), flags.get(metric, 0))
+        return derived
+
+derived_metrics = None
+
+def get_derived_metrics():
+    """The process-wide derived metrics stage, created on first use"""
+    global derived_metrics
+    if derived_metrics is None:
+        derived_metrics = DerivedMetrics()
+    return derived_metrics
+
+def store_derived(device, derived):
+    """Queue derived samples for the channel writer and evaluate alert rules on them"""
+    # Import here to avoid circular imports
+    from channel_store import add_channel_reading
+    from alerts import get_alert_engine
+
+    engine = get_alert_engine()
+    for channel, ts, value, quality in derived:
+        add_channel_reading(device, channel, int(ts * 1000), value, quality)
+        engine.on_sample(device, channel, ts, value, quality)
+
+def _nearest(base_ts, other_ts):
+    """Index of the nearest other_ts for each base_ts (both sorted)"""
+    if np is not None:
+        right = np.clip(np.searchsorted(other_ts, base_ts), 1, len(other_ts) - 1)
+        left = right - 1
+        return np.where(np.abs(other_ts[left] - base_ts) <= np.abs(other_ts[right] - base_ts), left, right)
+    import bisect
+    result = []
+    for ts in base_ts:
+        right = min(max(bisect.bisect_left(other_ts, ts), 1), len(other_ts) - 1)
+        result.append(right - 1 if abs(other_ts[right - 1] - ts) <= abs(other_ts[right] - ts) else right)
+    return result
+
+def derive_vpd_series(temperature, humidity):
+    """
+    VPD and dew point series from temperature and humidity series (dicts of
+    'timestamp' in ms, 'value', 'quality'); each sample of the sparser series
+    is paired with the nearest sample of the other within DERIVED_MAX_AGE
+    """
+    if not temperature['timestamp'] or not humidity['timestamp']:
+        return {'timestamp': [], 'vpd': [], 'dew_point': [], 'quality': []}
+    base, other = ((temperature, humidity) if len(temperature['timestamp']) <= len(humidity['timestamp'])
+                   else (humidity, temperature))
+    max_age_ms = DERIVED_MAX_AGE * 1000
+
+    if np is not None:
+        base_ts = np.asarray(base['timestamp'], dtype=np.int64)
+        other_ts = np.asarray(other['timestamp'], dtype=np.int64)
+        index = _nearest(base_ts, other_ts) if len(other_ts) > 1 else np.zeros(len(base_ts), dtype=np.int64)
+        paired = np.abs(other_ts[index] - base_ts) <= max_age_ms
+        base_values = np.asarray(base['value'], dtype=np.float64)
+        other_values = np.asarray(other['value'], dtype=np.float64)[index]
+        t, rh = (base_values, other_values) if base is temperature else (other_values, base_values)
+        quality = np.asarray(base['quality'], dtype=np.int64) | np.asarray(other['quality'], dtype=np.int64)[index]
+        paired &= (quality & QUALITY_SUBSTITUTED) == 0
+        t, rh, quality = t[paired], rh[paired], quality[paired]
+        ts = np.maximum(base_ts, other_ts[index])[paired]
+        vpd = 0.6108 * np.exp(17.27 * t / (t + 237.3)) * (1.0 - rh / 100.0)
+        gamma = np.log(np.maximum(rh, 0.1) / 100.0) + MAGNUS_A * t / (MAGNUS_B + t)
+        dew = MAGNUS_B * gamma / (MAGNUS_A - gamma)
+        return {'timestamp': ts.tolist(), 'vpd': np.round(vpd, 3).tolist(),
+                'dew_point': np.round(dew, 2).tolist(), 'quality': quality.tolist()}
+
+    index = _nearest(base['timestamp'], other['timestamp']) if len(other['timestamp']) > 1 \
+        else [0] * len(base['timestamp'])
+    result = {'timestamp': [], 'vpd': [], 'dew_point': [], 'quality': []}
+    for i, j in enumerate(index):
+        quality = base['quality'][i] | other['quality'][j]
+        if abs(other['timestamp'][j] - base['timestamp'][i]) > max_age_ms or quality & QUALITY_SUBSTITUTED:
+            continue
+        t, rh = ((base['value'][i], other['value'][j]) if base is temperature
+                 else (other['value'][j], base['value'][i]))
+        result['timestamp'].append(max(base['timestamp'][i], other['timestamp'][j]))
+        result['vpd'].append(round(vapour_pressure_deficit(t, rh), 3))
+        result['dew_point'].append(round(dew_point(t, rh), 2))
+        result['quality'].append(quality)
+    return result
+
+def _photoperiod_starts(first_ts, last_ts, light_start, tz):
+    """Photoperiod starts (epoch seconds) from the one holding first_ts up to last_ts"""
+    starts = [photoperiod_start(first_ts, light_start, tz)]
+    while True:
+        # Step past the next local start; DST makes some photoperiods 23 or 25 hours long
+        following = photoperiod_start(starts[-1] + 26 * 3600, light_start, tz)
+        if following > last_ts:
+            return starts
+        starts.append(following)
+
+def derive_dli_series(light, light_start=6.0, tz=None):
+    """
+    Running DLI series from a light_level series (dict of 'timestamp' in ms,
+    'value', 'quality'), restarting at every photoperiod start
+    """
+    keep = [i for i, quality in enumerate(light['quality']) if not quality & QUALITY_SUBSTITUTED]
+    if not keep:
+        return {'timestamp': [], 'dli': [], 'quality': []}
+    timestamps = [light['timestamp'][i] for i in keep]
+    starts = _photoperiod_starts(timestamps[0] / 1000.0, timestamps[-1] / 1000.0, light_start, tz)
+
+    if np is not None:
+        ts = np.asarray(timestamps, dtype=np.float64) / 1000.0
+        ppfd = np.maximum(np.asarray(light['value'], dtype=np.float64)[keep], 0.0) * LUX_TO_PPFD
+        period = np.searchsorted(np.asarray(starts), ts, side='right')
+        dt = np.diff(ts)
+        step = np.where((dt > 0) & (dt <= DLI_MAX_GAP) & (period[1:] == period[:-1]),
+                        (ppfd[1:] + ppfd[:-1]) / 2.0 * dt / 1e6, 0.0)
+        total = np.concatenate(([0.0], np.cumsum(step)))
+        # Subtract the running total at the first sample of each photoperiod
+        dli = total - total[np.searchsorted(period, period, side='left')]
+        return {'timestamp': [int(t) for t in timestamps], 'dli': np.round(dli, 4).tolist(),
+                'quality': [light['quality'][i] for i in keep]}
+
+    import bisect
+    result = {'timestamp': [], 'dli': [], 'quality': []}
+    previous = None
+    for i in keep:
+        ts = light['timestamp'][i] / 1000.0
+        ppfd = max(light['value'][i], 0.0) * LUX_TO_PPFD
+        period = bisect.bisect_right(starts, ts)
+        if previous is None or previous[0] != period:
+            total = 0.0
+        elif 0 < ts - previous[1] <= DLI_MAX_GAP:
+            total += (ppfd + previous[2]) / 2.0 * (ts - previous[1]) / 1e6
+        previous = (period, ts, ppfd)
+        result['timestamp'].append(light['timestamp'][i])
+        result['dli'].append(round(total, 4))
+        result['quality'].append(light['quality'][i])
+    return result
+
+def derive_history(device, hours, light_start=6.0, tz=None):
+    """Derived metric samples of one device over the last hours, as {channel: series}"""
+    from sensor_data import get_metric_series, get_metrics
+
+    def series_of(channel):
+        series = get_metric_series(channel, hours, device)
+        # Wide rows carry their flags as a computed (possibly Decimal) column
+        series['quality'] = [int(quality) for quality in series['quality']]
+        return series
+
+    channels = {entry['metric'] for entry in get_metrics(device)}
+    result = {}
+    for channel in sorted(channels):
+        prefix, measurement = _split_channel(channel)
+        if measurement == 'temperature' and prefix + 'humidity' in channels:
+            series = derive_vpd_series(series_of(channel), series_of(prefix + 'humidity'))
+            for name in ('vpd', 'dew_point'):
+                result[prefix + name] = {'timestamp': series['timestamp'], 'value': series[name],
+                                         'quality': series['quality']}
+        elif measurement == 'light_level':
+            series = derive_dli_series(series_of(channel), light_start, tz)
+            result[prefix + 'dli'] = {'timestamp': series['timestamp'], 'value': series['dli'],
+                                      'quality': series['quality']}
+    return result
+
+def register_derived_commands(app):
+    """Register derived metric commands with the Flask CLI"""
+
+    @app.cli.command('backfill-derived')
+    @click.option('--hours', default=24 * 30, show_default=True, help='Hours of history to derive')
+    @click.option('--device', 'devices', multiple=True, help='Device to derive (default: all)')
+    def backfill_derived_command(hours, devices):
+        """Compute VPD, dew point and DLI over stored history"""
+        from channel_store import insert_samples, resolve_id, device_ids, metric_ids
+        from data_storage import get_setting, get_timezone
+        from rollups import rebuild_rollups
+        from sensor_data import LEGACY_DEVICE
+
+        started = time.perf_counter()
+        light_start = float(get_setting('light_hours_start', '6'))
+        tz = get_timezone()
+        if not devices:
+            devices = set(db.session.execute(select(Device.name)).scalars()) | {LEGACY_DEVICE}
+
+        count, first_ms, last_ms, written = 0, None, None, set()
+        for device in sorted(devices):
+            for channel, series in derive_history(device, hours, light_start, tz).items():
+                if not series['timestamp']:
+                    continue
+                metric_id = resolve_id(Metric, metric_ids, channel)
+                device_id = resolve_id(Device, device_ids, device)
+                insert_samples([
+                    {'metric_id': metric_id, 'device_id': device_id, 'ts': ts, 'value': value, 'quality': quality}
+                    for ts, value, quality in zip(series['timestamp'], series['value'], series['quality'])
+                ])
+                count += len(series['timestamp'])
+                written.add((device, channel))
+                first_ms = min(first_ms, series['timestamp'][0]) if first_ms is not None else series['timestamp'][0]
+                last_ms = max(last_ms, series['timestamp'][-1]) if last_ms is not None else series['timestamp'][-1]
+        if count:
+            rebuild_rollups(first_ms, last_ms, written)
+        db.session.commit()
+        click.echo(f"Derived {count} samples in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,127 @@
+"""
+Local control rules for the Sensor Pi.
+
+The dashboard compiles its automation settings (fan threshold and
+hysteresis, light hours, watering schedule) into a rule set and publishes
+it as a retained message on TOPIC_CONTROL_RULES. sensor_client keeps the
+last rule set in a local file and evaluates it after every sample, so the
+actuators keep following the rules while the dashboard or the broker is
+down. The rules mirror should_fan_be_on, should_light_be_on and
+should_water_pump_be_on in data_storage.py.
+
+This module only depends on the standard library so it can be copied to
+the Sensor Pi next to sensor_client.py.
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+logger = logging.getLogger(__name__)
+
+def load_rules(path):
+    """Rule set cached in path, or None"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading cached control rules {path}: {e}")
+        return None
+
+def save_rules(path, rules):
+    """Cache the rule set in path, replacing the previous file atomically"""
+    try:
+        with open(path + '.tmp', 'w') as f:
+            json.dump(rules, f)
+        os.replace(path + '.tmp', path)
+        return True
+    except OSError as e:
+        logger.error(f"Error caching control rules in {path}: {e}")
+        return False
+
+class LocalRules:
+    """Evaluate a compiled rule set against the latest readings"""
+
+    def __init__(self, rules=None):
+        self.rules = None
+        self.timezone = None
+        if rules:
+            self.update(rules)
+
+    @property
+    def version(self):
+        return self.rules.get('version') if self.rules else None
+
+    def update(self, rules):
+        """Replace the rule set"""
+        self.rules = rules
+        self.timezone = None
+        name = rules.get('timezone')
+        if name and ZoneInfo is not None:
+            try:
+                self.timezone = ZoneInfo(name)
+            except Exception:
+                logger.error(f"Unknown time zone '{name}', using the local time of the Sensor Pi")
+
+    def now(self):
+        return datetime.now(self.timezone)
+
+    def _fan(self, rule, readings):
+        value = readings.get(rule['metric'])
+        if value is None:
+            return None
+        if value > rule['on_above']:
+            return True, f"{rule['metric']} {value:.1f} above {rule['on_above']}", value
+        if value < rule['off_below']:
+            return False, f"{rule['metric']} {value:.1f} below {rule['off_below']}", value
+        # Inside the hysteresis band: keep the current state
+        return None
+
+    def _light(self, rule, now):
+        if rule['start_hour'] <= now.hour < rule['end_hour']:
+            return True, f"light hours {rule['start_hour']}-{rule['end_hour']}", None
+        return False, f"outside light hours {rule['start_hour']}-{rule['end_hour']}", None
+
+    def _water_pump(self, rule, now):
+        if rule['schedule'] != 'daily':
+            return False, f"watering schedule {rule['schedule']}", None
+        if now.hour == rule['hour'] and now.minute == 0 and now.second < rule['duration']:
+            return True, f"daily watering at {rule['hour']}:00 for {rule['duration']} s", None
+        return False, "outside watering time", None
+
+    def evaluate(self, readings, now=None):
+        """
+        Desired actuator states as {actuator: (state, reason, value)}; actuators
+        without automatic control or inside the hysteresis band are left out
+        """
+        if not self.rules:
+            return {}
+        now = now or self.now()
+
+        decisions = {}
+        for name, rule in (('fan', self.rules.get('fan')),
+                           ('light', self.rules.get('light')),
+                           ('water_pump', self.rules.get('water_pump'))):
+            if not rule or not rule.get('auto'):
+                continue
+            try:
+                if name == 'fan':
+                    decision = self._fan(rule, readings)
+                elif name == 'light':
+                    decision = self._light(rule, now)
+                else:
+                    decision = self._water_pump(rule, now)
+            except (KeyError, TypeError) as e:
+                logger.error(f"Invalid {name} control rule: {e}")
+                continue
+            if decision is not None:
+                decisions[name] = decision
+        return decisions
@@ -0,0 +1,118 @@
+"""
+Edge aggregation for the Sensor Pi.
+
+In edge mode sensor_client keeps every raw sample in a local SQLite ring
+store and publishes only per-window aggregates (count, mean, min, max and
+standard deviation per channel). Windows are aligned to multiples of the
+window length in epoch time. The dashboard can ask for the raw samples of
+a time range on TOPIC_BACKFILL_REQUEST; they are answered from the ring
+store, which keeps EDGE_RETENTION hours.
+
+This module only depends on the standard library so it can be copied to
+the Sensor Pi next to sensor_client.py.
+"""
+
+import math
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class RingStore:
+    """Raw channel samples of the last retention hours in a local SQLite file"""
+
+    def __init__(self, path, retention_hours):
+        self.retention_ms = int(retention_hours * 3600 * 1000)
+        self.pending = []
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS samples ("
+            "channel TEXT NOT NULL, ts INTEGER NOT NULL, value REAL NOT NULL, "
+            "PRIMARY KEY (channel, ts)) WITHOUT ROWID"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts)")
+        self.connection.commit()
+
+    def add(self, channel, ts, value):
+        """Queue a sample (ts in epoch milliseconds) for the next flush"""
+        with self.lock:
+            self.pending.append((channel, ts, value))
+
+    def flush(self):
+        """Write queued samples and drop those older than the retention; blocking"""
+        with self.lock:
+            rows, self.pending = self.pending, []
+            try:
+                self.connection.executemany("INSERT OR IGNORE INTO samples VALUES (?, ?, ?)", rows)
+                cutoff = int(time.time() * 1000) - self.retention_ms
+                self.connection.execute("DELETE FROM samples WHERE ts < ?", (cutoff,))
+                self.connection.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error writing the edge ring store: {e}")
+                self.connection.rollback()
+                return 0
+        return len(rows)
+
+    def query(self, start, end, channels=None):
+        """(channel, ts, value) rows from start to end (epoch milliseconds, end excluded), oldest first"""
+        self.flush()
+        sql = "SELECT channel, ts, value FROM samples WHERE ts >= ? AND ts < ?"
+        params = [start, end]
+        if channels:
+            sql += f" AND channel IN ({', '.join('?' * len(channels))})"
+            params += list(channels)
+        with self.lock:
+            return self.connection.execute(sql + " ORDER BY ts", params).fetchall()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.connection.close()
+
+class WindowAggregator:
+    """Running count, sum, sum of squares, min and max per channel and window"""
+
+    def __init__(self, window_seconds):
+        self.window_ms = int(window_seconds * 1000)
+        # (window start, channel) -> [count, sum, sumsq, min, max]
+        self.windows = {}
+
+    def window_start(self, ts):
+        return ts - ts % self.window_ms
+
+    def add(self, channel, ts, value):
+        """Add a sample (ts in epoch milliseconds) to its window"""
+        key = (self.window_start(ts), channel)
+        window = self.windows.get(key)
+        if window is None:
+            self.windows[key] = [1, value, value * value, value, value]
+        else:
+            window[0] += 1
+            window[1] += value
+            window[2] += value * value
+            window[3] = min(window[3], value)
+            window[4] = max(window[4], value)
+
+    def pop_closed(self, now):
+        """
+        Statistics of the windows that ended before now (epoch milliseconds),
+        as {window start: {channel: {'count', 'mean', 'min', 'max', 'stddev'}}}
+        """
+        closed = {}
+        for key in [key for key in self.windows if key[0] + self.window_ms <= now]:
+            start, channel = key
+            count, total, sumsq, low, high = self.windows.pop(key)
+            mean = total / count
+            closed.setdefault(start, {})[channel] = {
+                'count': count,
+                'mean': mean,
+                'min': low,
+                'max': high,
+                'stddev': math.sqrt(max(sumsq / count - mean * mean, 0.0))
+            }
+        return closed
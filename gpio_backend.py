@@ -0,0 +1,332 @@
+"""
+GPIO access for the relays and digital inputs.
+
+The backends share a small interface: setup_output() and write() for the
+relays (write takes {pin: state} and switches them in one call where the
+library allows it), setup_input() and read() for digital inputs, and
+watch() for edge callbacks, so input changes are seen when they happen
+instead of at the next poll. Pins use BCM numbering.
+
+GPIO_BACKEND selects the backend:
+
+- rpi: RPi.GPIO
+- lgpio: lgpio, which also works on the Raspberry Pi 5
+- gpiod: the libgpiod 2.x Python bindings
+- mock: in-memory pins for tests, benchmarks and simulation mode
+- auto (default): the first of rpi, lgpio and gpiod that loads, else mock
+
+Edge callbacks are called as callback(pin, level, timestamp) with the level
+after the edge and a time.monotonic() timestamp, from the backend's thread.
+
+This module only depends on the standard library (and the selected GPIO
+library) so it can be copied to the Sensor Pi next to sensor_client.py.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+GPIO_BACKEND = os.environ.get("GPIO_BACKEND", "auto")
+# GPIO chip used by the lgpio and gpiod backends (/dev/gpiochip<N>)
+GPIO_CHIP = int(os.environ.get("GPIO_CHIP", 0))
+
+RISING = 'rising'
+FALLING = 'falling'
+BOTH = 'both'
+
+class GPIOBackend:
+    """Interface of the GPIO backends"""
+
+    name = None
+    # True for the in-memory backend, which drives no hardware
+    simulated = False
+
+    def setup_output(self, pin, state=False):
+        """Configure pin as an output with the given initial state"""
+        raise NotImplementedError
+
+    def write(self, states):
+        """Set several outputs, {pin: state}, in one pass"""
+        raise NotImplementedError
+
+    def setup_input(self, pin, pull=None):
+        """Configure pin as an input; pull is None, 'up' or 'down'"""
+        raise NotImplementedError
+
+    def read(self, pin):
+        """Level of an input as a bool"""
+        raise NotImplementedError
+
+    def watch(self, pin, callback, edge=BOTH, debounce_ms=0):
+        """Call callback(pin, level, timestamp) on each edge of a configured input"""
+        raise NotImplementedError
+
+    def cleanup(self):
+        """Stop the edge callbacks and release the pins"""
+
+class RPiGPIOBackend(GPIOBackend):
+    """RPi.GPIO"""
+
+    name = 'rpi'
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+
+    def setup_output(self, pin, state=False):
+        self.GPIO.setup(pin, self.GPIO.OUT, initial=self.GPIO.HIGH if state else self.GPIO.LOW)
+
+    def write(self, states):
+        if states:
+            self.GPIO.output(list(states), [self.GPIO.HIGH if state else self.GPIO.LOW for state in states.values()])
+
+    def setup_input(self, pin, pull=None):
+        pulls = {None: self.GPIO.PUD_OFF, 'up': self.GPIO.PUD_UP, 'down': self.GPIO.PUD_DOWN}
+        self.GPIO.setup(pin, self.GPIO.IN, pull_up_down=pulls[pull])
+
+    def read(self, pin):
+        return bool(self.GPIO.input(pin))
+
+    def watch(self, pin, callback, edge=BOTH, debounce_ms=0):
+        edges = {RISING: self.GPIO.RISING, FALLING: self.GPIO.FALLING, BOTH: self.GPIO.BOTH}
+
+        def on_edge(channel):
+            # RPi.GPIO does not pass the level; read it unless the edge implies it
+            level = edge == RISING if edge != BOTH else bool(self.GPIO.input(channel))
+            callback(channel, level, time.monotonic())
+
+        options = {'bouncetime': int(debounce_ms)} if debounce_ms >= 1 else {}
+        self.GPIO.add_event_detect(pin, edges[edge], callback=on_edge, **options)
+
+    def cleanup(self):
+        self.GPIO.cleanup()
+
+class LgpioBackend(GPIOBackend):
+    """lgpio"""
+
+    name = 'lgpio'
+
+    def __init__(self, chip=GPIO_CHIP):
+        import lgpio
+        self.lgpio = lgpio
+        self.handle = lgpio.gpiochip_open(chip)
+        self.pulls = {}
+        self.callbacks = []
+
+    def setup_output(self, pin, state=False):
+        self.lgpio.gpio_claim_output(self.handle, pin, int(bool(state)))
+
+    def write(self, states):
+        for pin, state in states.items():
+            self.lgpio.gpio_write(self.handle, pin, int(bool(state)))
+
+    def setup_input(self, pin, pull=None):
+        pulls = {None: self.lgpio.SET_PULL_NONE, 'up': self.lgpio.SET_PULL_UP, 'down': self.lgpio.SET_PULL_DOWN}
+        self.pulls[pin] = pulls[pull]
+        self.lgpio.gpio_claim_input(self.handle, pin, self.pulls[pin])
+
+    def read(self, pin):
+        return bool(self.lgpio.gpio_read(self.handle, pin))
+
+    def watch(self, pin, callback, edge=BOTH, debounce_ms=0):
+        edges = {RISING: self.lgpio.RISING_EDGE, FALLING: self.lgpio.FALLING_EDGE, BOTH: self.lgpio.BOTH_EDGES}
+        self.lgpio.gpio_claim_alert(self.handle, pin, edges[edge], self.pulls.get(pin, self.lgpio.SET_PULL_NONE))
+        if debounce_ms:
+            self.lgpio.gpio_set_debounce_micros(self.handle, pin, int(debounce_ms * 1000))
+
+        def on_edge(chip, gpio, level, tick):
+            # Level 2 reports a watchdog timeout, not an edge
+            if level != 2:
+                callback(gpio, bool(level), time.monotonic())
+
+        self.callbacks.append(self.lgpio.callback(self.handle, pin, edges[edge], on_edge))
+
+    def cleanup(self):
+        for callback in self.callbacks:
+            callback.cancel()
+        self.lgpio.gpiochip_close(self.handle)
+
+class GpiodBackend(GPIOBackend):
+    """libgpiod 2.x; edge events are read by one thread per watched pin"""
+
+    name = 'gpiod'
+
+    def __init__(self, chip=GPIO_CHIP):
+        import gpiod
+        from gpiod.line import Bias, Direction, Edge, Value
+        self.gpiod = gpiod
+        self.Bias, self.Direction, self.Edge, self.Value = Bias, Direction, Edge, Value
+        self.path = f"/dev/gpiochip{chip}"
+        if not gpiod.is_gpiochip_device(self.path):
+            raise OSError(f"{self.path} is not a GPIO chip")
+        self.requests = {}
+        self.biases = {}
+        self.watchers = []
+        self.running = True
+
+    def _request(self, pin, settings):
+        previous = self.requests.pop(pin, None)
+        if previous is not None:
+            previous.release()
+        self.requests[pin] = self.gpiod.request_lines(self.path, consumer='opengrow', config={pin: settings})
+        return self.requests[pin]
+
+    def setup_output(self, pin, state=False):
+        self._request(pin, self.gpiod.LineSettings(
+            direction=self.Direction.OUTPUT, output_value=self.Value.ACTIVE if state else self.Value.INACTIVE
+        ))
+
+    def write(self, states):
+        for pin, state in states.items():
+            self.requests[pin].set_value(pin, self.Value.ACTIVE if state else self.Value.INACTIVE)
+
+    def setup_input(self, pin, pull=None):
+        biases = {None: self.Bias.DISABLED, 'up': self.Bias.PULL_UP, 'down': self.Bias.PULL_DOWN}
+        self.biases[pin] = biases[pull]
+        self._request(pin, self.gpiod.LineSettings(direction=self.Direction.INPUT, bias=self.biases[pin]))
+
+    def read(self, pin):
+        return self.requests[pin].get_value(pin) == self.Value.ACTIVE
+
+    def watch(self, pin, callback, edge=BOTH, debounce_ms=0):
+        edges = {RISING: self.Edge.RISING, FALLING: self.Edge.FALLING, BOTH: self.Edge.BOTH}
+        request = self._request(pin, self.gpiod.LineSettings(
+            direction=self.Direction.INPUT, edge_detection=edges[edge],
+            bias=self.biases.get(pin, self.Bias.AS_IS), debounce_period=timedelta(milliseconds=debounce_ms)
+        ))
+        watcher = threading.Thread(target=self._read_events, args=(request, callback), daemon=True)
+        watcher.start()
+        self.watchers.append(watcher)
+
+    def _read_events(self, request, callback):
+        while self.running:
+            try:
+                if not request.wait_edge_events(timedelta(seconds=0.5)):
+                    continue
+                for event in request.read_edge_events():
+                    # Event timestamps use the monotonic clock
+                    callback(event.line_offset, event.event_type == event.Type.RISING_EDGE,
+                             event.timestamp_ns / 1e9)
+            except Exception as e:
+                if self.running:
+                    logger.error(f"Error reading GPIO edge events: {e}")
+                return
+
+    def cleanup(self):
+        self.running = False
+        for watcher in self.watchers:
+            watcher.join(1.0)
+        for request in self.requests.values():
+            request.release()
+        self.requests = {}
+
+class MockGPIO(GPIOBackend):
+    """
+    In-memory pins.
+
+    Outputs record every write with its timestamp in writes; inputs are
+    driven with set_input(), which runs the edge callbacks synchronously
+    with the same debounce rules as the hardware backends. clock supplies
+    the timestamps (time.monotonic by default), so tests can use a fake
+    clock and get exact timings.
+    """
+
+    name = 'mock'
+    simulated = True
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.levels = {}
+        self.modes = {}
+        # pin -> [callback, edge, debounce in seconds, time of the last accepted edge]
+        self.watchers = {}
+        # (timestamp, {pin: state}) per write() call
+        self.writes = []
+        self.lock = threading.Lock()
+
+    def setup_output(self, pin, state=False):
+        with self.lock:
+            self.modes[pin] = 'out'
+            self.levels[pin] = bool(state)
+
+    def write(self, states):
+        timestamp = self.clock()
+        with self.lock:
+            for pin, state in states.items():
+                self.levels[pin] = bool(state)
+            self.writes.append((timestamp, {pin: bool(state) for pin, state in states.items()}))
+
+    def setup_input(self, pin, pull=None):
+        with self.lock:
+            self.modes[pin] = 'in'
+            self.levels.setdefault(pin, pull == 'up')
+
+    def read(self, pin):
+        return self.levels.get(pin, False)
+
+    def watch(self, pin, callback, edge=BOTH, debounce_ms=0):
+        if self.modes.get(pin) != 'in':
+            self.setup_input(pin)
+        with self.lock:
+            self.watchers[pin] = [callback, edge, debounce_ms / 1000.0, None]
+
+    def set_input(self, pin, level, timestamp=None):
+        """Drive an input like external hardware; returns True if an edge callback ran"""
+        timestamp = self.clock() if timestamp is None else timestamp
+        level = bool(level)
+        with self.lock:
+            previous = self.levels.get(pin, False)
+            self.levels[pin] = level
+            watcher = self.watchers.get(pin)
+            if watcher is None or previous == level:
+                return False
+            callback, edge, debounce, last = watcher
+            if (edge == RISING and not level) or (edge == FALLING and level):
+                return False
+            if last is not None and timestamp - last < debounce:
+                return False
+            watcher[3] = timestamp
+        callback(pin, level, timestamp)
+        return True
+
+    def schedule_input(self, pin, level, delay):
+        """Drive an input after delay seconds from a timer thread, e.g. for benchmarks"""
+        timer = threading.Timer(delay, self.set_input, (pin, level))
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def cleanup(self):
+        with self.lock:
+            self.watchers = {}
+
+BACKENDS = {
+    'rpi': RPiGPIOBackend,
+    'lgpio': LgpioBackend,
+    'gpiod': GpiodBackend,
+    'mock': MockGPIO
+}
+
+def create_backend(name=GPIO_BACKEND):
+    """The configured GPIO backend, falling back to the mock backend when no library loads"""
+    names = ('rpi', 'lgpio', 'gpiod') if name == 'auto' else (name,)
+    for backend_name in names:
+        backend_class = BACKENDS.get(backend_name)
+        if backend_class is None:
+            logger.error(f"Unknown GPIO backend {backend_name!r}")
+            continue
+        try:
+            backend = backend_class()
+            logger.info(f"Using the {backend_name} GPIO backend")
+            return backend
+        except Exception as e:
+            # RPi.GPIO raises RuntimeError when imported on other machines
+            (logger.debug if name == 'auto' else logger.error)(f"GPIO backend {backend_name} unavailable: {e}")
+    logger.warning("No GPIO library available - using in-memory GPIO pins")
+    return MockGPIO()
@@ -0,0 +1,38 @@
+# Gunicorn configuration for the Dashboard Pi
+#
+# Web workers run in MQTT proxy mode and send commands through one ingest
+# sidecar process, which owns the MQTT subscription and stores incoming
+# data. This keeps a single "dashboard-pi" MQTT client however many
+# workers are configured.
+#
+#   gunicorn -c gunicorn.conf.py main:app
+
+import os
+import sys
+import subprocess
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+# workers * threads requests are served at once (8 by default). Anything
+# that keeps a request open, such as an /api/alerts/stream client (up to
+# ALERT_STREAM_MAX_AGE seconds), uses one of these threads for its whole
+# duration, so keep long-lived streams well below this budget.
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+raw_env = ["MQTT_MODE=proxy"]
+
+def on_starting(server):
+    """Start the MQTT ingest sidecar before any worker boots"""
+    env = dict(os.environ, MQTT_MODE="ingest")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest_service.py")
+    server.ingest_process = subprocess.Popen([sys.executable, script], env=env)
+    server.log.info(f"Started MQTT ingest process (pid {server.ingest_process.pid})")
+
+def on_exit(server):
+    """Stop the ingest sidecar with the master process"""
+    process = getattr(server, "ingest_process", None)
+    if process and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
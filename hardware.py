@@ -1,8 +1,15 @@
+import os
 import logging
 import time
 import threading
-from models import ControlState, SensorReading
-from app import db
+from flask import current_app
+from models import db, ControlState, SensorReading
+from simulation import GreenhouseSimulator
+from processing import process_reading, pack_quality
+from alerts import get_alert_engine
+from mqtt_ipc import is_proxy
+from gpio_backend import MockGPIO, create_backend
+from sqlalchemy import select
 import random
 
 # Setup logging
@@ -11,8 +18,9 @@ logger = logging.getLogger(__name__)
 # Flag to determine if running on actual hardware or in simulation mode
 SIMULATION_MODE = True
 
-# Define GPIO and Adafruit_DHT as None initially to avoid unbound errors
-GPIO = None
+# GPIO backend for direct relay control and the DHT library, set by
+# load_hardware_libraries()
+gpio = None
 Adafruit_DHT = None
 
 # GPIO Pin definitions based on user's equipment
@@ -26,17 +34,17 @@ FAN_PIN = 18  # Example relay pin for fan
 LIGHT_PIN = 23  # Example relay pin for grow lights
 WATER_PUMP_PIN = 24  # Example relay pin for water pump
 
+ACTUATOR_PINS = {
+    'fan': FAN_PIN,
+    'light': LIGHT_PIN,
+    'water_pump': WATER_PUMP_PIN
+}
+
 # DHT sensor type (DHT22 or DHT11) - only defined when hardware is available
 DHT_SENSOR_TYPE = None
 
-try:
-    import RPi.GPIO as GPIO
-    import Adafruit_DHT
-    SIMULATION_MODE = False
-    DHT_SENSOR_TYPE = Adafruit_DHT.DHT22
-    logger.info("Hardware libraries loaded successfully")
-except ImportError:
-    logger.warning("RPi.GPIO or Adafruit_DHT not found. Running in simulation mode.")
+# Flask application used by background threads for database access
+flask_app = None
 
 # Current state of controls
 control_state = {
@@ -45,30 +53,67 @@ control_state = {
     'water_pump': False
 }
 
+# Actuators the automation rules leave alone until a time.monotonic()
+# deadline, set by control_actuators() with a hold (e.g. scenes)
+control_holds = {}
+
+# Incremented whenever control_state changes, used to version cached responses
+control_state_version = 0
+
+# Simulated grow box used in simulation mode; seed it for reproducible runs
+SIMULATION_SEED = os.environ.get("SIMULATION_SEED")
+simulator = GreenhouseSimulator(seed=int(SIMULATION_SEED) if SIMULATION_SEED else None)
+
 # Sensor reading thread
 sensor_thread = None
 should_run = True
 
-def initialize_hardware():
+def bind_app(app):
+    """Set the Flask application used for database access outside requests"""
+    global flask_app
+    flask_app = app
+
+def app_context():
+    """Application context for database access from background threads"""
+    return (flask_app or current_app).app_context()
+
+def load_hardware_libraries():
+    """Load the GPIO backend and the DHT library, switching off simulation mode if both exist"""
+    global gpio, Adafruit_DHT, DHT_SENSOR_TYPE, SIMULATION_MODE
+    
+    gpio = create_backend()
+    try:
+        import Adafruit_DHT
+        DHT_SENSOR_TYPE = Adafruit_DHT.DHT22
+    except ImportError:
+        Adafruit_DHT = None
+    
+    if gpio.simulated or Adafruit_DHT is None:
+        logger.warning("GPIO library or Adafruit_DHT not found. Running in simulation mode.")
+        if not gpio.simulated:
+            # Simulation mode leaves the real pins alone
+            gpio.cleanup()
+            gpio = MockGPIO()
+        SIMULATION_MODE = True
+    else:
+        SIMULATION_MODE = False
+        logger.info("Hardware libraries loaded successfully")
+    return not SIMULATION_MODE
+
+def initialize_hardware(app=None):
     """Initialize GPIO and sensor hardware"""
+    if app is not None:
+        bind_app(app)
+    load_hardware_libraries()
+    
+    # Setup output pins, initially OFF (in memory in simulation mode)
+    for pin in ACTUATOR_PINS.values():
+        gpio.setup_output(pin, False)
+    
     if SIMULATION_MODE:
         logger.info("Initializing in simulation mode")
         return
     
-    # Set GPIO mode
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setwarnings(False)
-    
-    # Setup output pins
-    GPIO.setup(FAN_PIN, GPIO.OUT)
-    GPIO.setup(LIGHT_PIN, GPIO.OUT)
-    GPIO.setup(WATER_PUMP_PIN, GPIO.OUT)
-    
-    # Initialize outputs to OFF
-    GPIO.output(FAN_PIN, GPIO.LOW)
-    GPIO.output(LIGHT_PIN, GPIO.LOW)
-    GPIO.output(WATER_PUMP_PIN, GPIO.LOW)
-    
     # Start sensor reading thread
     start_sensor_thread()
     
@@ -83,97 +128,124 @@ def cleanup():
     if sensor_thread:
         sensor_thread.join()
     
-    if not SIMULATION_MODE:
-        GPIO.cleanup()
+    if gpio is not None:
+        gpio.cleanup()
     
     logger.info("Hardware resources cleaned up")
 
-def control_fan(state):
-    """Control the fan state"""
-    control_state['fan'] = state
-    
+def _set_actuator(name, label, pin, state):
+    """
+    Set an actuator through the sensor Pi, falling back to direct GPIO control.
+
+    Returns (state, command). Over MQTT the command is sent without waiting
+    out its retries and the state is only updated once the sensor Pi
+    acknowledges it (its status message updates control_state and the
+    database), so state is the one the hardware last reported and command
+    is the command from mqtt_client.get_command(), pending or acknowledged.
+    Without MQTT the relay is switched directly and command is None.
+    """
     # Try to send command via MQTT first
     try:
-        from mqtt_client import send_fan_command, is_connected
-        if is_connected:
-            logger.info(f"Sending fan command via MQTT: {'ON' if state else 'OFF'}")
-            send_fan_command(state)
-        else:
-            logger.warning("MQTT not connected, controlling fan directly")
-            if not SIMULATION_MODE:
-                GPIO.output(FAN_PIN, GPIO.HIGH if state else GPIO.LOW)
+        from mqtt_client import send_control_command, command_channel_available
+        if command_channel_available():
+            logger.info(f"Sending {label} command via MQTT: {'ON' if state else 'OFF'}")
+            command = send_control_command(name, state)
+            if command is None:
+                logger.warning(f"Could not send {label} command, state unchanged")
+                return get_current_control_state()[name], None
+            # In proxy mode control_state is not updated by this process
+            current = get_current_control_state()
+            if command['state'] == 'acknowledged':
+                return bool(command['status'].get(name, current[name])), command
+            return current[name], command
+        logger.warning(f"MQTT not connected, controlling {label} directly")
     except ImportError:
         # Fall back to direct control if MQTT is not available
-        logger.warning("MQTT client not available, controlling fan directly")
-        if not SIMULATION_MODE:
-            GPIO.output(FAN_PIN, GPIO.HIGH if state else GPIO.LOW)
+        logger.warning(f"MQTT client not available, controlling {label} directly")
+    
+    if gpio is not None:
+        gpio.write({pin: state})
+    control_state[name] = state
     
     # Update database with new state
     update_control_state_db()
     
-    logger.info(f"Fan set to: {'ON' if state else 'OFF'}")
-    return state
+    logger.info(f"{label.capitalize()} set to: {'ON' if state else 'OFF'}")
+    return state, None
+
+def control_fan(state):
+    """Control the fan state"""
+    return _set_actuator('fan', 'fan', FAN_PIN, state)
 
 def control_light(state):
     """Control the light state"""
-    control_state['light'] = state
-    
-    # Try to send command via MQTT first
-    try:
-        from mqtt_client import send_light_command, is_connected
-        if is_connected:
-            logger.info(f"Sending light command via MQTT: {'ON' if state else 'OFF'}")
-            send_light_command(state)
-        else:
-            logger.warning("MQTT not connected, controlling light directly")
-            if not SIMULATION_MODE:
-                GPIO.output(LIGHT_PIN, GPIO.HIGH if state else GPIO.LOW)
-    except ImportError:
-        # Fall back to direct control if MQTT is not available
-        logger.warning("MQTT client not available, controlling light directly")
-        if not SIMULATION_MODE:
-            GPIO.output(LIGHT_PIN, GPIO.HIGH if state else GPIO.LOW)
-    
-    # Update database with new state
-    update_control_state_db()
-    
-    logger.info(f"Light set to: {'ON' if state else 'OFF'}")
-    return state
+    return _set_actuator('light', 'light', LIGHT_PIN, state)
 
 def control_water_pump(state):
     """Control the water pump state"""
-    control_state['water_pump'] = state
-    
-    # Try to send command via MQTT first
+    return _set_actuator('water_pump', 'water pump', WATER_PUMP_PIN, state)
+
+def is_held(name):
+    """True while a hold keeps the automation rules from switching the actuator"""
+    until = control_holds.get(name)
+    if until is None:
+        return False
+    if until <= time.monotonic():
+        del control_holds[name]
+        return False
+    return True
+
+def control_actuators(states, devices=None, hold=None):
+    """
+    Set several actuators at once, e.g. for a scene.
+
+    Over MQTT this is a single batch command, applied by each sensor Pi (or
+    only those in devices) in one pass and acknowledged together. Without
+    MQTT the relays are switched directly and stored in one commit. With
+    hold (seconds), neither the automation rules here nor the Sensor Pis'
+    local rules switch these actuators for that long. Returns (control
+    state, command) like _set_actuator().
+    """
+    if hold:
+        for name in states:
+            control_holds[name] = time.monotonic() + hold
     try:
-        from mqtt_client import send_water_pump_command, is_connected
-        if is_connected:
-            logger.info(f"Sending water pump command via MQTT: {'ON' if state else 'OFF'}")
-            send_water_pump_command(state)
-        else:
-            logger.warning("MQTT not connected, controlling water pump directly")
-            if not SIMULATION_MODE:
-                GPIO.output(WATER_PUMP_PIN, GPIO.HIGH if state else GPIO.LOW)
+        from mqtt_client import send_control_command, command_channel_available
+        if command_channel_available():
+            logger.info(f"Sending batch command via MQTT: {states}" + (f" to {', '.join(devices)}" if devices else ""))
+            command = send_control_command('batch', states, devices, hold=hold)
+            if command is None:
+                logger.warning("Could not send batch command, state unchanged")
+                return dict(get_current_control_state()), None
+            current = dict(get_current_control_state())
+            if command['state'] == 'acknowledged':
+                status = command['status']
+                return {name: bool(status.get(name, state)) for name, state in current.items()}, command
+            return current, command
+        logger.warning("MQTT not connected, controlling actuators directly")
     except ImportError:
-        # Fall back to direct control if MQTT is not available
-        logger.warning("MQTT client not available, controlling water pump directly")
-        if not SIMULATION_MODE:
-            GPIO.output(WATER_PUMP_PIN, GPIO.HIGH if state else GPIO.LOW)
+        logger.warning("MQTT client not available, controlling actuators directly")
+    
+    if gpio is not None:
+        gpio.write({ACTUATOR_PINS[name]: state for name, state in states.items()})
+    control_state.update(states)
     
     # Update database with new state
     update_control_state_db()
     
-    logger.info(f"Water pump set to: {'ON' if state else 'OFF'}")
-    return state
+    logger.info(f"Actuators set to: {states}")
+    return dict(control_state), None
 
 def read_sensors():
-    """Read sensor data and return as dict"""
+    """Read sensor data and return as dict, listing default values under 'substituted'"""
+    substituted = []
     if SIMULATION_MODE:
-        # Generate simulated sensor data
-        temperature = round(random.uniform(18.0, 30.0), 1)
-        humidity = round(random.uniform(30.0, 80.0), 1)
-        light_level = round(random.uniform(0.0, 1000.0), 1)
-        soil_moisture = round(random.uniform(0.0, 100.0), 1)
+        # Sample the simulated grow box, which reacts to the actuator states
+        simulated = simulator.sample(actuators=control_state)
+        temperature = simulated['temperature']
+        humidity = simulated['humidity']
+        light_level = simulated['light_level']
+        soil_moisture = simulated['soil_moisture']
     else:
         try:
             # Read DHT22 temperature and humidity sensor
@@ -182,6 +254,7 @@ def read_sensors():
                 logger.warning("Failed to read from DHT sensor, using default values")
                 temperature = 20.0
                 humidity = 50.0
+                substituted += ['temperature', 'humidity']
             else:
                 # Round to 1 decimal place
                 temperature = round(temperature, 1)
@@ -202,15 +275,16 @@ def read_sensors():
             except Exception as e:
                 logger.error(f"Error reading BH1750 light sensor: {e}")
                 light_level = 500.0  # Default value
+                substituted.append('light_level')
             
             # Read capacitive soil moisture sensor
             try:
                 # In actual implementation, you would need to read the analog value 
                 # If using GPIO directly, you'd use a capacitive sensor digital output
                 # If using an ADC, you'd read the analog value and convert
-                # Example using Raspberry Pi GPIO:
-                # GPIO.setup(SOIL_MOISTURE_PIN, GPIO.IN)
-                # soil_moisture_digital = GPIO.input(SOIL_MOISTURE_PIN)
+                # Example using the GPIO backend:
+                # gpio.setup_input(SOIL_MOISTURE_PIN)
+                # soil_moisture_digital = gpio.read(SOIL_MOISTURE_PIN)
                 # soil_moisture = 100.0 if soil_moisture_digital == 0 else 0.0
                 
                 # For now, use a random value for testing
@@ -219,6 +293,7 @@ def read_sensors():
             except Exception as e:
                 logger.error(f"Error reading soil moisture sensor: {e}")
                 soil_moisture = 50.0  # Default value
+                substituted.append('soil_moisture')
         
         except Exception as e:
             logger.error(f"Error reading sensors: {e}")
@@ -227,13 +302,15 @@ def read_sensors():
             humidity = 50.0
             light_level = 500.0
             soil_moisture = 50.0
+            substituted = ['temperature', 'humidity', 'light_level', 'soil_moisture']
     
     # Create sensor reading dict
     sensor_data = {
         'temperature': temperature,
         'humidity': humidity,
         'light_level': light_level,
-        'soil_moisture': soil_moisture
+        'soil_moisture': soil_moisture,
+        'substituted': substituted
     }
     
     logger.debug(f"Sensor reading: {sensor_data}")
@@ -241,8 +318,11 @@ def read_sensors():
 
 def update_control_state_db():
     """Update control state in the database"""
+    global control_state_version
+    control_state_version += 1
+    
     try:
-        with db.app.app_context():
+        with app_context():
             # Get existing state or create new
             state = ControlState.query.first()
             if not state:
@@ -258,20 +338,46 @@ def update_control_state_db():
     except Exception as e:
         logger.error(f"Error updating control state in database: {e}")
 
-def save_sensor_reading(sensor_data):
-    """Save sensor reading to database"""
+def save_sensor_reading(sensor_data, substituted=(), device=None):
+    """
+    Process a sensor reading and save it to the database.
+
+    substituted lists the metrics that hold a default value instead of a
+    measurement; they are stored flagged and kept out of the filters.
+    """
+    # Import here to avoid circular imports
+    from sensor_data import METRICS, LEGACY_DEVICE, to_epoch_ms
+    from rollups import update_rollups
+    from derived_metrics import get_derived_metrics, store_derived
+    
     try:
-        with db.app.app_context():
+        values, flags = process_reading(device or LEGACY_DEVICE, {m: sensor_data.get(m) for m in METRICS}, substituted)
+        with app_context():
             reading = SensorReading(
-                temperature=sensor_data['temperature'],
-                humidity=sensor_data['humidity'],
-                light_level=sensor_data['light_level'],
-                soil_moisture=sensor_data['soil_moisture']
+                temperature=values['temperature'],
+                humidity=values['humidity'],
+                light_level=values['light_level'],
+                soil_moisture=values['soil_moisture'],
+                quality=pack_quality(flags, METRICS)
             )
             db.session.add(reading)
             db.session.commit()
+            
+            reading_ms = to_epoch_ms(reading.timestamp)
+            update_rollups(reading_ms, reading_ms, [(LEGACY_DEVICE, metric) for metric in METRICS])
     except Exception as e:
         logger.error(f"Error saving sensor data to database: {e}")
+        return
+    
+    # Evaluate the alert rules on the processed values
+    engine = get_alert_engine()
+    now = time.time()
+    for metric in METRICS:
+        engine.on_sample(device or LEGACY_DEVICE, metric, now, values[metric], flags.get(metric, 0))
+    
+    # VPD, dew point and DLI go to the narrow table through the channel writer
+    derived = get_derived_metrics().on_reading(device or LEGACY_DEVICE, reading_ms / 1000, values, flags)
+    store_derived(device or LEGACY_DEVICE, derived)
 
 def sensor_reading_thread():
     """Thread function to periodically read sensors and save to database"""
@@ -283,7 +389,7 @@ def sensor_reading_thread():
             sensor_data = read_sensors()
             
             # Save to database
-            save_sensor_reading(sensor_data)
+            save_sensor_reading(sensor_data, sensor_data.get('substituted', ()))
             
             # Sleep for sensor reading interval (30 seconds)
             time.sleep(30)
@@ -300,6 +406,10 @@ def start_sensor_thread():
     sensor_thread.daemon = True
     sensor_thread.start()
     
+    # Derived metrics of the local readings are written by the channel writer
+    from channel_store import start_channel_writer
+    start_channel_writer()
+    
     logger.info("Sensor reading thread started")
 
 def get_current_sensor_data():
@@ -307,6 +417,34 @@ def get_current_sensor_data():
     sensor_data = read_sensors()
     return sensor_data
 
+def _stored_control_state():
+    """Control state row written by the process that owns the MQTT connection"""
+    return db.session.execute(
+        select(ControlState.fan_state, ControlState.light_state,
+               ControlState.water_pump_state, ControlState.timestamp)
+        .order_by(ControlState.id)
+        .limit(1)
+    ).first()
+
 def get_current_control_state():
     """Get the current control state"""
+    if is_proxy():
+        # Status updates are processed by the ingest process, read its result
+        try:
+            row = _stored_control_state()
+            if row:
+                return {'fan': bool(row[0]), 'light': bool(row[1]), 'water_pump': bool(row[2])}
+        except Exception as e:
+            logger.error(f"Error reading control state from database: {e}")
     return control_state
+
+def get_control_state_version():
+    """Get the version of the current control state"""
+    if is_proxy():
+        try:
+            row = _stored_control_state()
+            return row[3].isoformat() if row and row[3] else None
+        except Exception as e:
+            logger.error(f"Error reading control state version from database: {e}")
+            return None
+    return control_state_version
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+OpenGrow-Box MQTT ingest service
+
+Owns the single MQTT connection of the Dashboard Pi: stores incoming sensor
+data and control status, and serves control commands from the web workers
+over a Unix socket (see mqtt_ipc.py). Run it next to gunicorn workers that
+use MQTT_MODE=proxy; gunicorn.conf.py starts it automatically.
+"""
+
+import os
+import signal
+import logging
+
+os.environ["MQTT_MODE"] = "ingest"
+
+from app import create_app  # noqa: E402
+from mqtt_client import disconnect_mqtt  # noqa: E402
+from mqtt_ipc import stop_ipc_server  # noqa: E402
+
+logger = logging.getLogger("ingest_service")
+
+def main():
+    """Run until SIGINT/SIGTERM"""
+    logging.basicConfig(level=logging.INFO)
+    # Starts the database schema, hardware, MQTT connection and IPC server
+    create_app()
+    logger.info(f"Ingest service running (pid {os.getpid()})")
+    try:
+        signal.sigwait({signal.SIGINT, signal.SIGTERM})
+    finally:
+        stop_ipc_server()
+        disconnect_mqtt()
+        logger.info("Ingest service stopped")
+
+if __name__ == "__main__":
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGINT, signal.SIGTERM})
+    main()
@@ -15,6 +15,8 @@ class SensorReading(db.Model):
     humidity = db.Column(db.Float, nullable=False)
     light_level = db.Column(db.Float, nullable=False)
     soil_moisture = db.Column(db.Float, nullable=True)
+    # processing.QUALITY_* flags, 4 bits per metric in sensor_data.METRICS order
+    quality = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     def __repr__(self):
         return f"<SensorReading {self.timestamp}: Temp={self.temperature}°C, Humidity={self.humidity}%>"
@@ -62,3 +64,170 @@ class Settings(db.Model):
     
     def __repr__(self):
         return f"<Setting {self.name}: {self.value}>"
+
+# Small integer ids: 2 bytes in PostgreSQL; SQLite needs INTEGER for autoincrement
+SMALL_ID = db.SmallInteger().with_variant(db.Integer(), 'sqlite')
+
+class Device(db.Model):
+    """Model for the devices (Sensor Pis) that report metric samples"""
+    __tablename__ = 'devices'
+    
+    id = db.Column(SMALL_ID, primary_key=True)
+    name = db.Column(db.String(64), unique=True, nullable=False)
+    
+    def __repr__(self):
+        return f"<Device {self.id}: {self.name}>"
+
+class Metric(db.Model):
+    """Model for the metrics (sensor channels) stored in metric_samples"""
+    __tablename__ = 'metrics'
+    
+    id = db.Column(SMALL_ID, primary_key=True)
+    name = db.Column(db.String(64), unique=True, nullable=False)
+    unit = db.Column(db.String(16), nullable=True)
+    
+    def __repr__(self):
+        return f"<Metric {self.id}: {self.name}>"
+
+class MetricSample(db.Model):
+    """
+    Model for metric samples in the narrow layout.
+
+    One row per (metric, device, timestamp) with the primary key doubling as
+    the range-scan index; timestamps are epoch milliseconds. On SQLite the
+    table is stored WITHOUT ROWID, clustered by that key.
+    """
+    __tablename__ = 'metric_samples'
+    
+    metric_id = db.Column(SMALL_ID, db.ForeignKey('metrics.id'), primary_key=True)
+    device_id = db.Column(SMALL_ID, db.ForeignKey('devices.id'), primary_key=True)
+    ts = db.Column(db.BigInteger, primary_key=True)
+    value = db.Column(db.REAL, nullable=False)
+    # processing.QUALITY_* flags
+    quality = db.Column(db.SmallInteger, nullable=False, default=0, server_default='0')
+    
+    __table_args__ = {'sqlite_with_rowid': False}
+    
+    def __repr__(self):
+        return f"<MetricSample metric={self.metric_id} device={self.device_id} {self.ts}: {self.value}>"
+
+class MetricRollup(db.Model):
+    """
+    One-minute rollups of metric samples for the aggregation API.
+
+    count, sum, sum of squares, min and max per (metric, device, minute)
+    are enough to merge into any wider bucket with mean, standard deviation
+    and extremes. minute is epoch minutes. Substituted values are left out.
+    """
+    __tablename__ = 'metric_rollups'
+    
+    metric_id = db.Column(SMALL_ID, db.ForeignKey('metrics.id'), primary_key=True)
+    device_id = db.Column(SMALL_ID, db.ForeignKey('devices.id'), primary_key=True)
+    minute = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    sum = db.Column(db.REAL, nullable=False)
+    sumsq = db.Column(db.REAL, nullable=False)
+    min = db.Column(db.REAL, nullable=False)
+    max = db.Column(db.REAL, nullable=False)
+    
+    __table_args__ = {'sqlite_with_rowid': False}
+    
+    def __repr__(self):
+        return f"<MetricRollup metric={self.metric_id} device={self.device_id} {self.minute}: {self.count}>"
+
+class EdgeAggregate(db.Model):
+    """
+    Window aggregates published by a Sensor Pi in edge mode.
+
+    The raw samples of a window stay on the Sensor Pi until they are
+    backfilled; until then the rollups of the window are taken from here.
+    start is epoch milliseconds, interval seconds.
+    """
+    __tablename__ = 'edge_aggregates'
+    
+    metric_id = db.Column(SMALL_ID, db.ForeignKey('metrics.id'), primary_key=True)
+    device_id = db.Column(SMALL_ID, db.ForeignKey('devices.id'), primary_key=True)
+    start = db.Column(db.BigInteger, primary_key=True)
+    interval = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    sum = db.Column(db.REAL, nullable=False)
+    sumsq = db.Column(db.REAL, nullable=False)
+    min = db.Column(db.REAL, nullable=False)
+    max = db.Column(db.REAL, nullable=False)
+    
+    __table_args__ = {'sqlite_with_rowid': False}
+    
+    def __repr__(self):
+        return f"<EdgeAggregate metric={self.metric_id} device={self.device_id} {self.start}: {self.count}>"
+
+class Alert(db.Model):
+    """Model for alerts raised by the alert engine"""
+    __tablename__ = 'alerts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    rule = db.Column(db.String(64), nullable=False)
+    kind = db.Column(db.String(16), nullable=False)
+    severity = db.Column(db.String(16), nullable=False, default='warning')
+    device = db.Column(db.String(64), nullable=False)
+    metric = db.Column(db.String(64), nullable=True)
+    message = db.Column(db.String(255), nullable=False)
+    value = db.Column(db.Float, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    resolved_at = db.Column(db.DateTime, nullable=True, index=True)
+    acknowledged = db.Column(db.Boolean, nullable=False, default=False)
+    
+    def __repr__(self):
+        return f"<Alert {self.rule} on {self.device}: {self.message}>"
+
+class ControlDecision(db.Model):
+    """Actuator switch decided by the rule set running on a Sensor Pi"""
+    __tablename__ = 'control_decisions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    device = db.Column(db.String(64), nullable=False)
+    actuator = db.Column(db.String(32), nullable=False)
+    state = db.Column(db.Boolean, nullable=False)
+    reason = db.Column(db.String(255), nullable=False)
+    value = db.Column(db.Float, nullable=True)
+    rules_version = db.Column(db.String(16), nullable=True)
+    
+    def __repr__(self):
+        return f"<ControlDecision {self.device} {self.actuator}={self.state}: {self.reason}>"
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'timestamp': self.timestamp.isoformat(),
+            'device': self.device,
+            'actuator': self.actuator,
+            'state': self.state,
+            'reason': self.reason,
+            'value': self.value,
+            'rules_version': self.rules_version
+        }
+
+def add_missing_columns():
+    """
+    Add columns introduced after a table was created.
+
+    db.create_all() only creates missing tables, so columns added to
+    existing models later (nullable or with a server default) are added
+    here with ALTER TABLE.
+    """
+    inspector = db.inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                default = f" DEFAULT {column.server_default.arg}" if column.server_default is not None else ""
+                not_null = " NOT NULL" if not column.nullable and default else ""
+                connection.execute(db.text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{not_null}{default}"
+                ))
@@ -1,13 +1,18 @@
 import os
 import json
+import uuid
 import logging
 import time
 import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from datetime import datetime
 
 import paho.mqtt.client as mqtt
 from paho.mqtt.publish import multiple
 
+from mqtt_ipc import MQTT_MODE, is_proxy, ipc_request, start_ipc_server
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -19,36 +24,197 @@ MQTT_USERNAME = os.environ.get("MQTT_USERNAME", None)
 MQTT_PASSWORD = os.environ.get("MQTT_PASSWORD", None)
 MQTT_CLIENT_ID = os.environ.get("MQTT_CLIENT_ID", "dashboard-pi")
 
+# Session and flow control tuning
+MQTT_RECONNECT_MIN_DELAY = int(os.environ.get("MQTT_RECONNECT_MIN_DELAY", 1))    # seconds
+MQTT_RECONNECT_MAX_DELAY = int(os.environ.get("MQTT_RECONNECT_MAX_DELAY", 120))  # seconds
+MQTT_MAX_INFLIGHT = int(os.environ.get("MQTT_MAX_INFLIGHT", 20))
+MQTT_MAX_QUEUED = int(os.environ.get("MQTT_MAX_QUEUED", 1000))
+
 # MQTT Topics
 TOPIC_SENSOR_DATA = "opengrow/sensors/data"
+TOPIC_CHANNEL_PREFIX = "opengrow/sensors/channels"  # /<device>/<channel>
 TOPIC_CONTROL_COMMAND = "opengrow/control/command"
 TOPIC_CONTROL_STATUS = "opengrow/control/status"
 TOPIC_SYSTEM_STATUS = "opengrow/system/status"
+TOPIC_AGGREGATE_PREFIX = "opengrow/sensors/aggregates"  # /<device>
+TOPIC_BACKFILL_REQUEST = "opengrow/sensors/backfill/request"
+TOPIC_BACKFILL_PREFIX = "opengrow/sensors/backfill/data"  # /<device>
+TOPIC_CONTROL_RULES = "opengrow/control/rules"  # retained
+TOPIC_CONTROL_DECISIONS = "opengrow/control/decisions"
+
+# Control command acknowledgement settings
+COMMAND_ACK_TIMEOUT = float(os.environ.get("MQTT_COMMAND_TIMEOUT", 2.0))  # seconds per attempt
+COMMAND_RETRIES = int(os.environ.get("MQTT_COMMAND_RETRIES", 2))
+# Seconds a request waits for the acknowledgement before returning the
+# command as pending (at most one attempt, COMMAND_ACK_TIMEOUT)
+COMMAND_WAIT = float(os.environ.get("MQTT_COMMAND_WAIT", 0))
+# Completed commands kept for status queries
+COMMAND_HISTORY = int(os.environ.get("MQTT_COMMAND_HISTORY", 200))
 
 # Global MQTT client
 mqtt_client = None
 is_connected = False
 
-def on_connect(client, userdata, flags, rc, properties=None):
+# Connection state ('disconnected', 'connecting', 'connected', 'reconnecting')
+# with transition metrics and listeners notified on every change
+connection_state = 'disconnected'
+connection_stats = {
+    'state': 'disconnected',
+    'since': None,
+    'connects': 0,
+    'disconnects': 0,
+    'failed_connects': 0,
+    'session_present': False,
+    'last_reason': None
+}
+connection_listeners = []
+
+# Commands waiting for an acknowledgement from the sensor Pi, by correlation id
+pending_commands = {}
+# Recent commands by correlation id, pending or completed, oldest first
+command_log = OrderedDict()
+pending_condition = threading.Condition()
+command_watchdog = None
+
+# Command round-trip statistics
+command_stats = {
+    'sent': 0,
+    'acknowledged': 0,
+    'retries': 0,
+    'timeouts': 0,
+    'last_latency_ms': None,
+    'avg_latency_ms': None
+}
+
+class PendingCommand:
+    """A published control command awaiting acknowledgement"""
+
+    def __init__(self, command_id, command, value, payload, devices=None):
+        self.id = command_id
+        self.command = command
+        self.value = value
+        self.payload = payload
+        self.targets = list(devices) if devices else None
+        # Devices that still have to acknowledge; None means any one device
+        self.devices = set(devices) if devices else None
+        self.attempts = 1
+        self.first_sent = time.monotonic()
+        self.deadline = self.first_sent + COMMAND_ACK_TIMEOUT
+        self.future = Future()
+        self.sent_at = datetime.now()
+        # 'pending', 'deferred' (received, waiting for the minimum on/off
+        # time), 'acknowledged' or 'timeout'
+        self.state = 'pending'
+        self.status = None
+        self.latency_ms = None
+        # Deferred actuators and the seconds they were held for
+        self.deferred = None
+    
+    @property
+    def actuators(self):
+        return tuple(self.value) if self.command == 'batch' else (self.command,)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'command': self.command,
+            'value': self.value,
+            'devices': self.targets,
+            'state': self.state,
+            'waiting_for': sorted(self.devices) if self.devices and self.state in ('pending', 'deferred') else None,
+            'attempts': self.attempts,
+            'sent_at': self.sent_at.isoformat(),
+            'latency_ms': self.latency_ms,
+            'deferred': self.deferred,
+            'status': self.status
+        }
+
+def add_connection_listener(callback):
+    """Register callback(old_state, new_state, reason) for connection state changes"""
+    connection_listeners.append(callback)
+
+def set_connection_state(state, reason=None):
+    """Record a connection state transition and notify listeners"""
+    global connection_state, is_connected
+    
+    previous = connection_state
+    connection_state = state
+    is_connected = state == 'connected'
+    connection_stats['state'] = state
+    connection_stats['since'] = datetime.now().isoformat()
+    connection_stats['last_reason'] = str(reason) if reason is not None else None
+    if previous == state:
+        return
+    
+    logger.info(f"MQTT connection state: {previous} -> {state}" + (f" ({reason})" if reason else ""))
+    for callback in list(connection_listeners):
+        try:
+            callback(previous, state, reason)
+        except Exception as e:
+            logger.error(f"Error in MQTT connection listener: {e}")
+
+def get_connection_stats():
+    """Return connection state metrics"""
+    if is_proxy():
+        return ipc_request({'op': 'stats'}).get('connection', {'state': 'unknown'})
+    return dict(connection_stats)
+
+def command_channel_available():
+    """True if control commands can currently be sent to the sensor Pi"""
+    # In proxy mode the ingest process owns the connection and reports failures
+    return is_proxy() or is_connected
+
+def on_connect(client, userdata, flags, reason_code, properties=None):
     """Called when the client connects to the broker"""
-    global is_connected
-    if rc == 0:
-        logger.info("Connected to MQTT broker")
-        is_connected = True
-        
-        # Subscribe to topics
-        client.subscribe(TOPIC_SENSOR_DATA)
-        client.subscribe(TOPIC_CONTROL_STATUS)
-        client.subscribe(TOPIC_SYSTEM_STATUS)
-    else:
-        logger.error(f"Failed to connect to MQTT broker with code {rc}")
-        is_connected = False
-
-def on_disconnect(client, userdata, rc):
+    if reason_code.is_failure:
+        logger.error(f"Failed to connect to MQTT broker: {reason_code}")
+        connection_stats['failed_connects'] += 1
+        set_connection_state('reconnecting', reason_code)
+        return
+    
+    logger.info("Connected to MQTT broker")
+    connection_stats['connects'] += 1
+    connection_stats['session_present'] = bool(flags.session_present)
+    set_connection_state('connected', reason_code)
+    
+    # (Re)subscribe on every connect; with a persistent session this is a
+    # no-op for the broker, without one it restores the subscriptions
+    client.subscribe([
+        (TOPIC_SENSOR_DATA, 1),
+        (f"{TOPIC_CHANNEL_PREFIX}/+/+", 1),
+        (f"{TOPIC_AGGREGATE_PREFIX}/+", 1),
+        (f"{TOPIC_BACKFILL_PREFIX}/+", 1),
+        (TOPIC_CONTROL_STATUS, 1),
+        (TOPIC_CONTROL_DECISIONS, 1),
+        (TOPIC_SYSTEM_STATUS, 1)
+    ])
+    
+    # Publish online status
+    online_payload = json.dumps({
+        'status': 'online',
+        'timestamp': datetime.now().isoformat()
+    })
+    client.publish(TOPIC_SYSTEM_STATUS, online_payload, qos=1, retain=True)
+    
+    # Refresh the retained rule set for the Sensor Pi's local control
+    try:
+        from hardware import app_context
+        from control_rules import publish_rules
+        
+        with app_context():
+            publish_rules()
+    except Exception as e:
+        logger.error(f"Error publishing control rules: {e}")
+
+def on_disconnect(client, userdata, flags, reason_code, properties=None):
     """Called when the client disconnects from the broker"""
-    global is_connected
-    logger.warning(f"Disconnected from MQTT broker with code {rc}")
-    is_connected = False
+    connection_stats['disconnects'] += 1
+    if connection_state == 'disconnected':
+        # Requested by disconnect_mqtt()
+        return
+    
+    logger.warning(f"Disconnected from MQTT broker: {reason_code} - reconnecting with backoff")
+    set_connection_state('reconnecting', reason_code)
 
 def on_message(client, userdata, msg):
     """Called when a message is received from the broker"""
@@ -60,9 +226,21 @@ def on_message(client, userdata, msg):
         if topic == TOPIC_SENSOR_DATA:
             # Process sensor data from the sensor Pi
             process_sensor_data(payload)
+        elif topic.startswith(TOPIC_CHANNEL_PREFIX + "/"):
+            # Process a single channel reading
+            process_channel_reading(topic, payload)
+        elif topic.startswith(TOPIC_AGGREGATE_PREFIX + "/"):
+            # Window aggregates from a Sensor Pi in edge mode
+            process_aggregate(topic, payload)
+        elif topic.startswith(TOPIC_BACKFILL_PREFIX + "/"):
+            # Raw samples answering a backfill request
+            process_backfill(topic, payload)
         elif topic == TOPIC_CONTROL_STATUS:
             # Process control status updates from the sensor Pi
             process_control_status(payload)
+        elif topic == TOPIC_CONTROL_DECISIONS:
+            # Decisions taken by the Sensor Pi's local control rules
+            process_control_decisions(payload)
         elif topic == TOPIC_SYSTEM_STATUS:
             # Process system status updates
             process_system_status(payload)
@@ -75,20 +253,66 @@ def process_sensor_data(data):
         # Import here to avoid circular imports
         from hardware import save_sensor_reading
         
-        # Format data for the database
+        # Format data for the database; missing values count as substituted
         sensor_data = {
             'temperature': data.get('temperature', 0.0),
             'humidity': data.get('humidity', 0.0),
             'light_level': data.get('light_level', 0.0),
             'soil_moisture': data.get('soil_moisture', 0.0)
         }
+        substituted = set(data.get('substituted') or ())
+        substituted.update(name for name in sensor_data if data.get(name) is None)
         
-        # Save to database
-        save_sensor_reading(sensor_data)
+        # Process and save to database
+        save_sensor_reading(sensor_data, substituted)
         logger.info(f"Saved sensor data from MQTT: {sensor_data}")
     except Exception as e:
         logger.error(f"Error saving sensor data from MQTT: {e}")
 
+def process_channel_reading(topic, data):
+    """Queue a channel reading received from MQTT for storage"""
+    try:
+        # Import here to avoid circular imports
+        from channel_store import process_channel_message
+        
+        device, channel = topic[len(TOPIC_CHANNEL_PREFIX) + 1:].split("/", 1)
+        process_channel_message(device, channel, data)
+    except Exception as e:
+        logger.error(f"Error processing channel reading from MQTT: {e}")
+
+def process_aggregate(topic, data):
+    """Store window aggregates received from MQTT"""
+    try:
+        # Import here to avoid circular imports
+        from channel_store import process_aggregate_message
+        
+        process_aggregate_message(topic[len(TOPIC_AGGREGATE_PREFIX) + 1:], data)
+    except Exception as e:
+        logger.error(f"Error processing aggregates from MQTT: {e}")
+
+def process_backfill(topic, data):
+    """Store backfilled raw samples received from MQTT"""
+    try:
+        # Import here to avoid circular imports
+        from channel_store import store_backfill
+        
+        store_backfill(topic[len(TOPIC_BACKFILL_PREFIX) + 1:], data)
+    except Exception as e:
+        logger.error(f"Error processing backfill from MQTT: {e}")
+
+def request_backfill(device, start, end, channels=None):
+    """
+    Ask a Sensor Pi in edge mode for the raw samples from start to end
+    (epoch milliseconds); returns the request id, or None if it could not
+    be sent
+    """
+    request_id = uuid.uuid4().hex
+    payload = {'id': request_id, 'device': device, 'start': start, 'end': end, 'channels': channels or None}
+    if not publish_message(TOPIC_BACKFILL_REQUEST, payload):
+        return None
+    logger.info(f"Requested backfill {request_id} of {device} from {start} to {end}")
+    return request_id
+
 def process_control_status(data):
     """Process control status updates received from MQTT"""
     try:
@@ -108,6 +332,106 @@ def process_control_status(data):
         logger.info(f"Updated control state from MQTT: {control_state}")
     except Exception as e:
         logger.error(f"Error updating control state from MQTT: {e}")
+    
+    # Resolve the commands this status acknowledges
+    for command_id in data.get('acks') or []:
+        acknowledge_command(command_id, data)
+
+def process_control_decisions(data):
+    """Store control decisions received from MQTT"""
+    try:
+        # Import here to avoid circular imports
+        from hardware import app_context
+        from control_rules import store_decisions
+        
+        with app_context():
+            store_decisions(data)
+        for decision in data.get('decisions') or []:
+            logger.info(f"{data.get('device')} switched {decision.get('actuator')} "
+                        f"{'ON' if decision.get('state') else 'OFF'}: {decision.get('reason')}")
+    except Exception as e:
+        logger.error(f"Error processing control decisions from MQTT: {e}")
+
+def acknowledge_command(command_id, status):
+    """Complete a pending command with the status that acknowledged it"""
+    with pending_condition:
+        pending = pending_commands.get(command_id)
+        if pending is None:
+            return
+        deferred = {name: seconds for name, seconds in (status.get('deferred') or {}).items()
+                    if name in pending.actuators}
+        if deferred:
+            # Received but not applied yet; the sensor Pi acknowledges it again
+            # once it is, so only retry after the hold
+            pending.state = 'deferred'
+            pending.deferred = deferred
+            pending.deadline = time.monotonic() + max(deferred.values()) + COMMAND_ACK_TIMEOUT
+            logger.info(f"Command {pending.command}={pending.value} deferred by {status.get('device')} "
+                        f"for {max(deferred.values())}s")
+            return
+        if pending.devices is not None:
+            # Addressed commands complete once every device has acknowledged
+            pending.devices.discard(status.get('device'))
+            if pending.devices:
+                return
+        del pending_commands[command_id]
+        latency_ms = (time.monotonic() - pending.first_sent) * 1000
+        pending.state = 'acknowledged'
+        pending.status = status
+        pending.latency_ms = round(latency_ms, 1)
+    
+    command_stats['acknowledged'] += 1
+    command_stats['last_latency_ms'] = round(latency_ms, 1)
+    previous = command_stats['avg_latency_ms']
+    command_stats['avg_latency_ms'] = round(latency_ms if previous is None else 0.8 * previous + 0.2 * latency_ms, 1)
+    logger.info(f"Command {pending.command}={pending.value} acknowledged in {latency_ms:.0f} ms "
+                f"after {pending.attempts} attempt(s)")
+    pending.future.set_result(status)
+
+def command_watchdog_loop():
+    """Retry unacknowledged commands and fail them once retries are exhausted"""
+    while True:
+        with pending_condition:
+            while not pending_commands:
+                pending_condition.wait()
+            
+            now = time.monotonic()
+            expired = [p for p in pending_commands.values() if p.deadline <= now]
+            for pending in expired:
+                if pending.attempts > COMMAND_RETRIES or not is_connected:
+                    del pending_commands[pending.id]
+                    pending.state = 'timeout'
+                    command_stats['timeouts'] += 1
+                    logger.warning(f"Command {pending.command}={pending.value} not acknowledged "
+                                   f"after {pending.attempts} attempt(s)")
+                    pending.future.set_exception(TimeoutError(f"No acknowledgement for {pending.command}"))
+                else:
+                    pending.attempts += 1
+                    pending.deadline = now + COMMAND_ACK_TIMEOUT
+                    command_stats['retries'] += 1
+                    logger.warning(f"Retrying command {pending.command}={pending.value} "
+                                   f"(attempt {pending.attempts})")
+                    mqtt_client.publish(TOPIC_CONTROL_COMMAND, pending.payload, qos=1)
+            
+            if pending_commands:
+                next_deadline = min(p.deadline for p in pending_commands.values())
+                pending_condition.wait(max(next_deadline - time.monotonic(), 0.0))
+
+def start_command_watchdog():
+    """Start the retry/timeout thread for pending commands if it is not running"""
+    global command_watchdog
+    if command_watchdog is None or not command_watchdog.is_alive():
+        command_watchdog = threading.Thread(target=command_watchdog_loop, daemon=True)
+        command_watchdog.start()
+
+def get_command_stats():
+    """Return command round-trip statistics and the number of pending commands"""
+    if is_proxy():
+        return ipc_request({'op': 'stats'}).get('commands', {})
+    
+    with pending_condition:
+        pending = len(pending_commands)
+    return {**command_stats, 'pending': pending}
 
 def process_system_status(data):
     """Process system status updates"""
@@ -115,28 +439,119 @@ def process_system_status(data):
         # Log system status
         logger.info(f"System status update: {data}")
         
-        # Could store in database for historical tracking
+        # Sensor Pis report their device name; raise/resolve offline alerts
+        if data.get('device'):
+            from alerts import get_alert_engine
+            get_alert_engine().on_status(data['device'], data.get('status'))
     except Exception as e:
         logger.error(f"Error processing system status: {e}")
 
-def send_control_command(command, value):
-    """Send a control command to the sensor Pi"""
+def dispatch_control_command(command, value, devices=None, hold=None):
+    """
+    Publish a control command with a correlation id and return a Future.
+
+    command is an actuator name with a boolean value, or 'batch' with an
+    {actuator: state} dict that the sensor Pi applies as one update. With
+    devices, only those sensor Pis apply the command and each of them has
+    to acknowledge it. With hold (seconds), the sensor Pis' local rules
+    leave the commanded actuators alone for that long.
+
+    The Future resolves with the sensor Pi's status payload once it
+    acknowledges the command (the last one's with devices), or fails with
+    TimeoutError after COMMAND_RETRIES unacknowledged retries. Returns None
+    if the command could not be sent.
+    """
+    pending = _publish_command(command, value, devices, hold)
+    return pending.future if pending is not None else None
+
+def _publish_command(command, value, devices=None, hold=None):
+    """Publish a control command and register it as pending; returns the PendingCommand or None"""
     if not is_connected or mqtt_client is None:
         logger.error("Cannot send control command - not connected to MQTT broker")
-        return False
+        return None
     
     try:
-        payload = json.dumps({
+        command_id = uuid.uuid4().hex
+        message = {
+            'id': command_id,
             'command': command,
             'value': value,
             'timestamp': datetime.now().isoformat()
-        })
+        }
+        if devices:
+            message['devices'] = list(devices)
+        if hold:
+            message['hold'] = hold
+        payload = json.dumps(message)
         
-        mqtt_client.publish(TOPIC_CONTROL_COMMAND, payload)
-        logger.info(f"Sent control command: {command}={value}")
-        return True
+        pending = PendingCommand(command_id, command, value, payload, devices)
+        with pending_condition:
+            pending_commands[command_id] = pending
+            command_log[command_id] = pending
+            while len(command_log) > COMMAND_HISTORY:
+                command_log.popitem(last=False)
+            pending_condition.notify()
+        start_command_watchdog()
+        
+        mqtt_client.publish(TOPIC_CONTROL_COMMAND, payload, qos=1)
+        command_stats['sent'] += 1
+        logger.info(f"Sent control command: {command}={value} ({command_id})")
+        return pending
     except Exception as e:
         logger.error(f"Error sending control command: {e}")
+        return None
+
+def send_control_command(command, value, devices=None, wait=COMMAND_WAIT, hold=None):
+    """
+    Send a control command to the sensor Pi(s) without blocking on the retries.
+
+    Returns the command (see get_command()) or None if it could not be
+    sent. With wait, the acknowledgement is awaited for up to that many
+    seconds, bounded by the first attempt; afterwards the command is
+    returned as pending and retried in the background. hold is passed on
+    as in dispatch_control_command().
+    """
+    if is_proxy():
+        return ipc_request({
+            'op': 'command', 'command': command, 'value': value, 'devices': devices, 'wait': wait, 'hold': hold
+        }).get('command')
+    
+    pending = _publish_command(command, value, devices, hold)
+    if pending is None:
+        return None
+    
+    if wait > 0:
+        try:
+            pending.future.result(timeout=min(wait, COMMAND_ACK_TIMEOUT))
+        except (FutureTimeout, TimeoutError):
+            logger.debug(f"Control command {command}={value} not acknowledged within {wait}s")
+    return get_command(pending.id)
+
+def get_command(command_id):
+    """A recent control command with its state and acknowledging status, or None"""
+    if is_proxy():
+        return ipc_request({'op': 'command_status', 'id': command_id}).get('command')
+    
+    with pending_condition:
+        pending = command_log.get(command_id)
+        return pending.to_dict() if pending is not None else None
+
+def publish_message(topic, payload, qos=1, retain=False):
+    """Publish a JSON payload on any topic, through the ingest process in proxy mode"""
+    if is_proxy():
+        return ipc_request({
+            'op': 'publish', 'topic': topic, 'payload': payload, 'qos': qos, 'retain': retain
+        }).get('published', False)
+    
+    if not is_connected or mqtt_client is None:
+        logger.error(f"Cannot publish to {topic} - not connected to MQTT broker")
+        return False
+    
+    try:
+        mqtt_client.publish(topic, json.dumps(payload), qos=qos, retain=retain)
+        return True
+    except Exception as e:
+        logger.error(f"Error publishing to {topic}: {e}")
         return False
 
 def send_fan_command(state):
@@ -152,12 +567,24 @@ def send_water_pump_command(state):
     return send_control_command('water_pump', state)
 
 def connect_mqtt():
-    """Connect to the MQTT broker"""
-    global mqtt_client, is_connected
+    """
+    Start the MQTT connection.
+
+    The client uses a persistent session (clean_session=False) so the broker
+    keeps subscriptions and queued QoS 1 messages across restarts, and paho's
+    network thread reconnects with exponential backoff between
+    MQTT_RECONNECT_MIN_DELAY and MQTT_RECONNECT_MAX_DELAY. Connection state
+    changes are reported through set_connection_state().
+    """
+    global mqtt_client
     
     try:
         # Create new MQTT client instance
-        mqtt_client = mqtt.Client(MQTT_CLIENT_ID)
+        mqtt_client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=MQTT_CLIENT_ID,
+            clean_session=False
+        )
         
         # Set callbacks
         mqtt_client.on_connect = on_connect
@@ -168,6 +595,11 @@ def connect_mqtt():
         if MQTT_USERNAME and MQTT_PASSWORD:
             mqtt_client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
         
+        # Flow control and reconnect backoff
+        mqtt_client.max_inflight_messages_set(MQTT_MAX_INFLIGHT)
+        mqtt_client.max_queued_messages_set(MQTT_MAX_QUEUED)
+        mqtt_client.reconnect_delay_set(min_delay=MQTT_RECONNECT_MIN_DELAY, max_delay=MQTT_RECONNECT_MAX_DELAY)
+        
         # Set will (testament) message
         will_payload = json.dumps({
             'status': 'offline',
@@ -175,41 +607,23 @@ def connect_mqtt():
         })
         mqtt_client.will_set(TOPIC_SYSTEM_STATUS, will_payload, qos=1, retain=True)
         
-        # Connect to broker
+        # Connect in the client's network thread, which keeps retrying
+        # (including the first attempt) until the broker is reachable
+        set_connection_state('connecting')
         mqtt_client.connect_async(MQTT_BROKER, MQTT_PORT, keepalive=60)
-        
-        # Start the client loop in a separate thread
         mqtt_client.loop_start()
         
-        # Wait for connection to establish
-        timeout = 5  # seconds
-        start_time = time.time()
-        while not is_connected and time.time() - start_time < timeout:
-            time.sleep(0.1)
-        
-        if is_connected:
-            # Publish online status
-            online_payload = json.dumps({
-                'status': 'online',
-                'timestamp': datetime.now().isoformat()
-            })
-            mqtt_client.publish(TOPIC_SYSTEM_STATUS, online_payload, qos=1, retain=True)
-            
-            logger.info("MQTT client started successfully")
-            return True
-        else:
-            logger.error("MQTT client failed to connect within timeout period")
-            mqtt_client.loop_stop()
-            return False
+        logger.info("MQTT client started")
+        return True
     except Exception as e:
         logger.error(f"Error connecting to MQTT broker: {e}")
+        set_connection_state('disconnected', e)
         if mqtt_client:
             mqtt_client.loop_stop()
         return False
 
 def disconnect_mqtt():
     """Disconnect from the MQTT broker"""
-    global mqtt_client, is_connected
     
     if mqtt_client:
         try:
@@ -221,14 +635,30 @@ def disconnect_mqtt():
             mqtt_client.publish(TOPIC_SYSTEM_STATUS, offline_payload, qos=1, retain=True)
             
             # Disconnect and stop loop
+            set_connection_state('disconnected', 'shutdown')
             mqtt_client.disconnect()
             mqtt_client.loop_stop()
-            is_connected = False
             logger.info("MQTT client stopped")
         except Exception as e:
             logger.error(f"Error disconnecting from MQTT broker: {e}")
+        
+        # Store channel readings still waiting for their batch
+        from channel_store import flush_channel_readings
+        flush_channel_readings()
 
 def initialize_mqtt():
-    """Initialize the MQTT client"""
-    # Connect in a separate thread to avoid blocking
-    threading.Thread(target=connect_mqtt, daemon=True).start()
\ No newline at end of file
+    """Initialize the MQTT client according to MQTT_MODE"""
+    if is_proxy():
+        # The ingest process owns the connection; commands go through IPC
+        logger.info("MQTT proxy mode - using the ingest process for MQTT")
+        return True
+    
+    # Channel readings are written in batches by a background thread
+    from channel_store import start_channel_writer
+    start_channel_writer()
+    
+    # connect_mqtt() does not block; the network thread handles (re)connecting
+    connected = connect_mqtt()
+    if MQTT_MODE == 'ingest':
+        start_ipc_server()
+    return connected
\ No newline at end of file
@@ -0,0 +1,99 @@
+import os
+import json
+import socket
+import logging
+import threading
+import socketserver
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# How the process takes part in MQTT:
+#   embedded - this process owns the MQTT connection (single-process setups)
+#   ingest   - dedicated ingest process: owns the connection and serves IPC
+#   proxy    - web worker: sends commands through the ingest process
+MQTT_MODE = os.environ.get("MQTT_MODE", "embedded")
+
+# Unix socket the ingest process listens on
+MQTT_IPC_SOCKET = os.environ.get("MQTT_IPC_SOCKET", "/tmp/growbox-mqtt.sock")
+MQTT_IPC_TIMEOUT = float(os.environ.get("MQTT_IPC_TIMEOUT", 15.0))  # seconds
+
+ipc_server = None
+
+def is_proxy():
+    """True when MQTT is owned by a separate ingest process"""
+    return MQTT_MODE == "proxy"
+
+def handle_request(request):
+    """Execute one IPC request inside the ingest process"""
+    import mqtt_client
+
+    op = request.get('op')
+    if op == 'command':
+        return {'command': mqtt_client.send_control_command(
+            request['command'], request['value'], request.get('devices'),
+            wait=request.get('wait', mqtt_client.COMMAND_WAIT), hold=request.get('hold')
+        )}
+    if op == 'command_status':
+        return {'command': mqtt_client.get_command(request['id'])}
+    if op == 'stats':
+        return {
+            'connection': mqtt_client.get_connection_stats(),
+            'commands': mqtt_client.get_command_stats()
+        }
+    if op == 'publish':
+        return {'published': mqtt_client.publish_message(
+            request['topic'], request['payload'], qos=request.get('qos', 1), retain=request.get('retain', False)
+        )}
+    return {'error': f"Unknown IPC operation: {op}"}
+
+class IPCRequestHandler(socketserver.StreamRequestHandler):
+    """Serve newline-delimited JSON requests from web workers"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = handle_request(json.loads(line))
+            except Exception as e:
+                logger.error(f"Error handling IPC request: {e}")
+                response = {'error': str(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+class IPCServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def start_ipc_server(path=MQTT_IPC_SOCKET):
+    """Start serving IPC requests on a Unix socket in a background thread"""
+    global ipc_server
+
+    if os.path.exists(path):
+        os.unlink(path)
+    ipc_server = IPCServer(path, IPCRequestHandler)
+    threading.Thread(target=ipc_server.serve_forever, daemon=True).start()
+    logger.info(f"MQTT IPC server listening on {path}")
+    return ipc_server
+
+def stop_ipc_server():
+    """Stop the IPC server and remove its socket"""
+    if ipc_server:
+        ipc_server.shutdown()
+        ipc_server.server_close()
+        if os.path.exists(ipc_server.server_address):
+            os.unlink(ipc_server.server_address)
+
+def ipc_request(request, timeout=MQTT_IPC_TIMEOUT, path=MQTT_IPC_SOCKET):
+    """Send a request to the ingest process and return its response"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile('rb') as reader:
+                line = reader.readline()
+        if not line:
+            raise ConnectionError("Empty IPC response")
+        return json.loads(line)
+    except Exception as e:
+        logger.error(f"Error calling MQTT ingest process: {e}")
+        return {'error': str(e)}
@@ -0,0 +1,215 @@
+"""
+Streaming processing of incoming sensor values.
+
+Every (device, channel) gets a ChannelProcessor that runs each raw sample
+through, in order:
+
+1. substitution check - values the Sensor Pi filled in with a default are
+   stored as they are, flagged, and kept out of the filter state
+2. calibration - piecewise-linear curve from raw to engineering units
+3. range check - physically impossible values are rejected
+4. Hampel filter - a sample further than k scaled MADs from the median of
+   the last `window` raw samples is replaced by that median
+5. EWMA smoothing with factor `alpha` (1.0 disables it)
+
+Each step costs O(window) with a small constant window, so processing is
+O(1) per sample and the state per channel has constant size. The result
+is the stored value and a bit mask of QUALITY_* flags.
+
+Per-channel settings come from PROCESSING_CONFIG (JSON, default
+processing.json) merged over DEFAULT_CHANNEL_CONFIG:
+
+    {"soil_2.moisture": {"curve": [[9000, 100], [21000, 0]], "ewma": 0.3},
+     "co2.co2": {"range": [0, 5000], "hampel": {"window": 5, "k": 3}}}
+"""
+
+import os
+import json
+import logging
+import threading
+from bisect import bisect_right
+from collections import deque
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Quality flags stored with every sample (0 = good)
+QUALITY_OK = 0
+QUALITY_SUBSTITUTED = 1   # default value filled in by the Sensor Pi
+QUALITY_OUTLIER = 2       # rejected by the Hampel filter, replaced by the median
+QUALITY_OUT_OF_RANGE = 4  # outside the physical range, replaced by the last good value
+QUALITY_NO_DATA = 8       # no good value yet to replace a rejected sample with
+QUALITY_AGGREGATED = 16   # mean of an edge aggregation window (narrow samples only)
+
+QUALITY_NAMES = {
+    QUALITY_SUBSTITUTED: 'substituted',
+    QUALITY_OUTLIER: 'outlier',
+    QUALITY_OUT_OF_RANGE: 'out_of_range',
+    QUALITY_NO_DATA: 'no_data',
+    QUALITY_AGGREGATED: 'aggregated'
+}
+
+# Bits per metric when flags of several metrics share one column (the
+# combined readings never carry QUALITY_AGGREGATED)
+QUALITY_BITS = 4
+
+PROCESSING_CONFIG = os.environ.get(
+    "PROCESSING_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "processing.json")
+)
+
+# Defaults applied to every channel
+DEFAULT_SETTINGS = {
+    'curve': None,
+    'range': None,
+    'hampel': {'window': 7, 'k': 3.0, 'min_deviation': 0.0},
+    'ewma': 1.0
+}
+
+# Settings for the standard channels; a DHT22 produces occasional spikes
+DEFAULT_CHANNEL_CONFIG = {
+    'temperature': {'range': [-40.0, 80.0], 'hampel': {'window': 7, 'k': 3.0, 'min_deviation': 0.5}, 'ewma': 0.5},
+    'humidity': {'range': [0.0, 100.0], 'hampel': {'window': 7, 'k': 3.0, 'min_deviation': 2.0}, 'ewma': 0.5},
+    'light_level': {'range': [0.0, 100000.0], 'hampel': None},
+    'soil_moisture': {'range': [0.0, 100.0], 'hampel': {'window': 5, 'k': 3.0, 'min_deviation': 2.0}, 'ewma': 0.3},
+    'co2': {'range': [0.0, 10000.0], 'hampel': {'window': 5, 'k': 3.0, 'min_deviation': 50.0}},
+}
+
+# Driver measurement names share the settings of the standard channels
+DEFAULT_CHANNEL_CONFIG['light'] = DEFAULT_CHANNEL_CONFIG['light_level']
+DEFAULT_CHANNEL_CONFIG['moisture'] = DEFAULT_CHANNEL_CONFIG['soil_moisture']
+
+# Scale factor making the MAD a consistent estimator of the standard deviation
+MAD_SCALE = 1.4826
+
+def _median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2.0
+
+def apply_curve(points, value):
+    """Map a raw value through a piecewise-linear curve of sorted (raw, calibrated) points"""
+    if not points:
+        return value
+    if len(points) == 1:
+        # A single point is an offset
+        return value - points[0][0] + points[0][1]
+    # Interpolate between neighbours, extrapolate from the end segments
+    i = min(max(bisect_right([x for x, _ in points], value), 1), len(points) - 1)
+    (x0, y0), (x1, y1) = points[i - 1], points[i]
+    if x1 == x0:
+        return float(y0)
+    return y0 + (value - x0) * (y1 - y0) / (x1 - x0)
+
+class ChannelProcessor:
+    """Calibration, outlier rejection and smoothing state of one channel"""
+
+    def __init__(self, settings):
+        self.curve = sorted(settings.get('curve') or [])
+        self.range = settings.get('range')
+        hampel = settings.get('hampel')
+        self.hampel = dict(DEFAULT_SETTINGS['hampel'], **hampel) if hampel else None
+        self.alpha = float(settings.get('ewma') or 1.0)
+        self.window = deque(maxlen=int(self.hampel['window'])) if self.hampel else None
+        self.smoothed = None
+        self.last_good = None
+
+    def process(self, raw, substituted=False):
+        """Return (value, quality flags) for one raw sample"""
+        if substituted:
+            return raw, QUALITY_SUBSTITUTED
+
+        value = apply_curve(self.curve, raw)
+        quality = QUALITY_OK
+
+        if self.range and not self.range[0] <= value <= self.range[1]:
+            if self.last_good is None:
+                return value, QUALITY_OUT_OF_RANGE | QUALITY_NO_DATA
+            return self.last_good, QUALITY_OUT_OF_RANGE
+
+        if self.window is not None:
+            # Compare with the previous samples only, then remember the raw
+            # value so a genuine step change is accepted after a few samples
+            if len(self.window) == self.window.maxlen:
+                median = _median(self.window)
+                mad = MAD_SCALE * _median([abs(x - median) for x in self.window])
+                threshold = max(self.hampel['k'] * mad, self.hampel['min_deviation'])
+                # A constant window (MAD 0) without a minimum deviation cannot judge outliers
+                if threshold > 0 and abs(value - median) > threshold:
+                    quality |= QUALITY_OUTLIER
+                    self.window.append(value)
+                    value = median
+                else:
+                    self.window.append(value)
+            else:
+                self.window.append(value)
+
+        if quality == QUALITY_OK:
+            self.last_good = value
+
+        self.smoothed = value if self.smoothed is None else self.alpha * value + (1.0 - self.alpha) * self.smoothed
+        return self.smoothed, quality
+
+def load_channel_config(path=PROCESSING_CONFIG):
+    """Per-channel settings from the processing config file merged over the defaults"""
+    config = {name: dict(settings) for name, settings in DEFAULT_CHANNEL_CONFIG.items()}
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                for name, settings in json.load(f).items():
+                    config.setdefault(name, {}).update(settings)
+        except Exception as e:
+            logger.error(f"Error loading processing config {path}: {e}")
+    return config
+
+channel_config = load_channel_config()
+processors = {}
+processors_lock = threading.Lock()
+
+def get_processor(device, channel):
+    """Processor of a (device, channel), created on first use"""
+    key = (device, channel)
+    processor = processors.get(key)
+    if processor is None:
+        # "<sensor>.<measurement>" channels fall back to the measurement's settings
+        config = channel_config.get(channel) or channel_config.get(channel.rsplit('.', 1)[-1], {})
+        settings = dict(DEFAULT_SETTINGS, **config)
+        processor = processors[key] = ChannelProcessor(settings)
+    return processor
+
+def process_value(device, channel, raw, substituted=False):
+    """Run one raw sample through its channel's pipeline; return (value, quality)"""
+    with processors_lock:
+        value, quality = get_processor(device, channel).process(float(raw), substituted)
+    return round(value, 2), quality
+
+def process_reading(device, sensor_data, substituted=()):
+    """
+    Process a wide reading dict; return (processed dict, flags per metric).
+
+    substituted lists the metrics the Sensor Pi filled in with a default.
+    """
+    processed, flags = {}, {}
+    for metric, raw in sensor_data.items():
+        if raw is None:
+            processed[metric] = None
+            continue
+        processed[metric], flags[metric] = process_value(device, metric, raw, metric in substituted)
+    return processed, flags
+
+def pack_quality(flags, metrics):
+    """Pack per-metric flags into one integer, QUALITY_BITS per metric in metrics order"""
+    packed = 0
+    for i, metric in enumerate(metrics):
+        packed |= flags.get(metric, QUALITY_OK) << (i * QUALITY_BITS)
+    return packed
+
+def unpack_quality(packed, metrics):
+    """Per-metric flags from a packed quality value"""
+    mask = (1 << QUALITY_BITS) - 1
+    return {metric: (packed >> (i * QUALITY_BITS)) & mask for i, metric in enumerate(metrics)}
+
+def quality_names(flags):
+    """Names of the quality flags set in a bit mask"""
+    return [name for bit, name in QUALITY_NAMES.items() if flags & bit]
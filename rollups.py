@@ -0,0 +1,215 @@
+"""
+One-minute rollup tier behind the aggregation API.
+
+metric_rollups holds count, sum, sum of squares, min and max per (metric,
+device, minute), built from the narrow metric_samples table and, for the
+legacy device, from the sensor_readings rows recorded before its first
+narrow sample (the same split the metric API uses). Minutes a Sensor Pi
+in edge mode has only sent window aggregates for are taken from
+edge_aggregates, each window counted in its first minute. Substituted
+values and the window means stored as samples are left out. Rollups are
+recomputed from the raw rows for the minutes and the (device, metric)
+series a write touches: the channel writer and the legacy reading path
+after each insert, the importer for the imported time range, and a full
+rebuild at startup when the table is still empty (or with `flask
+rebuild-rollups`). Rows are written with an upsert, so writers rebuilding
+the same minutes concurrently do not collide on the primary key.
+"""
+
+import time
+import logging
+import click
+from sqlalchemy import select, delete, insert, func, literal, and_, or_
+from models import db, SensorReading, Device, Metric, MetricSample, MetricRollup, EdgeAggregate
+from processing import QUALITY_SUBSTITUTED, QUALITY_AGGREGATED
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+MINUTE_MS = 60000
+
+ROLLUP_COLUMNS = ('metric_id', 'device_id', 'minute', 'count', 'sum', 'sumsq', 'min', 'max')
+
+def _upsert(query):
+    """INSERT ... SELECT into metric_rollups replacing existing rows of the same minute"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        statement = pg_insert(MetricRollup).from_select(ROLLUP_COLUMNS, query)
+        return statement.on_conflict_do_update(
+            index_elements=ROLLUP_COLUMNS[:3],
+            set_={column: statement.excluded[column] for column in ROLLUP_COLUMNS[3:]}
+        )
+    statement = insert(MetricRollup).from_select(ROLLUP_COLUMNS, query)
+    if dialect == 'sqlite':
+        statement = statement.prefix_with('OR REPLACE')
+    return statement
+
+def _series_filter(device_column, metric_column, series):
+    """Condition matching (device id, metric id or None for all metrics) pairs"""
+    return or_(*(device_column == device_id if metric_id is None
+                 else and_(device_column == device_id, metric_column == metric_id)
+                 for device_id, metric_id in series))
+
+def _narrow_rollups(first_minute, last_minute, series=None):
+    """INSERT ... SELECT of the narrow samples of a minute range"""
+    minute = MetricSample.ts // MINUTE_MS
+    query = (
+        select(MetricSample.metric_id, MetricSample.device_id, minute, func.count(),
+               func.sum(MetricSample.value), func.sum(MetricSample.value * MetricSample.value),
+               func.min(MetricSample.value), func.max(MetricSample.value))
+        .where(MetricSample.quality.op('&')(QUALITY_SUBSTITUTED | QUALITY_AGGREGATED) == 0)
+        .group_by(MetricSample.metric_id, MetricSample.device_id, minute)
+    )
+    if first_minute is not None:
+        query = query.where(MetricSample.ts >= first_minute * MINUTE_MS)
+    if last_minute is not None:
+        query = query.where(MetricSample.ts < (last_minute + 1) * MINUTE_MS)
+    if series is not None:
+        query = query.where(_series_filter(MetricSample.device_id, MetricSample.metric_id, series))
+    return _upsert(query)
+
+def _edge_rollups(first_minute, last_minute, series=None):
+    """INSERT ... SELECT of the edge aggregates of a minute range whose window has no raw samples"""
+    raw = (
+        select(MetricSample.ts)
+        .where(MetricSample.metric_id == EdgeAggregate.metric_id,
+               MetricSample.device_id == EdgeAggregate.device_id,
+               MetricSample.ts >= EdgeAggregate.start,
+               MetricSample.ts < EdgeAggregate.start + EdgeAggregate.interval * 1000,
+               MetricSample.quality.op('&')(QUALITY_SUBSTITUTED | QUALITY_AGGREGATED) == 0)
+        .exists()
+    )
+    query = (
+        select(EdgeAggregate.metric_id, EdgeAggregate.device_id, EdgeAggregate.start // MINUTE_MS,
+               EdgeAggregate.count, EdgeAggregate.sum, EdgeAggregate.sumsq,
+               EdgeAggregate.min, EdgeAggregate.max)
+        .where(~raw)
+    )
+    if first_minute is not None:
+        query = query.where(EdgeAggregate.start >= first_minute * MINUTE_MS)
+    if last_minute is not None:
+        query = query.where(EdgeAggregate.start < (last_minute + 1) * MINUTE_MS)
+    if series is not None:
+        query = query.where(_series_filter(EdgeAggregate.device_id, EdgeAggregate.metric_id, series))
+    return _upsert(query)
+
+def _wide_rollups(metric, first_minute, last_minute):
+    """INSERT ... SELECT of one wide metric of the legacy device, or None if it has no rows to add"""
+    # Import here to avoid circular imports
+    from channel_store import resolve_id, device_ids, metric_ids
+    from sensor_data import LEGACY_DEVICE, epoch_seconds, _wide_quality, _ms_to_datetime
+
+    metric_id = resolve_id(Metric, metric_ids, metric)
+    device_id = resolve_id(Device, device_ids, LEGACY_DEVICE)
+
+    # Wide rows only count before the minute of the first narrow sample
+    first_narrow = db.session.execute(
+        select(func.min(MetricSample.ts))
+        .where(MetricSample.metric_id == metric_id, MetricSample.device_id == device_id)
+    ).scalar()
+    end_minute = last_minute
+    if first_narrow is not None:
+        cutoff = first_narrow // MINUTE_MS - 1
+        end_minute = cutoff if end_minute is None else min(end_minute, cutoff)
+    if first_minute is not None and end_minute is not None and end_minute < first_minute:
+        return None
+
+    column = getattr(SensorReading, metric)
+    minute = epoch_seconds(SensorReading.timestamp) // 60
+    query = (
+        select(literal(metric_id), literal(device_id), minute, func.count(column),
+               func.sum(column), func.sum(column * column), func.min(column), func.max(column))
+        .where(column.isnot(None), _wide_quality(metric).op('&')(QUALITY_SUBSTITUTED) == 0)
+        .group_by(minute)
+    )
+    if first_minute is not None:
+        query = query.where(SensorReading.timestamp >= _ms_to_datetime(first_minute * MINUTE_MS))
+    if end_minute is not None:
+        query = query.where(SensorReading.timestamp < _ms_to_datetime((end_minute + 1) * MINUTE_MS))
+    return _upsert(query)
+
+def rebuild_rollups(start_ms=None, end_ms=None, series=None):
+    """
+    Recompute the rollups of the minutes from start_ms to end_ms (epoch
+    milliseconds, None = unbounded) in the current transaction; the caller
+    commits. series limits the rebuild to (device, metric) name pairs, with
+    metric None for every metric of the device; None rebuilds all series.
+    """
+    from channel_store import resolve_id, device_ids, metric_ids
+    from sensor_data import METRICS, LEGACY_DEVICE
+
+    first_minute = start_ms // MINUTE_MS if start_ms is not None else None
+    last_minute = end_ms // MINUTE_MS if end_ms is not None else None
+    wide = METRICS
+    if series is not None:
+        series = set(series)
+        if not series:
+            return
+        wide = [metric for metric in METRICS if (LEGACY_DEVICE, None) in series or (LEGACY_DEVICE, metric) in series]
+        series = [(resolve_id(Device, device_ids, device),
+                   resolve_id(Metric, metric_ids, metric) if metric is not None else None)
+                  for device, metric in series]
+
+    statement = delete(MetricRollup)
+    if first_minute is not None:
+        statement = statement.where(MetricRollup.minute >= first_minute)
+    if last_minute is not None:
+        statement = statement.where(MetricRollup.minute <= last_minute)
+    if series is not None:
+        statement = statement.where(_series_filter(MetricRollup.device_id, MetricRollup.metric_id, series))
+    db.session.execute(statement)
+
+    db.session.execute(_narrow_rollups(first_minute, last_minute, series))
+    db.session.execute(_edge_rollups(first_minute, last_minute, series))
+    for metric in wide:
+        statement = _wide_rollups(metric, first_minute, last_minute)
+        if statement is not None:
+            db.session.execute(statement)
+
+def _rollback():
+    from channel_store import device_ids, metric_ids
+
+    db.session.rollback()
+    # Ids created in the failed transaction were rolled back
+    device_ids.clear()
+    metric_ids.clear()
+
+def update_rollups(start_ms, end_ms, series=None):
+    """Recompute and commit the rollups of a time range after new raw data was written"""
+    try:
+        rebuild_rollups(start_ms, end_ms, series)
+        db.session.commit()
+    except Exception as e:
+        _rollback()
+        logger.error(f"Error updating metric rollups: {e}")
+
+def backfill_rollups():
+    """Build all rollups when the rollup table is empty but raw data exists"""
+    try:
+        if db.session.execute(select(MetricRollup.minute).limit(1)).first():
+            return
+        has_data = (db.session.execute(select(MetricSample.ts).limit(1)).first()
+                    or db.session.execute(select(SensorReading.id).limit(1)).first()
+                    or db.session.execute(select(EdgeAggregate.start).limit(1)).first())
+        if not has_data:
+            return
+        started = time.perf_counter()
+        rebuild_rollups()
+        db.session.commit()
+        logger.info(f"Built metric rollups in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        _rollback()
+        logger.error(f"Error building metric rollups: {e}")
+
+def register_rollup_commands(app):
+    """Register rollup maintenance commands with the Flask CLI"""
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Recompute all one-minute metric rollups from the raw data"""
+        started = time.perf_counter()
+        rebuild_rollups()
+        db.session.commit()
+        count = db.session.execute(select(func.count()).select_from(MetricRollup)).scalar()
+        click.echo(f"Rebuilt {count} rollups in {time.perf_counter() - started:.1f}s")
@@ -1,9 +1,9 @@
 import logging
 from flask import render_template, request, redirect, url_for, flash, jsonify
-from app import app
 from hardware import control_fan, control_light, control_water_pump, get_current_control_state
-from sensor_data import get_latest_reading, get_readings_time_range, get_hourly_average, get_daily_min_max
+from sensor_data import get_latest_reading
 from data_storage import get_all_settings, update_setting, export_settings, import_settings
+from control_rules import publish_rules
 from models import ControlState
 
 # Setup logging
@@ -74,6 +74,7 @@ def register_routes(app):
             # Update settings from form
             for key in request.form:
                 update_setting(key, request.form[key])
+            publish_rules()
             
             flash('Settings updated successfully', 'success')
             return redirect(url_for('settings'))
@@ -85,27 +86,17 @@ def register_routes(app):
     
     @app.route('/history')
     def history():
-        """History page for viewing historical sensor data"""
+        """History page; the charts load their data from /api/sensors/charts"""
         # Get latest readings
         latest = get_latest_reading()
         
         # Default to 24 hours of data
-        time_range = request.args.get('range', '24')
-        try:
-            hours = int(time_range)
-        except ValueError:
-            hours = 24
-        
-        # Get hourly average data for charts
-        hourly_data = get_hourly_average(hours)
-        
-        # Get daily min/max for longer ranges
-        daily_data = get_daily_min_max(7)  # Last week
+        time_range = request.args.get('range', '24h')
+        if time_range not in ('12h', '24h', '48h', '7d'):
+            time_range = '24h'
         
         return render_template('history.html', 
                               latest=latest,
-                              hourly_data=hourly_data,
-                              daily_data=daily_data,
                               selected_range=time_range)
     
     @app.errorhandler(404)
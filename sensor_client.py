@@ -5,45 +5,50 @@ OpenGrow-Box Sensor Client
 This script runs on the Sensor Raspberry Pi to collect data from the 
 connected sensors and send it to the Dashboard Pi via MQTT.
 
-Hardware connections:
+Sensors are configured in sensors.json (see sensor_drivers.py); without it
+the default box is used:
 - DHT22: GPIO4 (temperature/humidity)
 - BH1750: I2C (SDA/SCL) (light intensity)
 - Capacitive Soil Moisture: GPIO17
 - Relay module for fan/light/water pump controls
+
+The automation rules received from the dashboard are evaluated locally
+after every sample (see edge_control.py).
 """
 
 import os
 import time
 import json
+import asyncio
 import logging
 import signal
 import threading
-import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("sensor_client.log"),
-        logging.StreamHandler()
-    ]
-)
+from simulation import GreenhouseSimulator
+from sensor_drivers import DEFAULT_INTERVAL, DEFAULT_MAX_SILENCE, load_config, create_drivers
+from edge_store import RingStore, WindowAggregator
+from edge_control import LocalRules, load_rules, save_rules
+from gpio_backend import MockGPIO, create_backend
+
 logger = logging.getLogger("sensor_client")
 
-# Import sensor libraries
+# GPIO backend for the relays and digital inputs (sensor libraries are
+# loaded by their drivers); without a GPIO library the pins are in memory
+gpio = create_backend()
+SIMULATION_MODE = gpio.simulated
+if SIMULATION_MODE:
+    logger.warning("Running in simulation mode with simulated sensor data")
+else:
+    logger.info("Running in hardware mode with real sensors")
+
+# MQTT is needed in simulation mode too, so import it separately
 try:
-    import RPi.GPIO as GPIO
-    import Adafruit_DHT
-    from smbus2 import SMBus
     import paho.mqtt.client as mqtt
-    SIMULATION_MODE = False
-    logger.info("Running in hardware mode with real sensors")
-except ImportError as e:
-    logger.warning(f"Error importing hardware libraries: {e}")
-    logger.warning("Running in simulation mode with simulated sensor data")
-    SIMULATION_MODE = True
+except ImportError:
+    mqtt = None
+    logger.error("paho-mqtt not found - sensor data cannot be sent to the dashboard")
 
 # MQTT Configuration
 MQTT_BROKER = os.environ.get("MQTT_BROKER", "192.168.1.100")  # Dashboard Pi IP
@@ -52,278 +57,596 @@ MQTT_USERNAME = os.environ.get("MQTT_USERNAME", None)
 MQTT_PASSWORD = os.environ.get("MQTT_PASSWORD", None)
 MQTT_CLIENT_ID = os.environ.get("MQTT_CLIENT_ID", "sensor-pi")
 
+# Session and flow control tuning
+MQTT_RECONNECT_MIN_DELAY = int(os.environ.get("MQTT_RECONNECT_MIN_DELAY", 1))    # seconds
+MQTT_RECONNECT_MAX_DELAY = int(os.environ.get("MQTT_RECONNECT_MAX_DELAY", 120))  # seconds
+MQTT_MAX_INFLIGHT = int(os.environ.get("MQTT_MAX_INFLIGHT", 20))
+MQTT_MAX_QUEUED = int(os.environ.get("MQTT_MAX_QUEUED", 1000))
+
 # MQTT Topics
 TOPIC_SENSOR_DATA = "opengrow/sensors/data"
+TOPIC_CHANNEL_PREFIX = "opengrow/sensors/channels"  # /<device>/<channel>
 TOPIC_CONTROL_COMMAND = "opengrow/control/command"
 TOPIC_CONTROL_STATUS = "opengrow/control/status"
 TOPIC_SYSTEM_STATUS = "opengrow/system/status"
+TOPIC_AGGREGATE_PREFIX = "opengrow/sensors/aggregates"  # /<device>
+TOPIC_BACKFILL_REQUEST = "opengrow/sensors/backfill/request"
+TOPIC_BACKFILL_PREFIX = "opengrow/sensors/backfill/data"  # /<device>
+TOPIC_CONTROL_RULES = "opengrow/control/rules"
+TOPIC_CONTROL_DECISIONS = "opengrow/control/decisions"
 
 # GPIO Pin definitions based on user's equipment
-# Sensor connections
-DHT_SENSOR_PIN = 4  # DHT22 on GPIO4
-# BH1750 uses I2C (SDA/SCL) - no specific GPIO pin needed
-SOIL_MOISTURE_PIN = 17  # Capacitive soil moisture on GPIO17
-
 # Actuator connections through relay module
 FAN_PIN = 18  # Example relay pin for fan
 LIGHT_PIN = 23  # Example relay pin for grow lights
 WATER_PUMP_PIN = 24  # Example relay pin for water pump
 
-# BH1750 I2C address
-BH1750_ADDR = 0x23
+# Relay pin for each actuator
+ACTUATOR_PINS = {
+    'fan': FAN_PIN,
+    'light': LIGHT_PIN,
+    'water_pump': WATER_PUMP_PIN
+}
+
+# Commands arriving within this window (seconds) are coalesced per actuator
+COMMAND_WINDOW = float(os.environ.get("COMMAND_WINDOW", 0.25))
+
+# Minimum (on, off) time in seconds before a relay may switch again
+ACTUATOR_MIN_TIMES = {
+    'fan': (10.0, 10.0),
+    'light': (60.0, 60.0),
+    'water_pump': (5.0, 30.0)
+}
+
+# Seconds between legacy sensor data reports; sub-second values are fine
+SENSOR_INTERVAL = DEFAULT_INTERVAL
+
+# Channels combined into the legacy opengrow/sensors/data message, with the
+# value used when a channel has no reading
+LEGACY_CHANNELS = {
+    'temperature': 20.0,
+    'humidity': 50.0,
+    'light_level': 500.0,
+    'soil_moisture': 50.0
+}
+
+# Edge mode: publish EDGE_AGGREGATE-second aggregates (a multiple of a
+# minute, 0 = publish every sample) and keep the raw samples of the last
+# EDGE_RETENTION hours in EDGE_STORE for backfill requests
+EDGE_AGGREGATE = int(float(os.environ.get("EDGE_AGGREGATE", 0)))
+EDGE_RETENTION = float(os.environ.get("EDGE_RETENTION", 72))  # hours
+EDGE_STORE = os.environ.get(
+    "EDGE_STORE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "edge_samples.db")
+)
+EDGE_BACKFILL_CHUNK = 500  # samples per backfill message
+
+# Evaluate the control rule set received from the dashboard locally (opt-in,
+# like GROWBOX_AUTOMATION on the dashboard)
+LOCAL_RULES = os.environ.get("LOCAL_RULES", "0").strip().lower() in ('1', 'true', 'yes', 'on')
+# Last control rule set received from the dashboard
+RULES_CACHE = os.environ.get(
+    "RULES_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "control_rules.json")
+)
+RULES_INTERVAL = 1.0  # seconds between evaluations of the time-based rules
 
-# DHT sensor type
-DHT_SENSOR_TYPE = Adafruit_DHT.DHT22 if not SIMULATION_MODE else None
+# Worker threads for blocking sensor drivers (kept small for a Pi Zero)
+SENSOR_WORKERS = int(os.environ.get("SENSOR_WORKERS", 2))
+
+# Simulated grow box used in simulation mode; seed it for reproducible runs
+SIMULATION_SEED = os.environ.get("SIMULATION_SEED")
+simulator = GreenhouseSimulator(seed=int(SIMULATION_SEED) if SIMULATION_SEED else None)
 
 # Global variables
-mqtt_client = None
-is_connected = False
-running = True
+device_id = MQTT_CLIENT_ID
+drivers = []
+mqtt_connection = None
+sensor_executor = None
+ring_store = None
+aggregator = None
+connection_stats = {
+    'state': 'disconnected',
+    'connects': 0,
+    'disconnects': 0,
+    'failed_connects': 0
+}
 control_state = {
     'fan': False,
     'light': False,
     'water_pump': False
 }
 
+# Most recent value of each channel, updated by the sensor tasks
+latest_readings = {}
+
+# Samples in a row without a change before a sensor returns from its fast
+# interval to its normal one
+SETTLE_SAMPLES = 3
+
+class ExceptionReporter:
+    """
+    Report-by-exception state: the last reported value of each channel.
+
+    A value is due when it moved by more than the channel's deadband since
+    it was last reported, or when the channel has been silent for its
+    max_silence (heartbeat), so the dashboard can tell an unchanged value
+    from a lost sensor.
+    """
+
+    def __init__(self):
+        # channel -> (monotonic time, value) of the last report
+        self.last = {}
+
+    def changed(self, channel, value, deadband):
+        last = self.last.get(channel)
+        return last is None or abs(value - last[1]) > deadband
+
+    def due(self, channel, value, deadband, max_silence, now):
+        last = self.last.get(channel)
+        return self.changed(channel, value, deadband) or now - last[0] >= max_silence
+
+    def reported(self, channel, value, now):
+        self.last[channel] = (now, value)
+
+channel_reporter = ExceptionReporter()
+legacy_reporter = ExceptionReporter()
+last_legacy_report = None
+
+# Samples without a change per sensor, for the adaptive sampling interval
+calm_samples = {}
+
+# Local control rules and the last decision reported per actuator
+local_rules = LocalRules()
+reported_decisions = {}
+# Actuators the local rules leave alone until a time.monotonic() deadline,
+# set by commands with a hold (e.g. scenes)
+rule_holds = {}
+
 def initialize_hardware():
-    """Initialize GPIO and sensors"""
-    if SIMULATION_MODE:
-        logger.info("Initializing in simulation mode")
-        return
+    """Set up the relay outputs, initially OFF"""
+    global SIMULATION_MODE, gpio
     
-    try:
-        # Set GPIO mode
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
-        
-        # Setup output pins for relays
-        GPIO.setup(FAN_PIN, GPIO.OUT)
-        GPIO.setup(LIGHT_PIN, GPIO.OUT)
-        GPIO.setup(WATER_PUMP_PIN, GPIO.OUT)
-        
-        # Setup input pin for soil moisture
-        GPIO.setup(SOIL_MOISTURE_PIN, GPIO.IN)
-        
-        # Initialize outputs to OFF
-        GPIO.output(FAN_PIN, GPIO.LOW)
-        GPIO.output(LIGHT_PIN, GPIO.LOW)
-        GPIO.output(WATER_PUMP_PIN, GPIO.LOW)
-        
-        logger.info("Hardware initialized successfully")
-    except Exception as e:
-        logger.error(f"Error initializing hardware: {e}")
-        logger.warning("Falling back to simulation mode")
-        global SIMULATION_MODE
-        SIMULATION_MODE = True
+    if not SIMULATION_MODE:
+        try:
+            for pin in ACTUATOR_PINS.values():
+                gpio.setup_output(pin, False)
+            logger.info("Hardware initialized successfully")
+            return
+        except Exception as e:
+            logger.error(f"Error initializing hardware: {e}")
+            logger.warning("Falling back to simulation mode")
+            SIMULATION_MODE = True
+            gpio = MockGPIO()
+    
+    logger.info("Initializing in simulation mode")
+    for pin in ACTUATOR_PINS.values():
+        gpio.setup_output(pin, False)
 
-def cleanup():
+async def cleanup():
     """Clean up GPIO and MQTT connections on exit"""
     logger.info("Cleaning up resources...")
     
-    # Disconnect MQTT
-    if mqtt_client:
+    # Send offline status and disconnect MQTT
+    if mqtt_connection:
         try:
-            # Send offline status
-            offline_payload = json.dumps({
-                'status': 'offline',
-                'timestamp': datetime.now().isoformat()
-            })
-            mqtt_client.publish(TOPIC_SYSTEM_STATUS, offline_payload, qos=1, retain=True)
-            mqtt_client.disconnect()
-            mqtt_client.loop_stop()
+            await mqtt_connection.close()
         except Exception as e:
             logger.error(f"Error disconnecting MQTT: {e}")
     
-    # Clean up GPIO
-    if not SIMULATION_MODE:
-        try:
-            # Turn off all actuators
-            GPIO.output(FAN_PIN, GPIO.LOW)
-            GPIO.output(LIGHT_PIN, GPIO.LOW)
-            GPIO.output(WATER_PUMP_PIN, GPIO.LOW)
-            GPIO.cleanup()
-        except Exception as e:
-            logger.error(f"Error cleaning up GPIO: {e}")
+    # Turn off all actuators and release the pins
+    try:
+        gpio.write({pin: False for pin in ACTUATOR_PINS.values()})
+        gpio.cleanup()
+    except Exception as e:
+        logger.error(f"Error cleaning up GPIO: {e}")
+    
+    if sensor_executor:
+        sensor_executor.shutdown(wait=False)
+    
+    if ring_store is not None:
+        ring_store.close()
     
     logger.info("Cleanup complete")
 
-def read_dht22():
-    """Read temperature and humidity from DHT22 sensor"""
-    if SIMULATION_MODE:
-        temperature = round(random.uniform(18.0, 30.0), 1)
-        humidity = round(random.uniform(30.0, 80.0), 1)
-        return humidity, temperature
+def channel_deadband(channel):
+    """Deadband of a channel from the driver producing it"""
+    for driver in drivers:
+        if channel in driver.deadband:
+            return driver.deadband[channel]
+    return 0.0
+
+def initialize_sensors():
+    """Create the sensor drivers from the configuration file"""
+    global device_id, drivers
     
-    try:
-        humidity, temperature = Adafruit_DHT.read_retry(DHT_SENSOR_TYPE, DHT_SENSOR_PIN)
-        if humidity is None or temperature is None:
-            logger.warning("Failed to read from DHT sensor")
-            return None, None
-        return round(humidity, 1), round(temperature, 1)
-    except Exception as e:
-        logger.error(f"Error reading DHT22: {e}")
-        return None, None
+    config = load_config()
+    device_id = config.get('device', MQTT_CLIENT_ID)
+    drivers = create_drivers(config, simulate=SIMULATION_MODE, simulator=simulator, actuators=control_state, gpio=gpio)
+    return drivers
 
-def read_bh1750():
-    """Read light intensity from BH1750 sensor"""
-    if SIMULATION_MODE:
-        return round(random.uniform(0.0, 1000.0), 1)
+def read_sensors():
+    """Read all sensors and return the legacy data dict"""
+    for driver in drivers:
+        latest_readings.update(driver.read())
+    return build_sensor_data()
+
+def build_sensor_data():
+    """
+    Combine the latest legacy channel values into a data dict.
+
+    Channels without a reading get their default value and are listed
+    under 'substituted' so the dashboard does not store them as measured.
+    """
+    sensor_data = {}
+    substituted = []
+    for name, default in LEGACY_CHANNELS.items():
+        value = latest_readings.get(name)
+        if value is None:
+            value = default
+            substituted.append(name)
+        sensor_data[name] = value
+    sensor_data['substituted'] = substituted
+    sensor_data['timestamp'] = datetime.now().isoformat()
+    return sensor_data
+
+def set_actuators(states):
+    """Switch several actuator relays in one GPIO call and record their states"""
+    if not states:
+        return
+    for name, state in states.items():
+        control_state[name] = state
+        logger.info(f"Setting {name.replace('_', ' ')} to {'ON' if state else 'OFF'}")
     
     try:
-        with SMBus(1) as bus:  # 1 = Raspberry Pi's I2C bus
-            # 0x20 = One time high resolution mode (1 lux resolution)
-            bus.write_byte(BH1750_ADDR, 0x20)
-            time.sleep(0.2)  # Wait for measurement
-            data = bus.read_i2c_block_data(BH1750_ADDR, 0x20, 2)
-            light_level = (data[0] << 8 | data[1]) / 1.2  # Convert to lux
-            return round(light_level, 1)
+        gpio.write({ACTUATOR_PINS[name]: state for name, state in states.items()})
     except Exception as e:
-        logger.error(f"Error reading BH1750: {e}")
+        logger.error(f"Error controlling {', '.join(name.replace('_', ' ') for name in states)}: {e}")
+
+class CommandProcessor:
+    """
+    Coalesce actuator commands and apply them in windows.
+
+    Commands received within COMMAND_WINDOW are merged per actuator (the
+    last requested state wins), transitions to the current state are
+    skipped, the remaining ones are switched in a single GPIO pass, and a
+    relay is not switched again before its minimum on/off time has passed;
+    such transitions stay pending until it has. Each window publishes a
+    single status update acknowledging every command received in it. A
+    command with a deferred transition is acknowledged with the seconds
+    left in 'deferred' and acknowledged again once it is applied. Runs as a
+    task on the event loop.
+    """
+
+    def __init__(self, window=COMMAND_WINDOW, min_times=ACTUATOR_MIN_TIMES):
+        self.window = window
+        self.min_times = min_times
+        self.desired = {}
+        # (command id, actuator names) awaiting acknowledgement
+        self.acks = []
+        self.last_change = {}
+        self.wakeup = asyncio.Event()
+
+    def submit(self, name, state, command_id=None):
+        """Queue a requested actuator state (call from the event loop)"""
+        self.submit_batch({name: state}, command_id)
+
+    def submit_batch(self, states, command_id=None):
+        """Queue several actuator states, acknowledged together (call from the event loop)"""
+        self.desired.update(states)
+        if command_id:
+            self.acks.append((command_id, tuple(states)))
+        self.wakeup.set()
+
+    def _hold_until(self, name, now):
+        """Time before which the actuator must keep its current state"""
+        last = self.last_change.get(name)
+        if last is None:
+            return now
+        min_on, min_off = self.min_times.get(name, (0.0, 0.0))
+        return last + (min_on if control_state[name] else min_off)
+
+    def flush(self):
+        """Apply the coalesced commands; return the time of the next deferred transition"""
+        desired, self.desired = self.desired, {}
+        acks, self.acks = self.acks, []
+        
+        now = time.monotonic()
+        switch = {}
+        deferred = {}
+        for name, state in desired.items():
+            if control_state.get(name) == state:
+                continue
+            hold_until = self._hold_until(name, now)
+            if hold_until > now:
+                deferred[name] = (state, hold_until)
+                continue
+            switch[name] = state
+            self.last_change[name] = now
+        set_actuators(switch)
+        
+        for name, (state, _) in deferred.items():
+            self.desired.setdefault(name, state)
+        # Commands waiting for a deferred transition are acknowledged again once it is applied
+        self.acks.extend(ack for ack in acks if any(name in deferred for name in ack[1]))
+        
+        if switch or acks:
+            send_control_status(
+                acks=list(dict.fromkeys(command_id for command_id, _ in acks)) or None,
+                deferred={name: round(hold_until - now, 1) for name, (_, hold_until) in deferred.items()} or None
+            )
+        
+        if deferred:
+            logger.info(f"Deferring {', '.join(deferred)} to respect minimum on/off times")
+            return min(hold_until for _, hold_until in deferred.values())
         return None
 
-def read_soil_moisture():
-    """Read soil moisture from capacitive sensor"""
-    if SIMULATION_MODE:
-        return round(random.uniform(0.0, 100.0), 1)
-    
-    try:
-        # Digital read for capacitive sensor
-        # Low = wet, High = dry
-        moisture_digital = GPIO.input(SOIL_MOISTURE_PIN)
+    async def run(self):
+        next_deferred = None
+        while True:
+            timeout = None if next_deferred is None else max(next_deferred - time.monotonic(), 0.0)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            
+            # Let a burst of commands accumulate before applying it
+            await asyncio.sleep(self.window)
+            self.wakeup.clear()
+            try:
+                next_deferred = self.flush()
+            except Exception as e:
+                logger.error(f"Error applying control commands: {e}")
+
+command_processor = CommandProcessor()
+
+class MQTTConnection:
+    """
+    paho-mqtt client driven by the asyncio event loop.
+
+    The client's socket is watched with add_reader/add_writer instead of
+    paho's network thread, so all callbacks run on the event loop. Outgoing
+    messages go through a bounded publish queue that is drained while
+    connected; when it is full the oldest message is dropped. Reconnects
+    use exponential backoff and keep the persistent session.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.connected = asyncio.Event()
+        self.queue = asyncio.Queue(maxsize=MQTT_MAX_QUEUED)
+        self.reconnect_delay = MQTT_RECONNECT_MIN_DELAY
+        self.tasks = []
         
-        # Convert to percentage (simplified)
-        # In a real implementation, you might need to calibrate or use an ADC
-        # for analog readings to get more precision
-        moisture_percentage = 0.0 if moisture_digital else 100.0
-        return moisture_percentage
-    except Exception as e:
-        logger.error(f"Error reading soil moisture: {e}")
-        return None
+        # The broker keeps the session (subscriptions and queued QoS 1
+        # commands) while we are offline
+        self.client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id=MQTT_CLIENT_ID,
+            clean_session=False
+        )
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = on_message
+        self.client.on_socket_open = self.on_socket_open
+        self.client.on_socket_close = self.on_socket_close
+        self.client.on_socket_register_write = self.on_socket_register_write
+        self.client.on_socket_unregister_write = self.on_socket_unregister_write
+        
+        # Set authentication if provided
+        if MQTT_USERNAME and MQTT_PASSWORD:
+            self.client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+        
+        # Set will (testament) message
+        will_payload = json.dumps({
+            'device': device_id,
+            'status': 'offline',
+            'timestamp': datetime.now().isoformat()
+        })
+        self.client.will_set(TOPIC_SYSTEM_STATUS, will_payload, qos=1, retain=True)
+        
+        # Flow control
+        self.client.max_inflight_messages_set(MQTT_MAX_INFLIGHT)
+        self.client.max_queued_messages_set(MQTT_MAX_QUEUED)
+
+    def _on_loop(self, func, *args):
+        """Run func on the event loop; socket callbacks may come from the connect thread"""
+        if threading.get_ident() == self.loop_thread:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
 
-def read_sensors():
-    """Read all sensors and return data dict"""
-    humidity, temperature = read_dht22()
-    light_level = read_bh1750()
-    soil_moisture = read_soil_moisture()
-    
-    # Build sensor data dictionary
-    sensor_data = {
-        'temperature': temperature if temperature is not None else 20.0,
-        'humidity': humidity if humidity is not None else 50.0,
-        'light_level': light_level if light_level is not None else 500.0,
-        'soil_moisture': soil_moisture if soil_moisture is not None else 50.0,
-        'timestamp': datetime.now().isoformat()
-    }
-    
-    return sensor_data
+    def on_socket_open(self, client, userdata, sock):
+        self._on_loop(self.loop.add_reader, sock, client.loop_read)
 
-def control_fan(state):
-    """Control the fan relay"""
-    control_state['fan'] = state
-    logger.info(f"Setting fan to {'ON' if state else 'OFF'}")
-    
-    if not SIMULATION_MODE:
-        try:
-            GPIO.output(FAN_PIN, GPIO.HIGH if state else GPIO.LOW)
-        except Exception as e:
-            logger.error(f"Error controlling fan: {e}")
-    
-    # Send status update via MQTT
-    send_control_status()
-    return state
-
-def control_light(state):
-    """Control the light relay"""
-    control_state['light'] = state
-    logger.info(f"Setting light to {'ON' if state else 'OFF'}")
-    
-    if not SIMULATION_MODE:
-        try:
-            GPIO.output(LIGHT_PIN, GPIO.HIGH if state else GPIO.LOW)
-        except Exception as e:
-            logger.error(f"Error controlling light: {e}")
-    
-    # Send status update via MQTT
-    send_control_status()
-    return state
-
-def control_water_pump(state):
-    """Control the water pump relay"""
-    control_state['water_pump'] = state
-    logger.info(f"Setting water pump to {'ON' if state else 'OFF'}")
-    
-    if not SIMULATION_MODE:
-        try:
-            GPIO.output(WATER_PUMP_PIN, GPIO.HIGH if state else GPIO.LOW)
-        except Exception as e:
-            logger.error(f"Error controlling water pump: {e}")
-    
-    # Send status update via MQTT
-    send_control_status()
-    return state
+    def on_socket_close(self, client, userdata, sock):
+        self._on_loop(self.loop.remove_reader, sock)
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self._on_loop(self.loop.add_writer, sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self._on_loop(self.loop.remove_writer, sock)
+
+    def on_connect(self, client, userdata, flags, reason_code, properties=None):
+        """Called when connected to MQTT broker"""
+        if reason_code.is_failure:
+            logger.error(f"Failed to connect to MQTT broker: {reason_code}")
+            connection_stats['failed_connects'] += 1
+            set_connection_state('reconnecting', reason_code)
+            return
+        
+        logger.info("Connected to MQTT broker")
+        connection_stats['connects'] += 1
+        self.reconnect_delay = MQTT_RECONNECT_MIN_DELAY
+        set_connection_state('connected', reason_code)
+        self.connected.set()
+        
+        # (Re)subscribe to control commands; harmless when the broker kept the session
+        client.subscribe(TOPIC_CONTROL_COMMAND, qos=1)
+        if LOCAL_RULES:
+            client.subscribe(TOPIC_CONTROL_RULES, qos=1)
+        if ring_store is not None:
+            client.subscribe(TOPIC_BACKFILL_REQUEST, qos=1)
+        
+        # Send initial control status
+        send_control_status()
+        
+        # Send online status
+        online_payload = json.dumps({
+            'device': device_id,
+            'status': 'online',
+            'timestamp': datetime.now().isoformat()
+        })
+        client.publish(TOPIC_SYSTEM_STATUS, online_payload, qos=1, retain=True)
+
+    def on_disconnect(self, client, userdata, flags, reason_code, properties=None):
+        """Called when disconnected from MQTT broker"""
+        connection_stats['disconnects'] += 1
+        self.connected.clear()
+        if connection_stats['state'] == 'disconnected':
+            return
+        
+        logger.warning(f"Disconnected from MQTT broker: {reason_code} - reconnecting with backoff")
+        set_connection_state('reconnecting', reason_code)
+
+    def publish(self, topic, payload, qos=1, retain=False):
+        """Queue a message for publishing, dropping the oldest one when the queue is full"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.queue.task_done()
+            logger.warning("MQTT publish queue full - dropping oldest message")
+        self.queue.put_nowait((topic, payload, qos, retain))
+
+    async def run_network(self):
+        """Connect, service keepalives and reconnect with exponential backoff"""
+        while True:
+            set_connection_state('connecting' if connection_stats['connects'] == 0 else 'reconnecting')
+            try:
+                # Connecting (DNS, TCP handshake) blocks, so keep it off the event loop
+                await self.loop.run_in_executor(None, self.client.connect, MQTT_BROKER, MQTT_PORT, 60)
+            except Exception as e:
+                logger.warning(f"Could not reach MQTT broker: {e} - retrying in {self.reconnect_delay} s")
+                connection_stats['failed_connects'] += 1
+                await asyncio.sleep(self.reconnect_delay)
+                self.reconnect_delay = min(self.reconnect_delay * 2, MQTT_RECONNECT_MAX_DELAY)
+                continue
+            
+            # Keepalive and retry timers; returns once the socket is closed
+            while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                await asyncio.sleep(1)
+            self.connected.clear()
+            await asyncio.sleep(self.reconnect_delay)
+            self.reconnect_delay = min(self.reconnect_delay * 2, MQTT_RECONNECT_MAX_DELAY)
+
+    async def run_publisher(self):
+        """Hand queued messages to the client while connected"""
+        while True:
+            topic, payload, qos, retain = await self.queue.get()
+            try:
+                await self.connected.wait()
+                info = self.client.publish(topic, payload, qos=qos, retain=retain)
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    logger.warning(f"Error publishing to {topic}: {mqtt.error_string(info.rc)}")
+            except Exception as e:
+                logger.error(f"Error publishing to {topic}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def start(self):
+        """Start the network and publisher tasks"""
+        self.tasks = [
+            asyncio.create_task(self.run_network(), name='mqtt-network'),
+            asyncio.create_task(self.run_publisher(), name='mqtt-publisher')
+        ]
+
+    async def close(self, timeout=5.0):
+        """Flush queued messages, publish the offline status and disconnect"""
+        if self.connected.is_set():
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Dropping {self.queue.qsize()} unsent MQTT messages")
+            
+            offline_payload = json.dumps({
+                'device': device_id,
+                'status': 'offline',
+                'timestamp': datetime.now().isoformat()
+            })
+            info = self.client.publish(TOPIC_SYSTEM_STATUS, offline_payload, qos=1, retain=True)
+            deadline = self.loop.time() + timeout
+            while not info.is_published() and self.loop.time() < deadline:
+                await asyncio.sleep(0.05)
+        
+        set_connection_state('disconnected', 'shutdown')
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.client.disconnect()
+        # Give the event loop a moment to write the DISCONNECT packet
+        await asyncio.sleep(0.1)
 
 def send_sensor_data(sensor_data):
-    """Send sensor data to MQTT broker"""
-    if not is_connected or mqtt_client is None:
-        logger.warning("Cannot send sensor data - not connected to MQTT broker")
+    """Queue sensor data for the MQTT broker"""
+    if mqtt_connection is None:
+        logger.warning("Cannot send sensor data - MQTT is not available")
         return False
     
     try:
         payload = json.dumps(sensor_data)
-        mqtt_client.publish(TOPIC_SENSOR_DATA, payload, qos=1)
+        mqtt_connection.publish(TOPIC_SENSOR_DATA, payload, qos=1)
         logger.debug(f"Sent sensor data: {sensor_data}")
         return True
     except Exception as e:
         logger.error(f"Error sending sensor data: {e}")
         return False
 
-def send_control_status():
-    """Send control states to MQTT broker"""
-    if not is_connected or mqtt_client is None:
-        logger.warning("Cannot send control status - not connected to MQTT broker")
+def send_channel_readings(readings, timestamp):
+    """Queue one message per channel reading for the MQTT broker"""
+    if mqtt_connection is None:
+        return False
+    
+    for channel, value in readings.items():
+        if value is None:
+            continue
+        payload = json.dumps({'ts': timestamp, 'value': value})
+        mqtt_connection.publish(f"{TOPIC_CHANNEL_PREFIX}/{device_id}/{channel}", payload, qos=1)
+    return True
+
+def send_control_status(acks=None, deferred=None):
+    """
+    Queue control states for the MQTT broker, optionally acknowledging command ids.
+
+    deferred maps actuators whose requested transition waits for the
+    minimum on/off time to the seconds left.
+    """
+    if mqtt_connection is None:
+        logger.warning("Cannot send control status - MQTT is not available")
         return False
     
     try:
-        payload = json.dumps({
+        status = {
             **control_state,
+            'device': device_id,
             'timestamp': datetime.now().isoformat()
-        })
-        mqtt_client.publish(TOPIC_CONTROL_STATUS, payload, qos=1)
+        }
+        if acks:
+            status['acks'] = acks
+        if deferred:
+            status['deferred'] = deferred
+        payload = json.dumps(status)
+        mqtt_connection.publish(TOPIC_CONTROL_STATUS, payload, qos=1)
         logger.debug(f"Sent control status: {control_state}")
         return True
     except Exception as e:
         logger.error(f"Error sending control status: {e}")
         return False
 
-def on_connect(client, userdata, flags, rc):
-    """Called when connected to MQTT broker"""
-    global is_connected
-    if rc == 0:
-        logger.info("Connected to MQTT broker")
-        is_connected = True
-        
-        # Subscribe to control commands
-        client.subscribe(TOPIC_CONTROL_COMMAND)
-        
-        # Send initial control status
-        send_control_status()
-        
-        # Send online status
-        online_payload = json.dumps({
-            'device': 'sensor-pi',
-            'status': 'online',
-            'timestamp': datetime.now().isoformat()
-        })
-        client.publish(TOPIC_SYSTEM_STATUS, online_payload, qos=1, retain=True)
-    else:
-        logger.error(f"Failed to connect to MQTT broker with code {rc}")
-        is_connected = False
-
-def on_disconnect(client, userdata, rc):
-    """Called when disconnected from MQTT broker"""
-    global is_connected
-    logger.warning(f"Disconnected from MQTT broker with code {rc}")
-    is_connected = False
+def set_connection_state(state, reason=None):
+    """Record a connection state transition"""
+    previous = connection_stats['state']
+    connection_stats['state'] = state
+    if previous != state:
+        logger.info(f"MQTT connection state: {previous} -> {state}" + (f" ({reason})" if reason else ""))
 
 def on_message(client, userdata, msg):
     """Called when a message is received from MQTT broker"""
@@ -334,6 +657,11 @@ def on_message(client, userdata, msg):
         
         if topic == TOPIC_CONTROL_COMMAND:
             process_control_command(payload)
+        elif topic == TOPIC_CONTROL_RULES and LOCAL_RULES:
+            update_rules(payload)
+        elif topic == TOPIC_BACKFILL_REQUEST and ring_store is not None:
+            if payload.get('device') == device_id:
+                mqtt_connection.loop.create_task(send_backfill(payload))
     except Exception as e:
         logger.error(f"Error processing MQTT message: {e}")
 
@@ -342,105 +670,339 @@ def process_control_command(payload):
     try:
         command = payload.get('command')
         value = payload.get('value')
+        command_id = payload.get('id')
+        
+        # Commands may be addressed to some devices only
+        devices = payload.get('devices')
+        if devices and device_id not in devices:
+            return
         
-        if command == 'fan':
-            control_fan(bool(value))
-        elif command == 'light':
-            control_light(bool(value))
-        elif command == 'water_pump':
-            control_water_pump(bool(value))
+        if command in ACTUATOR_PINS:
+            states = {command: bool(value)}
+        elif command == 'batch' and isinstance(value, dict):
+            unknown = [name for name in value if name not in ACTUATOR_PINS]
+            if unknown:
+                logger.warning(f"Ignoring unknown actuators in batch command: {', '.join(unknown)}")
+            states = {name: bool(state) for name, state in value.items() if name in ACTUATOR_PINS}
         else:
             logger.warning(f"Unknown command: {command}")
+            return
+        
+        # The local rules keep their hands off these actuators for hold seconds
+        hold = float(payload.get('hold') or 0)
+        if hold > 0:
+            for name in states:
+                rule_holds[name] = time.monotonic() + hold
+            logger.info(f"Holding {', '.join(states)} against the local rules for {hold:.0f} s")
+        command_processor.submit_batch(states, command_id)
     except Exception as e:
         logger.error(f"Error processing control command: {e}")
 
-def connect_mqtt():
-    """Connect to MQTT broker"""
-    global mqtt_client, is_connected
+def initialize_rules():
+    """Load the cached rule set so the box is controlled before the broker is reachable"""
+    rules = load_rules(RULES_CACHE)
+    if rules:
+        local_rules.update(rules)
+        logger.info(f"Loaded control rules {local_rules.version} from {RULES_CACHE}")
+    return rules is not None
+
+def update_rules(rules):
+    """Switch to a rule set received from the dashboard and apply it at once"""
+    if rules.get('version') == local_rules.version:
+        return
+    local_rules.update(rules)
+    reported_decisions.clear()
+    save_rules(RULES_CACHE, rules)
+    logger.info(f"Received control rules {local_rules.version}")
+    apply_local_rules()
+
+def apply_local_rules():
+    """
+    Evaluate the local rules and act on the decisions that changed.
+
+    An actuator is only switched when its rule's output changes (e.g. the
+    temperature crosses the fan threshold or the light period starts), so
+    a manual command holds until the rule's next transition. Actuators in
+    rule_holds are not switched before their hold ends; a decision that
+    changed meanwhile is acted on then.
+    """
+    if not LOCAL_RULES:
+        return
+    now = time.monotonic()
+    for name in [name for name, until in rule_holds.items() if until <= now]:
+        del rule_holds[name]
     
-    try:
-        # Create client
-        mqtt_client = mqtt.Client(MQTT_CLIENT_ID)
-        
-        # Set callbacks
-        mqtt_client.on_connect = on_connect
-        mqtt_client.on_disconnect = on_disconnect
-        mqtt_client.on_message = on_message
-        
-        # Set authentication if provided
-        if MQTT_USERNAME and MQTT_PASSWORD:
-            mqtt_client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
-        
-        # Set will (testament) message
-        will_payload = json.dumps({
-            'device': 'sensor-pi',
-            'status': 'offline',
-            'timestamp': datetime.now().isoformat()
+    decisions = local_rules.evaluate(latest_readings)
+    report = []
+    for name, (state, reason, value) in decisions.items():
+        if name in rule_holds:
+            continue
+        if reported_decisions.get(name) == state:
+            continue
+        reported_decisions[name] = state
+        if control_state[name] != state:
+            command_processor.submit(name, state)
+        logger.info(f"Local rule switching {name} {'ON' if state else 'OFF'}: {reason}")
+        report.append({'actuator': name, 'state': state, 'reason': reason, 'value': value})
+    
+    if report and mqtt_connection is not None:
+        payload = json.dumps({
+            'device': device_id,
+            'rules_version': local_rules.version,
+            'timestamp': datetime.now().isoformat(),
+            'decisions': report
         })
-        mqtt_client.will_set(TOPIC_SYSTEM_STATUS, will_payload, qos=1, retain=True)
-        
-        # Connect to broker
-        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, keepalive=60)
-        
-        # Start loop in background thread
-        mqtt_client.loop_start()
-        
+        mqtt_connection.publish(TOPIC_CONTROL_DECISIONS, payload, qos=1)
+
+async def evaluate_rules():
+    """Periodic evaluation for the rules that depend on the time of day"""
+    apply_local_rules()
+
+def connect_mqtt(loop):
+    """Create the MQTT connection and start its tasks"""
+    global mqtt_connection
+    
+    if mqtt is None:
+        return False
+    
+    try:
+        mqtt_connection = MQTTConnection(loop)
+        mqtt_connection.start()
         return True
     except Exception as e:
         logger.error(f"Error connecting to MQTT broker: {e}")
         return False
 
-def sensor_loop():
-    """Main sensor reading and reporting loop"""
-    global running
-    
-    logger.info("Starting sensor loop")
-    reading_interval = 30  # seconds
-    
-    while running:
+async def run_periodic(name, interval, func, delay=0.0):
+    """
+    Await func every interval seconds on a fixed schedule.
+
+    Deadlines are computed from the start time rather than from the end of
+    the previous run, so the period does not drift. When a run overruns,
+    the missed ticks are skipped instead of being run back to back. The
+    first run happens after delay seconds. interval may be a function
+    returning the next period.
+    """
+    loop = asyncio.get_running_loop()
+    next_run = loop.time() + delay
+    await asyncio.sleep(delay)
+    while True:
         try:
-            # Read sensors
-            sensor_data = read_sensors()
-            
-            # Send data via MQTT
-            if is_connected:
-                send_sensor_data(sensor_data)
-            else:
-                logger.warning("Not connected to MQTT - skipping data transmission")
-            
-            # Sleep until next reading
-            time.sleep(reading_interval)
+            await func()
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"Error in sensor loop: {e}")
-            time.sleep(5)  # Sleep shorter time on error
+            logger.error(f"Error in {name} task: {e}")
+        
+        period = interval() if callable(interval) else interval
+        next_run += period
+        now = loop.time()
+        if next_run < now:
+            missed = int((now - next_run) // period) + 1
+            next_run += missed * period
+            logger.debug(f"{name} task overran, skipped {missed} run(s)")
+        await asyncio.sleep(next_run - now)
+
+async def sample_driver(driver):
+    """Read one sensor and publish its channels (or aggregate them in edge mode)"""
+    if driver.blocking and not driver.simulated:
+        # Blocking drivers share a small thread pool instead of a thread each
+        readings = await asyncio.get_running_loop().run_in_executor(sensor_executor, driver.read)
+    else:
+        readings = driver.read()
+    latest_readings.update(readings)
+    # React to the new values within this sample
+    apply_local_rules()
+    
+    now = time.monotonic()
+    changed = [channel for channel, value in readings.items()
+               if value is not None and channel_reporter.changed(channel, value, driver.deadband[channel])]
+    calm_samples[driver.name] = 0 if changed else calm_samples.get(driver.name, 0) + 1
+    if aggregator is None:
+        # Publish changed values and heartbeats only
+        due = {channel: value for channel, value in readings.items()
+               if value is not None and channel_reporter.due(
+                   channel, value, driver.deadband[channel], driver.max_silence, now)}
+        for channel, value in due.items():
+            channel_reporter.reported(channel, value, now)
+        send_channel_readings(due, round(time.time(), 3))
+        return
+    
+    # Edge mode keeps every sample; the reporter only tracks changes
+    for channel in changed:
+        channel_reporter.reported(channel, readings[channel], now)
+    ts = int(time.time() * 1000)
+    for channel, value in readings.items():
+        if value is not None:
+            ring_store.add(channel, ts, value)
+            aggregator.add(channel, ts, value)
+
+async def sample_on_change(driver):
+    """Sample an event-driven sensor right after its input changed"""
+    try:
+        await sample_driver(driver)
+    except Exception as e:
+        logger.error(f"Error in {driver.name} task: {e}")
 
-def signal_handler(sig, frame):
-    """Handle termination signals"""
-    global running
-    logger.info("Received termination signal")
-    running = False
+def initialize_edge():
+    """Open the ring store and create the aggregator when edge mode is enabled"""
+    global ring_store, aggregator, EDGE_AGGREGATE
+    
+    if EDGE_AGGREGATE <= 0:
+        return False
+    if EDGE_AGGREGATE % 60:
+        EDGE_AGGREGATE = max(60, round(EDGE_AGGREGATE / 60) * 60)
+        logger.warning(f"EDGE_AGGREGATE must be a multiple of 60 s - using {EDGE_AGGREGATE} s")
+    try:
+        ring_store = RingStore(EDGE_STORE, EDGE_RETENTION)
+    except Exception as e:
+        logger.error(f"Error opening edge ring store {EDGE_STORE}: {e} - publishing every sample")
+        return False
+    aggregator = WindowAggregator(EDGE_AGGREGATE)
+    logger.info(f"Edge mode: publishing {EDGE_AGGREGATE} s aggregates, keeping {EDGE_RETENTION} h of raw samples")
+    return True
+
+async def publish_aggregates():
+    """Publish the windows that have ended and write the raw samples to the ring store"""
+    closed = aggregator.pop_closed(int(time.time() * 1000))
+    if mqtt_connection is not None:
+        for start, channels in sorted(closed.items()):
+            payload = json.dumps({'start': start, 'interval': EDGE_AGGREGATE, 'channels': channels})
+            mqtt_connection.publish(f"{TOPIC_AGGREGATE_PREFIX}/{device_id}", payload, qos=1)
+    await asyncio.get_running_loop().run_in_executor(None, ring_store.flush)
+
+async def send_backfill(request):
+    """Answer a backfill request with the raw samples of its time range, in chunks"""
+    try:
+        # Whole aggregation windows, so the dashboard can replace their aggregates
+        window_ms = EDGE_AGGREGATE * 1000
+        start = int(request['start']) // window_ms * window_ms
+        end = -(-int(request['end']) // window_ms) * window_ms
+        channels = request.get('channels') or None
+        rows = await asyncio.get_running_loop().run_in_executor(None, ring_store.query, start, end, channels)
+    except Exception as e:
+        logger.error(f"Error reading backfill for request {request.get('id')}: {e}")
+        return
+    
+    logger.info(f"Sending {len(rows)} raw samples for backfill request {request.get('id')}")
+    topic = f"{TOPIC_BACKFILL_PREFIX}/{device_id}"
+    parts = max(-(-len(rows) // EDGE_BACKFILL_CHUNK), 1)
+    for part in range(parts):
+        chunk = rows[part * EDGE_BACKFILL_CHUNK:(part + 1) * EDGE_BACKFILL_CHUNK]
+        payload = json.dumps({
+            'id': request.get('id'), 'start': start, 'end': end, 'channels': channels,
+            'part': part, 'done': part == parts - 1, 'samples': [list(row) for row in chunk]
+        })
+        # Leave room in the publish queue for live data
+        while mqtt_connection.queue.qsize() > MQTT_MAX_QUEUED // 2:
+            await asyncio.sleep(0.1)
+        mqtt_connection.publish(topic, payload, qos=1)
+
+def sample_interval(driver):
+    """Seconds until the next sample: the fast interval while the sensor's values are changing"""
+    if calm_samples.get(driver.name, SETTLE_SAMPLES) < SETTLE_SAMPLES:
+        return driver.fast_interval
+    return driver.interval
+
+async def report_sensor_data():
+    """Send the combined message when a legacy value changed or the heartbeat is due"""
+    global last_legacy_report
+    
+    sensor_data = build_sensor_data()
+    now = time.monotonic()
+    measured = [name for name in LEGACY_CHANNELS if name not in sensor_data['substituted']]
+    changed = [name for name in measured
+               if legacy_reporter.changed(name, sensor_data[name], channel_deadband(name))]
+    if not changed and last_legacy_report is not None and now - last_legacy_report < DEFAULT_MAX_SILENCE:
+        return
+    for name in measured:
+        legacy_reporter.reported(name, sensor_data[name], now)
+    last_legacy_report = now
+    send_sensor_data(sensor_data)
+
+async def run_client():
+    """Run the sensor, command and MQTT tasks until SIGINT/SIGTERM"""
+    global sensor_executor
+    
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    
+    sensor_executor = ThreadPoolExecutor(max_workers=SENSOR_WORKERS, thread_name_prefix='sensor')
+    
+    # Initialize hardware
+    initialize_hardware()
+    
+    # Create the configured sensor drivers (this also sets the device name)
+    initialize_sensors()
+    initialize_edge()
+    if LOCAL_RULES:
+        initialize_rules()
+    
+    # Connect to MQTT broker
+    if not connect_mqtt(loop):
+        logger.error("Failed to connect to MQTT broker - continuing with local operation only")
+    
+    # Event-driven sensors are also sampled as soon as their input changes;
+    # the GPIO backend calls on_change from its own thread
+    for driver in drivers:
+        driver.on_change = lambda driver=driver: loop.call_soon_threadsafe(
+            loop.create_task, sample_on_change(driver)
+        )
+    
+    # One task per sensor, each on its own schedule
+    tasks = [asyncio.create_task(command_processor.run(), name='commands')]
+    if LOCAL_RULES:
+        tasks.append(asyncio.create_task(run_periodic('rules', RULES_INTERVAL, evaluate_rules), name='rules'))
+    for driver in drivers:
+        tasks.append(asyncio.create_task(
+            run_periodic(driver.name, lambda driver=driver: sample_interval(driver),
+                         lambda driver=driver: sample_driver(driver)),
+            name=f"sensor-{driver.name}"
+        ))
+    if aggregator is not None:
+        # Shortly after each window boundary
+        delay = EDGE_AGGREGATE - time.time() % EDGE_AGGREGATE + 1.0
+        tasks.append(asyncio.create_task(
+            run_periodic('aggregates', EDGE_AGGREGATE, publish_aggregates, delay=delay), name='aggregates'
+        ))
+    
+    # Keep sending the combined message while legacy channels are configured,
+    # except in edge mode, where only the window aggregates are published
+    if aggregator is None and any(name in LEGACY_CHANNELS for driver in drivers for name in driver.channels.values()):
+        logger.info(f"Reporting legacy sensor data every {SENSOR_INTERVAL} s")
+        tasks.append(asyncio.create_task(
+            run_periodic('report', SENSOR_INTERVAL, report_sensor_data, delay=min(SENSOR_INTERVAL, 5.0))
+        ))
+    
+    try:
+        await stop.wait()
+        logger.info("Received termination signal")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await cleanup()
+
+def configure_logging():
+    """Log to sensor_client.log and the console; done in main() so importing the module has no side effects"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("sensor_client.log"),
+            logging.StreamHandler()
+        ]
+    )
 
 def main():
     """Main entry point"""
-    # Register signal handlers
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    
+    configure_logging()
     try:
-        # Initialize hardware
-        initialize_hardware()
-        
-        # Connect to MQTT broker
-        if not connect_mqtt():
-            logger.error("Failed to connect to MQTT broker - continuing with local operation only")
-        
-        # Start sensor loop in main thread
-        sensor_loop()
+        asyncio.run(run_client())
     except Exception as e:
         logger.error(f"Error in main function: {e}")
-    finally:
-        # Clean up
-        cleanup()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
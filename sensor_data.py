@@ -1,139 +1,606 @@
+import os
+import math
 import logging
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from models import SensorReading
-from app import db
+from sqlalchemy import func, select, cast, case, Integer
+from models import db, SensorReading, Device, Metric, MetricSample, MetricRollup
+from processing import QUALITY_SUBSTITUTED, QUALITY_BITS
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
+# Metrics stored in the wide sensor_readings table
+METRICS = ('temperature', 'humidity', 'light_level', 'soil_moisture')
+
+# Device the wide sensor_readings rows belong to in the narrow layout
+LEGACY_DEVICE = os.environ.get("LEGACY_DEVICE", "sensor-pi")
+
+EPOCH = datetime(1970, 1, 1)
+
+# Bucket widths of the aggregation API in seconds
+BUCKETS = {'1m': 60, '5m': 300, '15m': 900, '1h': 3600, '1d': 86400}
+
+# Statistics the aggregation API can compute per bucket
+STATISTICS = ('mean', 'min', 'max', 'stddev', 'p95', 'twa', 'count')
+
+# Sensor Pis report by exception, so a value holds until the next sample;
+# averages weight samples by that time, capped at STEP_MAX_HOLD seconds
+# (longer gaps are missing data, not an unchanged value)
+STEP_MAX_HOLD = float(os.environ.get("STEP_MAX_HOLD", 600))
+
+# Every UTC offset in use is a multiple of 15 minutes, so buckets up to 15
+# minutes start at the same instants in every time zone; wider local buckets
+# are merged from 15 minute granules
+GRANULE_MS = 900000
+
+def to_epoch_ms(timestamp):
+    """Convert a naive UTC datetime to epoch milliseconds"""
+    return (timestamp - EPOCH) // timedelta(milliseconds=1)
+
+def epoch_seconds(column):
+    """SQL expression for a naive UTC timestamp column as integer epoch seconds"""
+    if db.engine.dialect.name == 'sqlite':
+        return cast(func.strftime('%s', column), Integer)
+    return cast(func.floor(func.extract('epoch', column)), Integer)
+
+def _empty_columns(*names):
+    return {name: [] for name in names}
+
+# Columns read for raw readings; queries select only these instead of
+# loading SensorReading instances
+READING_COLUMNS = ('id', 'timestamp') + METRICS
+
+def _columns(names):
+    return [getattr(SensorReading, name) for name in names]
+
+def _time_range(**delta):
+    end_time = datetime.utcnow()
+    return end_time - timedelta(**delta), end_time
+
+def _since_start(start_time, since, bucket_ms):
+    """
+    Start of an incremental query: the start of the bucket before the one
+    holding the since cursor (epoch milliseconds). The trailing bucket is
+    recomputed, and so is the one before it, whose last sample holds until
+    the first sample after it
+    """
+    if since is None:
+        return start_time
+    return max(start_time, _ms_to_datetime(since - since % bucket_ms - bucket_ms))
+
+def _reading_to_dict(row):
+    """Convert a READING_COLUMNS tuple to the SensorReading.to_dict() layout"""
+    reading = dict(zip(READING_COLUMNS, row))
+    reading['timestamp'] = reading['timestamp'].isoformat()
+    return reading
+
+def _select_readings(start_time, end_time, since_id=None):
+    """Raw reading tuples in the time range (only ids above since_id if given), oldest first"""
+    query = select(*_columns(READING_COLUMNS)).where(SensorReading.timestamp.between(start_time, end_time))
+    if since_id is not None:
+        query = query.where(SensorReading.id > since_id)
+    return db.session.execute(query.order_by(SensorReading.timestamp.asc())).all()
+
+def _hold_ms(ts_ms, end_ms):
+    """
+    SQL weight of a sample: the milliseconds its value holds, until the next
+    selected sample (or end_ms) and at most STEP_MAX_HOLD
+    """
+    hold = int(STEP_MAX_HOLD * 1000)
+    following = func.coalesce(func.lead(ts_ms).over(order_by=ts_ms), end_ms) - ts_ms
+    return case((following < 1, 1), (following < hold, following), else_=hold)
+
+def _select_hourly_averages(start_time, end_time):
+    """(hours since epoch, hold-weighted average per metric) tuples, grouped in the database"""
+    ts = epoch_seconds(SensorReading.timestamp) * 1000
+    samples = (
+        select((ts // 3600000).label('hour'), _hold_ms(ts, to_epoch_ms(end_time)).label('weight'),
+               *_columns(METRICS))
+        .where(SensorReading.timestamp.between(start_time, end_time))
+        .subquery()
+    )
+    weighted = [
+        func.sum(samples.c[name] * samples.c.weight)
+        / func.nullif(func.sum(case((samples.c[name].isnot(None), samples.c.weight), else_=0)), 0)
+        for name in METRICS
+    ]
+    return db.session.execute(
+        select(samples.c.hour, *weighted)
+        .group_by(samples.c.hour)
+        .order_by(samples.c.hour)
+    ).all()
+
 def get_latest_reading():
     """Get the latest sensor reading from the database"""
     try:
-        reading = SensorReading.query.order_by(SensorReading.timestamp.desc()).first()
-        return reading.to_dict() if reading else None
+        row = db.session.execute(
+            select(*_columns(READING_COLUMNS))
+            .order_by(SensorReading.timestamp.desc())
+            .limit(1)
+        ).first()
+        return _reading_to_dict(row) if row else None
     except Exception as e:
         logger.error(f"Error retrieving latest sensor reading: {e}")
         return None
 
-def get_readings_time_range(hours=24):
-    """Get sensor readings for the specified time range"""
+def get_readings_version():
+    """Return the id of the newest sensor reading, used to version cached responses"""
     try:
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(hours=hours)
-        
-        readings = SensorReading.query.filter(
-            SensorReading.timestamp.between(start_time, end_time)
-        ).order_by(SensorReading.timestamp.asc()).all()
-        
-        return [reading.to_dict() for reading in readings]
+        return db.session.execute(select(func.max(SensorReading.id))).scalar()
+    except Exception as e:
+        logger.error(f"Error retrieving sensor readings version: {e}")
+        return None
+
+def get_readings_time_range(hours=24, since_id=None):
+    """Get sensor readings for the specified time range, only those after reading since_id if given"""
+    try:
+        return [_reading_to_dict(row) for row in _select_readings(*_time_range(hours=hours), since_id)]
     except Exception as e:
         logger.error(f"Error retrieving sensor readings for time range: {e}")
         return []
 
-def get_hourly_average(hours=24):
-    """Get hourly averages for the specified time range"""
+def get_readings_time_range_columnar(hours=24, since_id=None):
+    """
+    Get sensor readings for the specified time range as parallel arrays.
+
+    Returns a dict with 'id', 'timestamp' (epoch milliseconds) and one list
+    per metric, built straight from the result tuples. With since_id only
+    readings newer than that id are returned.
+    """
     try:
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(hours=hours)
-        
-        # SQLite doesn't support complex date functions directly, so we'll use a simpler approach
-        readings = SensorReading.query.filter(
-            SensorReading.timestamp.between(start_time, end_time)
-        ).all()
+        rows = _select_readings(*_time_range(hours=hours), since_id)
+        if not rows:
+            return _empty_columns(*READING_COLUMNS)
         
-        # Group readings by hour
-        hourly_data = {}
-        for reading in readings:
-            hour_key = reading.timestamp.replace(minute=0, second=0, microsecond=0)
-            if hour_key not in hourly_data:
-                hourly_data[hour_key] = {
-                    'temperature': [],
-                    'humidity': [],
-                    'light_level': [],
-                    'soil_moisture': []
-                }
-            
-            hourly_data[hour_key]['temperature'].append(reading.temperature)
-            hourly_data[hour_key]['humidity'].append(reading.humidity)
-            hourly_data[hour_key]['light_level'].append(reading.light_level)
-            if reading.soil_moisture is not None:
-                hourly_data[hour_key]['soil_moisture'].append(reading.soil_moisture)
+        ids, timestamps, *values = zip(*rows)
+        result = {'id': list(ids), 'timestamp': [to_epoch_ms(ts) for ts in timestamps]}
+        result.update((name, list(column)) for name, column in zip(METRICS, values))
+        return result
+    except Exception as e:
+        logger.error(f"Error retrieving columnar sensor readings for time range: {e}")
+        return _empty_columns(*READING_COLUMNS)
+
+def get_hourly_average_columnar(hours=24, since=None):
+    """
+    Get hourly averages for the specified time range as parallel arrays.
+
+    The grouping and averaging run in the database, each reading weighted by
+    the time until the next one; the result has a 'timestamp' list of hour
+    starts in epoch milliseconds and one list of averages per metric. With
+    since (epoch milliseconds) only the hour before the one holding since
+    and later hours are returned.
+    """
+    try:
+        start_time, end_time = _time_range(hours=hours)
+        rows = _select_hourly_averages(_since_start(start_time, since, 3600000), end_time)
+        if not rows:
+            return _empty_columns('timestamp', *METRICS)
         
-        # Calculate averages
+        hours_since_epoch, *values = zip(*rows)
+        result = {'timestamp': [int(h) * 3600000 for h in hours_since_epoch]}
+        result.update((name, list(column)) for name, column in zip(METRICS, values))
+        return result
+    except Exception as e:
+        logger.error(f"Error calculating columnar hourly averages: {e}")
+        return _empty_columns('timestamp', *METRICS)
+
+def get_hourly_average(hours=24, since=None):
+    """Get hourly averages for the specified time range, from the hour before the one holding since if given"""
+    try:
+        start_time, end_time = _time_range(hours=hours)
         result = []
-        for hour, data in sorted(hourly_data.items()):
-            result.append({
-                'timestamp': hour.isoformat(),
-                'temperature': sum(data['temperature']) / len(data['temperature']) if data['temperature'] else None,
-                'humidity': sum(data['humidity']) / len(data['humidity']) if data['humidity'] else None,
-                'light_level': sum(data['light_level']) / len(data['light_level']) if data['light_level'] else None,
-                'soil_moisture': sum(data['soil_moisture']) / len(data['soil_moisture']) if data['soil_moisture'] else None
-            })
+        for hour, *averages in _select_hourly_averages(_since_start(start_time, since, 3600000), end_time):
+            entry = {'timestamp': (EPOCH + timedelta(hours=int(hour))).isoformat()}
+            entry.update(zip(METRICS, averages))
+            result.append(entry)
         
         return result
     except Exception as e:
         logger.error(f"Error calculating hourly averages: {e}")
         return []
 
-def get_daily_min_max(days=7):
-    """Get daily minimum and maximum values for the specified time range"""
+def get_daily_min_max(days=7, since=None, tz=None):
+    """
+    Get daily minimum, maximum and hold-weighted average values for the
+    specified time range, from the day before the one holding since if
+    given. Days run from midnight to midnight in tz (default: the timezone
+    setting); substituted values are left out.
+    """
     try:
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(days=days)
+        if tz is None:
+            from data_storage import get_timezone
+            tz = get_timezone()
+        aggregate = get_aggregate('1d', hours=days * 24, stats=('min', 'max', 'twa'), tz=tz,
+                                  metrics=METRICS, since=since)
+        rows = {}
+        for name, series in aggregate['metrics'].items():
+            for i, ts in enumerate(series['timestamp']):
+                entry = rows.get(ts)
+                if entry is None:
+                    entry = rows[ts] = {'date': datetime.fromtimestamp(ts / 1000, tz).date().isoformat()}
+                    entry.update((metric, {'min': None, 'max': None, 'avg': None}) for metric in METRICS)
+                entry[name] = {'min': series['min'][i], 'max': series['max'][i], 'avg': series['twa'][i]}
         
-        # Retrieve all readings within the time range
-        readings = SensorReading.query.filter(
-            SensorReading.timestamp.between(start_time, end_time)
-        ).all()
+        return [rows[ts] for ts in sorted(rows)]
+    except Exception as e:
+        logger.error(f"Error calculating daily min/max values: {e}")
+        return []
+
+def _metric_id(model, name):
+    return db.session.execute(select(model.id).where(model.name == name)).scalar()
+
+def _ms_to_datetime(ms):
+    return EPOCH + timedelta(milliseconds=ms)
+
+def _select_metric_samples(metric_id, device_id, start_ms, end_ms):
+    """(ts, value, quality) tuples of one metric and device, a range scan of the primary key"""
+    return db.session.execute(
+        select(MetricSample.ts, MetricSample.value, MetricSample.quality)
+        .where(MetricSample.metric_id == metric_id,
+               MetricSample.device_id == device_id,
+               MetricSample.ts.between(start_ms, end_ms))
+        .order_by(MetricSample.ts)
+    ).all()
+
+def _first_sample_ms(metric_id, device_id, start_time):
+    """Time of the first narrow sample of a metric and device at or after start_time"""
+    if metric_id is None or device_id is None:
+        return None
+    return db.session.execute(
+        select(func.min(MetricSample.ts))
+        .where(MetricSample.metric_id == metric_id,
+               MetricSample.device_id == device_id,
+               MetricSample.ts >= to_epoch_ms(start_time))
+    ).scalar()
+
+def _wide_quality(metric):
+    """SQL expression for one metric's quality flags in the packed sensor_readings column"""
+    return SensorReading.quality / (1 << (QUALITY_BITS * METRICS.index(metric))) % (1 << QUALITY_BITS)
+
+def _legacy_cutoff(metric, device, first_ms, start_time, end_time):
+    """
+    Time range to read from the wide table for a metric, or None.
+
+    Wide rows only belong to LEGACY_DEVICE and are used for the part of the
+    range before the first narrow sample, so data recorded in both layouts
+    is not counted twice.
+    """
+    if metric not in METRICS or device != LEGACY_DEVICE:
+        return None
+    if first_ms is not None:
+        end_time = min(end_time, _ms_to_datetime(first_ms) - timedelta(microseconds=1))
+    return (start_time, end_time) if start_time <= end_time else None
+
+def get_metric_series(metric, hours=24, device=LEGACY_DEVICE, since=None):
+    """
+    Get one metric of one device for the specified time range as parallel arrays.
+
+    Reads the narrow metric_samples table and, for the four wide metrics,
+    the sensor_readings rows from before the first narrow sample. Returns
+    'timestamp' (epoch milliseconds), 'value' and 'quality' (processing
+    QUALITY_* flags) lists, oldest first; with since only samples after
+    that time.
+    """
+    try:
+        window_start, end_time = _time_range(hours=hours)
+        start_time = window_start if since is None else max(window_start, _ms_to_datetime(since + 1))
+        metric_id, device_id = _metric_id(Metric, metric), _metric_id(Device, device)
+        rows = []
+        if metric_id is not None and device_id is not None:
+            rows = _select_metric_samples(metric_id, device_id, to_epoch_ms(start_time), to_epoch_ms(end_time))
         
-        # Group readings by day
-        daily_data = {}
-        for reading in readings:
-            day_key = reading.timestamp.date()
-            
-            if day_key not in daily_data:
-                daily_data[day_key] = {
-                    'temperature': [],
-                    'humidity': [],
-                    'light_level': [],
-                    'soil_moisture': []
-                }
-            
-            daily_data[day_key]['temperature'].append(reading.temperature)
-            daily_data[day_key]['humidity'].append(reading.humidity)
-            daily_data[day_key]['light_level'].append(reading.light_level)
-            if reading.soil_moisture is not None:
-                daily_data[day_key]['soil_moisture'].append(reading.soil_moisture)
+        # The wide rows stop at the first narrow sample of the whole window
+        if since is None:
+            first_ms = rows[0][0] if rows else None
+        else:
+            first_ms = _first_sample_ms(metric_id, device_id, window_start)
+        legacy = _legacy_cutoff(metric, device, first_ms, start_time, end_time)
+        if legacy:
+            column = getattr(SensorReading, metric)
+            wide = db.session.execute(
+                select(SensorReading.timestamp, column, _wide_quality(metric))
+                .where(SensorReading.timestamp.between(*legacy), column.isnot(None))
+                .order_by(SensorReading.timestamp)
+            ).all()
+            rows = [(to_epoch_ms(timestamp), value, quality) for timestamp, value, quality in wide] + list(rows)
         
-        # Calculate min/max/avg for each day
-        result = []
-        for day, data in sorted(daily_data.items()):
-            result.append({
-                'date': day.isoformat(),
-                'temperature': {
-                    'min': min(data['temperature']) if data['temperature'] else None,
-                    'max': max(data['temperature']) if data['temperature'] else None,
-                    'avg': sum(data['temperature']) / len(data['temperature']) if data['temperature'] else None
-                },
-                'humidity': {
-                    'min': min(data['humidity']) if data['humidity'] else None,
-                    'max': max(data['humidity']) if data['humidity'] else None,
-                    'avg': sum(data['humidity']) / len(data['humidity']) if data['humidity'] else None
-                },
-                'light_level': {
-                    'min': min(data['light_level']) if data['light_level'] else None,
-                    'max': max(data['light_level']) if data['light_level'] else None,
-                    'avg': sum(data['light_level']) / len(data['light_level']) if data['light_level'] else None
-                },
-                'soil_moisture': {
-                    'min': min(data['soil_moisture']) if data['soil_moisture'] else None,
-                    'max': max(data['soil_moisture']) if data['soil_moisture'] else None,
-                    'avg': sum(data['soil_moisture']) / len(data['soil_moisture']) if data['soil_moisture'] else None
-                }
-            })
+        return {
+            'timestamp': [ts for ts, _, _ in rows],
+            'value': [value for _, value, _ in rows],
+            'quality': [quality for _, _, quality in rows]
+        }
+    except Exception as e:
+        logger.error(f"Error retrieving series for metric {device}/{metric}: {e}")
+        return _empty_columns('timestamp', 'value', 'quality')
+
+def get_metric_hourly_average(metric, hours=24, device=LEGACY_DEVICE, since=None):
+    """
+    Get hold-weighted hourly averages of one metric of one device from both
+    layouts, without substituted values; from the hour before the one holding
+    since if given
+    """
+    try:
+        window_start, end_time = _time_range(hours=hours)
+        start_time = _since_start(window_start, since, 3600000)
+        metric_id, device_id = _metric_id(Metric, metric), _metric_id(Device, device)
+        buckets = {}
+        first_ms = None
+        if metric_id is not None and device_id is not None:
+            samples = (
+                select((MetricSample.ts // 3600000).label('hour'), MetricSample.ts, MetricSample.value,
+                       _hold_ms(MetricSample.ts, to_epoch_ms(end_time)).label('weight'))
+                .where(MetricSample.metric_id == metric_id,
+                       MetricSample.device_id == device_id,
+                       MetricSample.ts.between(to_epoch_ms(start_time), to_epoch_ms(end_time)),
+                       MetricSample.quality.op('&')(QUALITY_SUBSTITUTED) == 0)
+                .subquery()
+            )
+            narrow = db.session.execute(
+                select(samples.c.hour, func.sum(samples.c.value * samples.c.weight),
+                       func.sum(samples.c.weight), func.min(samples.c.ts))
+                .group_by(samples.c.hour)
+            ).all()
+            for bucket, total, weight, first in narrow:
+                buckets[int(bucket)] = [total, weight]
+                first_ms = first if first_ms is None else min(first_ms, first)
+        
+        if since is not None and metric in METRICS:
+            # The wide rows stop at the first narrow sample of the whole window
+            first_ms = _first_sample_ms(metric_id, device_id, window_start)
+        legacy = _legacy_cutoff(metric, device, first_ms, start_time, end_time)
+        if legacy:
+            column = getattr(SensorReading, metric)
+            ts = epoch_seconds(SensorReading.timestamp) * 1000
+            samples = (
+                select((ts // 3600000).label('hour'), column.label('value'),
+                       _hold_ms(ts, to_epoch_ms(legacy[1])).label('weight'))
+                .where(SensorReading.timestamp.between(*legacy), column.isnot(None),
+                       _wide_quality(metric).op('&')(QUALITY_SUBSTITUTED) == 0)
+                .subquery()
+            )
+            wide = db.session.execute(
+                select(samples.c.hour, func.sum(samples.c.value * samples.c.weight), func.sum(samples.c.weight))
+                .group_by(samples.c.hour)
+            ).all()
+            for bucket, total, weight in wide:
+                entry = buckets.setdefault(int(bucket), [0.0, 0])
+                entry[0] += total
+                entry[1] += weight
         
+        hours_since_epoch = sorted(buckets)
+        return {
+            'timestamp': [h * 3600000 for h in hours_since_epoch],
+            'value': [buckets[h][0] / buckets[h][1] for h in hours_since_epoch]
+        }
+    except Exception as e:
+        logger.error(f"Error calculating hourly averages for metric {device}/{metric}: {e}")
+        return _empty_columns('timestamp', 'value')
+
+def get_metrics(device=None):
+    """Get every (device, metric) pair with its most recent value from both layouts, optionally of one device"""
+    try:
+        latest = (
+            select(MetricSample.metric_id, MetricSample.device_id, func.max(MetricSample.ts).label('ts'))
+            .group_by(MetricSample.metric_id, MetricSample.device_id)
+        )
+        if device is not None:
+            latest = latest.where(MetricSample.device_id == _metric_id(Device, device))
+        latest = latest.subquery()
+        rows = db.session.execute(
+            select(Device.name, Metric.name, latest.c.ts, MetricSample.value)
+            .select_from(latest)
+            .join(MetricSample, (MetricSample.metric_id == latest.c.metric_id)
+                  & (MetricSample.device_id == latest.c.device_id)
+                  & (MetricSample.ts == latest.c.ts))
+            .join(Metric, Metric.id == latest.c.metric_id)
+            .join(Device, Device.id == latest.c.device_id)
+            .order_by(Device.name, Metric.name)
+        ).all()
+        result = [{'device': device, 'metric': metric, 'timestamp': ts, 'value': value}
+                  for device, metric, ts, value in rows]
+        
+        # Wide metrics without narrow samples yet
+        known = {(entry['device'], entry['metric']) for entry in result}
+        reading = get_latest_reading() if device in (None, LEGACY_DEVICE) else None
+        if reading:
+            timestamp = to_epoch_ms(datetime.fromisoformat(reading['timestamp']))
+            for metric in METRICS:
+                if (LEGACY_DEVICE, metric) not in known and reading[metric] is not None:
+                    result.append({'device': LEGACY_DEVICE, 'metric': metric,
+                                   'timestamp': timestamp, 'value': reading[metric]})
         return result
     except Exception as e:
-        logger.error(f"Error calculating daily min/max values: {e}")
+        logger.error(f"Error retrieving metrics: {e}")
         return []
+
+def get_device_version(device):
+    """Newest sample time of a device, used to version cached responses"""
+    try:
+        device_id = _metric_id(Device, device)
+        newest = db.session.execute(
+            select(func.max(MetricSample.ts)).where(MetricSample.device_id == device_id)
+        ).scalar() if device_id is not None else None
+        if device == LEGACY_DEVICE:
+            return (newest, get_readings_version())
+        return newest
+    except Exception as e:
+        logger.error(f"Error retrieving version of device {device}: {e}")
+        return None
+
+def _bucket_start(ms, seconds, tz):
+    """Epoch ms of the start of the bucket holding ms; hour and day buckets follow tz (None = server local time)"""
+    if seconds <= GRANULE_MS // 1000:
+        return ms - ms % (seconds * 1000)
+    local = datetime.fromtimestamp(ms / 1000, tz)
+    if seconds == 86400:
+        local = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        local = local.replace(minute=0, second=0, microsecond=0)
+    return int(local.timestamp() * 1000)
+
+def _percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+def _raw_values(metric_ids, device, device_id, start_ms, end_ms):
+    """(metric name, ts, value) of the raw samples behind the rollups, for percentiles"""
+    names = {metric_id: name for name, metric_id in metric_ids.items()}
+    rows = db.session.execute(
+        select(MetricSample.metric_id, MetricSample.ts, MetricSample.value)
+        .where(MetricSample.metric_id.in_(names), MetricSample.device_id == device_id,
+               MetricSample.ts.between(start_ms, end_ms),
+               MetricSample.quality.op('&')(QUALITY_SUBSTITUTED) == 0)
+    ).all()
+    result = [(names[metric_id], ts, value) for metric_id, ts, value in rows]
+    
+    # Wide rows from before the first narrow sample, as in the rollups
+    for name, metric_id in metric_ids.items():
+        first_ms = _first_sample_ms(metric_id, device_id, EPOCH)
+        legacy = _legacy_cutoff(name, device, first_ms - first_ms % 60000 if first_ms else None,
+                                _ms_to_datetime(start_ms), _ms_to_datetime(end_ms))
+        if legacy:
+            column = getattr(SensorReading, name)
+            wide = db.session.execute(
+                select(SensorReading.timestamp, column)
+                .where(SensorReading.timestamp.between(*legacy), column.isnot(None),
+                       _wide_quality(name).op('&')(QUALITY_SUBSTITUTED) == 0)
+            ).all()
+            result.extend((name, to_epoch_ms(timestamp), value) for timestamp, value in wide)
+    return result
+
+def _step_means(raw, bucket_of, end_ms):
+    """
+    Hold-weighted mean per (metric, bucket) of (metric, ts, value) samples:
+    each value counts for the time until the next sample of its metric (or
+    end_ms), at most STEP_MAX_HOLD, in the bucket it was sampled in
+    """
+    hold = STEP_MAX_HOLD * 1000
+    series = {}
+    for name, ts, value in raw:
+        series.setdefault(name, []).append((ts, value))
+    sums = {}
+    for name, samples in series.items():
+        samples.sort()
+        following = [ts for ts, _ in samples[1:]] + [end_ms]
+        for (ts, value), next_ts in zip(samples, following):
+            weight = max(min(next_ts - ts, hold), 1)
+            entry = sums.setdefault((name, bucket_of(ts)), [0.0, 0.0])
+            entry[0] += value * weight
+            entry[1] += weight
+    return {key: total / weight for key, (total, weight) in sums.items()}
+
+def get_aggregate(bucket='1h', hours=24, device=LEGACY_DEVICE, metrics=None,
+                  stats=('mean', 'min', 'max', 'count'), tz=None, since=None):
+    """
+    Aggregate metrics of one device into buckets of the given width.
+
+    Reads the one-minute rollups: buckets up to 15 minutes are grouped in
+    the database, hour and day buckets are merged from 15 minute granules
+    so they start at local hours and midnights in tz (a tzinfo, None = the
+    server's local time). mean, min, max, stddev (population) and count come
+    from the rollups in one query; p95 and twa (the mean weighted by the
+    time each value holds, for report-by-exception data) need the raw
+    samples and are only read when requested. The window starts at the
+    bucket holding now - hours, or at the bucket holding since if later
+    (the one before it with twa, as its last value holds until the first
+    sample after it). Returns per metric
+    parallel lists of bucket starts ('timestamp', epoch ms) and the
+    requested statistics.
+    """
+    seconds = BUCKETS[bucket]
+    window_start, end_time = _time_range(hours=hours)
+    start_ms = to_epoch_ms(window_start)
+    if since is not None:
+        since_start = _bucket_start(since, seconds, tz)
+        if 'twa' in stats:
+            since_start = _bucket_start(since_start - 1, seconds, tz)
+        start_ms = max(start_ms, since_start)
+    start_ms, end_ms = _bucket_start(start_ms, seconds, tz), to_epoch_ms(end_time)
+    result = {'bucket': bucket, 'tz': getattr(tz, 'key', None) or 'local', 'device': device,
+              'start': start_ms, 'end': end_ms, 'metrics': {}}
+    
+    try:
+        result['metrics'] = _aggregate_metrics(seconds, device, metrics, stats, tz, start_ms, end_ms)
+    except Exception as e:
+        logger.error(f"Error aggregating metrics of {device} into {bucket} buckets: {e}")
+    return result
+
+def _aggregate_metrics(seconds, device, metrics, stats, tz, start_ms, end_ms):
+    """Per-metric bucket statistics for get_aggregate()"""
+    device_id = _metric_id(Device, device)
+    if metrics is None:
+        metrics = [entry['metric'] for entry in get_metrics(device)]
+    metric_ids = {name: _metric_id(Metric, name) for name in metrics}
+    metric_ids = {name: metric_id for name, metric_id in metric_ids.items() if metric_id is not None}
+    if device_id is None or not metric_ids:
+        return {}
+    
+    # Group in the database by bucket, or by granule for local hours and days
+    group_minutes = min(seconds, GRANULE_MS // 1000) // 60
+    key = MetricRollup.minute // group_minutes
+    rows = db.session.execute(
+        select(MetricRollup.metric_id, key, func.sum(MetricRollup.count), func.sum(MetricRollup.sum),
+               func.sum(MetricRollup.sumsq), func.min(MetricRollup.min), func.max(MetricRollup.max))
+        .where(MetricRollup.device_id == device_id,
+               MetricRollup.metric_id.in_(metric_ids.values()),
+               MetricRollup.minute.between(start_ms // 60000, end_ms // 60000))
+        .group_by(MetricRollup.metric_id, key)
+    ).all()
+    
+    bucket_starts = {}
+    def bucket_of(ms):
+        granule = ms - ms % (group_minutes * 60000)
+        if granule not in bucket_starts:
+            bucket_starts[granule] = _bucket_start(granule, seconds, tz)
+        return bucket_starts[granule]
+    
+    names = {metric_id: name for name, metric_id in metric_ids.items()}
+    buckets = {name: {} for name in metric_ids}
+    for metric_id, group, count, total, total_sq, low, high in rows:
+        entry = buckets[names[metric_id]].setdefault(
+            bucket_of(int(group) * group_minutes * 60000), [0, 0.0, 0.0, low, high]
+        )
+        entry[0] += count
+        entry[1] += total
+        entry[2] += total_sq
+        entry[3] = min(entry[3], low)
+        entry[4] = max(entry[4], high)
+    
+    percentiles, step_means = {}, {}
+    if 'p95' in stats or 'twa' in stats:
+        raw = _raw_values(metric_ids, device, device_id, start_ms, end_ms)
+    if 'p95' in stats:
+        values = {}
+        for name, ts, value in raw:
+            values.setdefault((name, bucket_of(ts)), []).append(value)
+        percentiles = {key: _percentile(bucket_values, 0.95) for key, bucket_values in values.items()}
+    if 'twa' in stats:
+        step_means = _step_means(raw, bucket_of, end_ms)
+    
+    result = {}
+    for name, metric_buckets in buckets.items():
+        starts = sorted(metric_buckets)
+        series = {'timestamp': starts}
+        for stat in stats:
+            column = []
+            for start in starts:
+                count, total, total_sq, low, high = metric_buckets[start]
+                mean = total / count
+                if stat == 'mean':
+                    column.append(mean)
+                elif stat == 'min':
+                    column.append(low)
+                elif stat == 'max':
+                    column.append(high)
+                elif stat == 'count':
+                    column.append(count)
+                elif stat == 'stddev':
+                    column.append(math.sqrt(max(total_sq / count - mean * mean, 0.0)))
+                elif stat == 'p95':
+                    column.append(percentiles.get((name, start)))
+                elif stat == 'twa':
+                    column.append(step_means.get((name, start)))
+            series[stat] = column
+        result[name] = series
+    return result
@@ -0,0 +1,317 @@
+"""
+OpenGrow-Box sensor drivers
+
+Registry of the sensor drivers the Sensor Pi can run, configured from a
+JSON file (SENSOR_CONFIG, default sensors.json next to sensor_client.py):
+
+    {
+      "device": "sensor-pi",
+      "sensors": [
+        {"name": "dht_top", "type": "dht22", "pin": 4, "interval": 10,
+         "channels": {"temperature": "temperature", "humidity": "humidity"},
+         "calibration": {"temperature": {"offset": -0.4}},
+         "deadband": {"temperature": 0.1, "humidity": 0.5}, "max_silence": 300,
+         "fast_interval": 2},
+        {"name": "soil_2", "type": "soil_digital", "pin": 27, "interval": 60,
+         "debounce": 200},
+        {"name": "co2", "type": "mhz19", "port": "/dev/serial0", "interval": 15}
+      ]
+    }
+
+Each sensor produces one channel per measurement, named
+"<sensor name>.<measurement>" unless "channels" maps it to another name.
+"calibration" holds a linear correction (scale, then offset) per
+measurement. Values are reported by exception: a channel is published when
+it moved by more than its "deadband" (one number, or one per measurement;
+default 0, i.e. any change) since it was last published, or when it has
+been silent for "max_silence" seconds. While a value is changing the sensor
+is sampled every "fast_interval" seconds instead of "interval". Drivers
+whose library or device is missing fall back to the greenhouse simulator,
+so a configuration can be tried on any machine.
+
+Digital inputs ("pull": "up" or "down" for the internal resistor) are
+read through the GPIO backend (gpio_backend.py) with edge callbacks: a
+level change (at least "debounce" milliseconds after the previous one)
+calls the driver's on_change hook, which sensor_client uses to sample the
+sensor at once instead of at its next interval.
+
+Copy this module to the Sensor Pi next to sensor_client.py.
+"""
+
+import os
+import json
+import time
+import random
+import logging
+
+logger = logging.getLogger("sensor_client")
+
+# Path of the sensor configuration file
+SENSOR_CONFIG = os.environ.get(
+    "SENSOR_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sensors.json")
+)
+
+# Seconds between samples when a sensor does not set its own interval
+DEFAULT_INTERVAL = float(os.environ.get("SENSOR_INTERVAL", 30))
+
+# Seconds after which an unchanged value is published again (heartbeat)
+DEFAULT_MAX_SILENCE = float(os.environ.get("PUBLISH_MAX_SILENCE", 300))
+
+# The original single-probe box; its channels keep the legacy metric names
+DEFAULT_CONFIG = {
+    'sensors': [
+        {'name': 'dht22', 'type': 'dht22', 'pin': 4,
+         'channels': {'temperature': 'temperature', 'humidity': 'humidity'}},
+        {'name': 'bh1750', 'type': 'bh1750', 'bus': 1, 'address': 0x23,
+         'channels': {'light': 'light_level'}},
+        {'name': 'soil', 'type': 'soil_digital', 'pin': 17,
+         'channels': {'moisture': 'soil_moisture'}}
+    ]
+}
+
+# Driver classes by configuration "type"
+DRIVERS = {}
+
+def register_driver(type_name):
+    """Class decorator adding a driver to the registry"""
+    def decorator(cls):
+        cls.type_name = type_name
+        DRIVERS[type_name] = cls
+        return cls
+    return decorator
+
+class SensorDriver:
+    """
+    Base class for sensor drivers.
+
+    Subclasses list their measurements, implement setup() and
+    read_hardware() for the real device and read_simulated() for the
+    fallback. read() applies the calibration and returns {channel: value};
+    a value is None when the measurement failed. Event-driven drivers call
+    on_change() when their input changes between samples.
+    """
+
+    measurements = ()
+    # Shortest interval the device supports, in seconds
+    min_interval = 0.0
+    # Whether read_hardware() blocks (and should run in a worker thread)
+    blocking = True
+
+    def __init__(self, config, simulate=False, simulator=None, actuators=None, gpio=None):
+        self.config = config
+        self.name = config['name']
+        self.interval = max(float(config.get('interval', DEFAULT_INTERVAL)), self.min_interval)
+        mapping = config.get('channels', {})
+        self.channels = {m: mapping.get(m, f"{self.name}.{m}") for m in self.measurements}
+        self.calibration = config.get('calibration', {})
+        deadband = config.get('deadband', 0.0)
+        self.deadband = {
+            channel: float(deadband.get(m, 0.0) if isinstance(deadband, dict) else deadband)
+            for m, channel in self.channels.items()
+        }
+        self.max_silence = float(config.get('max_silence', DEFAULT_MAX_SILENCE))
+        self.fast_interval = max(min(float(config.get('fast_interval', self.interval)), self.interval),
+                                 self.min_interval)
+        self.simulator = simulator
+        self.actuators = actuators if actuators is not None else {}
+        self.gpio = gpio
+        self.on_change = None
+
+        self.simulated = simulate
+        if not simulate:
+            try:
+                self.setup()
+            except Exception as e:
+                logger.warning(f"Sensor {self.name} ({self.type_name}) unavailable, simulating it: {e}")
+                self.simulated = True
+
+    def setup(self):
+        """Prepare the hardware; raise if it is not available"""
+
+    def read_hardware(self):
+        """Read the device and return {measurement: value}"""
+        raise NotImplementedError
+
+    def read_simulated(self):
+        """Return simulated {measurement: value}"""
+        raise NotImplementedError
+
+    def calibrate(self, measurement, value):
+        """Apply the configured linear calibration to a raw value"""
+        if value is None:
+            return None
+        curve = self.calibration.get(measurement)
+        if curve:
+            value = value * curve.get('scale', 1.0) + curve.get('offset', 0.0)
+        return round(value, 2)
+
+    def read(self):
+        """Read all measurements and return calibrated {channel: value}"""
+        try:
+            raw = self.read_simulated() if self.simulated else self.read_hardware()
+        except Exception as e:
+            logger.error(f"Error reading sensor {self.name}: {e}")
+            raw = {}
+        return {channel: self.calibrate(m, raw.get(m)) for m, channel in self.channels.items()}
+
+    def _sample(self):
+        return self.simulator.sample(actuators=self.actuators)
+
+@register_driver('dht22')
+class DHT22Driver(SensorDriver):
+    """DHT22 temperature/humidity sensor on a GPIO pin"""
+
+    measurements = ('temperature', 'humidity')
+    min_interval = 2.0
+
+    def setup(self):
+        import Adafruit_DHT
+        self.dht = Adafruit_DHT
+        self.pin = int(self.config['pin'])
+
+    def read_hardware(self):
+        humidity, temperature = self.dht.read_retry(self.dht.DHT22, self.pin)
+        if humidity is None or temperature is None:
+            logger.warning(f"Failed to read from DHT sensor {self.name}")
+        return {'temperature': temperature, 'humidity': humidity}
+
+    def read_simulated(self):
+        simulated = self._sample()
+        return {'temperature': simulated['temperature'], 'humidity': simulated['humidity']}
+
+@register_driver('bh1750')
+class BH1750Driver(SensorDriver):
+    """BH1750 light sensor on an I2C bus"""
+
+    measurements = ('light',)
+
+    def setup(self):
+        from smbus2 import SMBus
+        self.bus = SMBus(int(self.config.get('bus', 1)))
+        self.address = int(str(self.config.get('address', 0x23)), 0)
+
+    def read_hardware(self):
+        # 0x20 = One time high resolution mode (1 lux resolution)
+        self.bus.write_byte(self.address, 0x20)
+        time.sleep(0.2)  # Wait for measurement
+        data = self.bus.read_i2c_block_data(self.address, 0x20, 2)
+        return {'light': (data[0] << 8 | data[1]) / 1.2}  # Convert to lux
+
+    def read_simulated(self):
+        return {'light': self._sample()['light_level']}
+
+@register_driver('soil_digital')
+class SoilDigitalDriver(SensorDriver):
+    """Capacitive soil moisture probe with a digital (wet/dry) output"""
+
+    measurements = ('moisture',)
+    blocking = False
+
+    def setup(self):
+        if self.gpio is None:
+            raise RuntimeError("no GPIO backend")
+        self.pin = int(self.config['pin'])
+        self.gpio.setup_input(self.pin, self.config.get('pull'))
+        self.gpio.watch(self.pin, self.on_edge, debounce_ms=float(self.config.get('debounce', 50)))
+
+    def on_edge(self, pin, level, timestamp):
+        """Sample at once on a level change (called from the GPIO backend's thread)"""
+        if self.on_change is not None:
+            self.on_change()
+
+    def read_hardware(self):
+        # Low = wet, High = dry; use an ADC for real percentages
+        return {'moisture': 0.0 if self.gpio.read(self.pin) else 100.0}
+
+    def read_simulated(self):
+        return {'moisture': self._sample()['soil_moisture']}
+
+@register_driver('soil_ads1115')
+class SoilADS1115Driver(SensorDriver):
+    """
+    Capacitive soil moisture probe on an ADS1115 ADC input.
+
+    Reports raw ADC counts; map them to percent with a calibration curve in
+    the dashboard's processing.json.
+    """
+
+    measurements = ('moisture',)
+
+    def setup(self):
+        from smbus2 import SMBus
+        self.bus = SMBus(int(self.config.get('bus', 1)))
+        self.address = int(str(self.config.get('address', 0x48)), 0)
+        self.input = int(self.config.get('input', 0))
+
+    def read_hardware(self):
+        # Single-shot conversion of AINx against GND, +/-4.096 V, 128 samples/s
+        config = 0x8000 | ((4 + self.input) << 12) | (1 << 9) | (1 << 8) | (4 << 5) | 0x3
+        self.bus.write_i2c_block_data(self.address, 0x01, [config >> 8, config & 0xFF])
+        time.sleep(0.01)  # Wait for the conversion
+        data = self.bus.read_i2c_block_data(self.address, 0x00, 2)
+        raw = data[0] << 8 | data[1]
+        return {'moisture': float(raw - 0x10000 if raw & 0x8000 else raw)}
+
+    def read_simulated(self):
+        # Typical probe: about 21000 counts in dry air, 9000 in water
+        return {'moisture': 21000.0 - 120.0 * self._sample()['soil_moisture']}
+
+@register_driver('mhz19')
+class MHZ19Driver(SensorDriver):
+    """MH-Z19 CO2 sensor on a serial port"""
+
+    measurements = ('co2',)
+    min_interval = 5.0
+
+    READ_COMMAND = bytes([0xFF, 0x01, 0x86, 0x00, 0x00, 0x00, 0x00, 0x00, 0x79])
+
+    def setup(self):
+        import serial
+        self.serial = serial.Serial(self.config.get('port', '/dev/serial0'), 9600, timeout=1.0)
+        self.level = 800.0
+
+    def read_hardware(self):
+        self.serial.reset_input_buffer()
+        self.serial.write(self.READ_COMMAND)
+        response = self.serial.read(9)
+        if len(response) != 9 or response[0] != 0xFF or response[1] != 0x86:
+            logger.warning(f"Invalid response from CO2 sensor {self.name}")
+            return {'co2': None}
+        if (0xFF - (sum(response[1:8]) & 0xFF) + 1) & 0xFF != response[8]:
+            logger.warning(f"Checksum error from CO2 sensor {self.name}")
+            return {'co2': None}
+        return {'co2': float(response[2] * 256 + response[3])}
+
+    def read_simulated(self):
+        # Plants and people raise CO2, the fan pulls it back to outdoor levels
+        level = getattr(self, 'level', 800.0)
+        target = 450.0 if self.actuators.get('fan') else 1000.0
+        self.level = level + (target - level) * 0.05 + random.gauss(0.0, 5.0)
+        return {'co2': self.level}
+
+def load_config(path=SENSOR_CONFIG):
+    """Load the sensor configuration, falling back to DEFAULT_CONFIG"""
+    if not os.path.exists(path):
+        logger.info(f"No sensor configuration at {path}, using the default sensors")
+        return DEFAULT_CONFIG
+    with open(path) as f:
+        return json.load(f)
+
+def create_drivers(config, simulate=False, simulator=None, actuators=None, gpio=None):
+    """Instantiate the drivers listed in the configuration"""
+    drivers = []
+    names = set()
+    for sensor in config.get('sensors', []):
+        driver_class = DRIVERS.get(sensor.get('type'))
+        if driver_class is None:
+            logger.error(f"Unknown sensor type {sensor.get('type')!r} for {sensor.get('name')}")
+            continue
+        if sensor.get('name') in names:
+            logger.error(f"Duplicate sensor name {sensor.get('name')!r}, skipping it")
+            continue
+        names.add(sensor['name'])
+        drivers.append(driver_class(sensor, simulate=simulate, simulator=simulator, actuators=actuators, gpio=gpio))
+
+    logger.info(f"Configured {len(drivers)} sensors with "
+                f"{sum(len(driver.channels) for driver in drivers)} channels")
+    return drivers
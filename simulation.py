@@ -0,0 +1,312 @@
+"""
+OpenGrow-Box greenhouse simulator
+
+A small, seeded physics-lite model of a grow box used whenever the sensors
+are not available. Temperature, humidity and soil moisture are first-order
+states that relax towards an equilibrium driven by the outdoor climate, the
+diurnal light curve and the actuators (grow light heats, fan exchanges air
+with the outside, pump wets the soil), so consecutive samples are continuous
+and respond to control actions.
+
+GreenhouseSimulator.sample() advances a single box in real time and is what
+the dashboard and sensor client use in simulation mode. generate_history()
+produces long series for many virtual devices at once; with NumPy installed
+it solves the recurrences in vectorized chunks instead of stepping sample by
+sample.
+
+This module only depends on the standard library (NumPy is optional) so it
+can be copied to the Sensor Pi next to sensor_client.py.
+"""
+
+import math
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SECONDS_PER_DAY = 86400.0
+
+# Model parameters. Rates are in 1/s, temperatures in °C, light in lux.
+DEFAULT_PARAMS = {
+    'outdoor_temp_mean': 18.0,
+    'outdoor_temp_amplitude': 6.0,
+    'outdoor_temp_peak_hour': 15.0,
+    'outdoor_humidity_mean': 55.0,
+    'outdoor_humidity_amplitude': 12.0,
+    'outdoor_humidity_peak_hour': 4.0,
+    'sunrise_hour': 6.0,
+    'sunset_hour': 20.0,
+    'daylight_peak_lux': 400.0,
+    'grow_light_lux': 12000.0,
+    'light_heat_gain': 0.0005,       # °C of equilibrium rise per lux
+    'thermal_rate': 1.0 / 1800.0,    # envelope heat exchange
+    'fan_thermal_rate': 1.0 / 300.0,
+    'humidity_rate': 1.0 / 1200.0,
+    'fan_humidity_rate': 1.0 / 240.0,
+    'humidity_reference': 55.0,
+    'humidity_temp_coefficient': 2.0,  # % RH lost per °C above reference
+    'humidity_reference_temp': 22.0,
+    'transpiration_humidity': 15.0,    # % RH added by fully wet soil
+    'soil_dry_rate': 1.0 / (3 * SECONDS_PER_DAY),
+    'soil_light_dry_factor': 1.0 / 6000.0,  # extra drying per lux
+    'soil_fill_rate': 1.0 / 60.0,
+    'light_hours_start': 6.0,
+    'light_hours_end': 18.0,
+    'water_time': 8.0,
+    'water_duration': 30.0,
+    'temperature_noise': 0.1,
+    'humidity_noise': 0.5,
+    'light_noise': 0.01,
+    'soil_noise': 0.5,
+}
+
+# Largest exponent accumulated inside one vectorized chunk; keeps the
+# cumulative decay products well inside float64 range.
+_MAX_CHUNK_EXPONENT = 40.0
+
+def _outdoor_conditions(hour, params):
+    """Outdoor temperature and humidity for an hour of day (scalar)"""
+    temp = params['outdoor_temp_mean'] + params['outdoor_temp_amplitude'] * math.cos(
+        2 * math.pi * (hour - params['outdoor_temp_peak_hour']) / 24.0)
+    humidity = params['outdoor_humidity_mean'] + params['outdoor_humidity_amplitude'] * math.cos(
+        2 * math.pi * (hour - params['outdoor_humidity_peak_hour']) / 24.0)
+    return temp, humidity
+
+def _daylight(hour, params):
+    """Ambient daylight reaching the box for an hour of day (scalar)"""
+    sunrise = params['sunrise_hour']
+    day_length = params['sunset_hour'] - sunrise
+    phase = (hour - sunrise) / day_length
+    if phase <= 0.0 or phase >= 1.0:
+        return 0.0
+    return params['daylight_peak_lux'] * math.sin(math.pi * phase)
+
+def _relax(value, target, rate, dt):
+    """Exact first-order step of value towards target over dt seconds"""
+    return target + (value - target) * math.exp(-rate * dt)
+
+def _equilibria(hour, light_on, fan_on, pump_on, soil, temperature, params):
+    """Rates and targets for the soil, temperature and humidity states (scalar)"""
+    outdoor_temp, outdoor_humidity = _outdoor_conditions(hour, params)
+    lux = _daylight(hour, params) + (params['grow_light_lux'] if light_on else 0.0)
+
+    dry_rate = params['soil_dry_rate'] * (1.0 + lux * params['soil_light_dry_factor'])
+    fill_rate = params['soil_fill_rate'] if pump_on else 0.0
+    soil_rate = dry_rate + fill_rate
+    soil_target = 100.0 * fill_rate / soil_rate
+
+    thermal_rate = params['thermal_rate'] + (params['fan_thermal_rate'] if fan_on else 0.0)
+    temp_target = outdoor_temp + params['thermal_rate'] * params['light_heat_gain'] * lux / thermal_rate
+
+    humidity_rate = params['humidity_rate'] + (params['fan_humidity_rate'] if fan_on else 0.0)
+    inside_humidity = (params['humidity_reference']
+                       - params['humidity_temp_coefficient'] * (temperature - params['humidity_reference_temp'])
+                       + params['transpiration_humidity'] * soil / 100.0)
+    humidity_target = (params['humidity_rate'] * inside_humidity
+                       + (params['fan_humidity_rate'] if fan_on else 0.0) * outdoor_humidity) / humidity_rate
+
+    return {
+        'lux': lux,
+        'soil': (soil_rate, soil_target),
+        'temperature': (thermal_rate, temp_target),
+        'humidity': (humidity_rate, humidity_target),
+    }
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+class GreenhouseSimulator:
+    """Stateful simulated grow box advanced in real time"""
+
+    def __init__(self, seed=None, params=None, max_step=6 * 3600.0, utc_offset=None):
+        self.params = dict(DEFAULT_PARAMS, **(params or {}))
+        self.utc_offset = utc_offset
+        self.rng = random.Random(seed)
+        self.max_step = max_step
+        self.temperature_offset = self.rng.gauss(0.0, 1.0)
+        self.humidity_offset = self.rng.gauss(0.0, 3.0)
+        self.soil = self.rng.uniform(40.0, 80.0)
+        self.temperature = None
+        self.humidity = None
+        self.last_time = None
+        self.last_reading = None
+
+    def _hour(self, now):
+        """Hour of day for the light and climate curves (local time by default)"""
+        if self.utc_offset is not None:
+            return ((now + self.utc_offset) % SECONDS_PER_DAY) / 3600.0
+        local = time.localtime(now)
+        return local.tm_hour + local.tm_min / 60.0 + local.tm_sec / 3600.0
+
+    def _initialize(self, hour, actuators):
+        """Start the states at the equilibrium for the current conditions"""
+        eq = _equilibria(hour, actuators.get('light'), actuators.get('fan'),
+                         actuators.get('water_pump'), self.soil, 22.0, self.params)
+        self.temperature = eq['temperature'][1] + self.temperature_offset
+        eq = _equilibria(hour, actuators.get('light'), actuators.get('fan'),
+                         actuators.get('water_pump'), self.soil, self.temperature, self.params)
+        self.humidity = eq['humidity'][1] + self.humidity_offset
+
+    def advance(self, now, actuators):
+        """Advance the model state to the given epoch time"""
+        hour = self._hour(now)
+        if self.last_time is None:
+            self._initialize(hour, actuators)
+            self.last_time = now
+        dt = min(max(now - self.last_time, 0.0), self.max_step)
+        self.last_time = now
+
+        light_on = bool(actuators.get('light'))
+        fan_on = bool(actuators.get('fan'))
+        pump_on = bool(actuators.get('water_pump'))
+
+        eq = _equilibria(hour, light_on, fan_on, pump_on, self.soil, self.temperature, self.params)
+        self.soil = _relax(self.soil, eq['soil'][1], eq['soil'][0], dt)
+        self.temperature = _relax(self.temperature, eq['temperature'][1] + self.temperature_offset,
+                                  eq['temperature'][0], dt)
+        eq = _equilibria(hour, light_on, fan_on, pump_on, self.soil, self.temperature, self.params)
+        self.humidity = _relax(self.humidity, eq['humidity'][1] + self.humidity_offset,
+                               eq['humidity'][0], dt)
+        return eq['lux']
+
+    def sample(self, now=None, actuators=None):
+        """Return a sensor reading, advancing the model if time has moved on"""
+        now = time.time() if now is None else now
+        if self.last_reading is not None and now <= self.last_time:
+            return dict(self.last_reading)
+
+        lux = self.advance(now, actuators or {})
+        p = self.params
+        self.last_reading = {
+            'temperature': round(self.temperature + self.rng.gauss(0.0, p['temperature_noise']), 1),
+            'humidity': round(_clamp(self.humidity + self.rng.gauss(0.0, p['humidity_noise']), 0.0, 100.0), 1),
+            'light_level': round(max(0.0, lux * (1.0 + self.rng.gauss(0.0, p['light_noise']))), 1),
+            'soil_moisture': round(_clamp(self.soil + self.rng.gauss(0.0, p['soil_noise']), 0.0, 100.0), 1),
+        }
+        return dict(self.last_reading)
+
+def default_schedule(timestamps, params=None, utc_offset=0.0):
+    """Actuator schedule from the light hours and daily watering settings"""
+    p = dict(DEFAULT_PARAMS, **(params or {}))
+    seconds_of_day = [(t + utc_offset) % SECONDS_PER_DAY for t in timestamps]
+    start = p['light_hours_start'] * 3600.0
+    end = p['light_hours_end'] * 3600.0
+    water_start = p['water_time'] * 3600.0
+    return {
+        'light': [start <= s < end for s in seconds_of_day],
+        'fan': [False] * len(seconds_of_day),
+        'water_pump': [water_start <= s < water_start + p['water_duration'] for s in seconds_of_day],
+    }
+
+def generate_history(start, steps, step_seconds=30.0, devices=1, seed=None,
+                     params=None, actuators=None, utc_offset=0.0):
+    """
+    Generate simulated readings for `devices` virtual boxes.
+
+    `start` is an epoch time in seconds and `actuators` an optional dict of
+    per-step 'light', 'fan' and 'water_pump' sequences (defaults to the
+    light hours and daily watering schedule). Returns a dict with a
+    'timestamp' sequence of epoch seconds and, for every metric, one
+    sequence per step holding a value per device. With NumPy these are
+    arrays of shape (steps,) and (steps, devices).
+    """
+    timestamps = [start + i * step_seconds for i in range(steps)]
+    if actuators is None:
+        actuators = default_schedule(timestamps, params, utc_offset)
+
+    if np is not None:
+        return _generate_history_vectorized(start, steps, step_seconds, devices, seed,
+                                            params, actuators, utc_offset)
+
+    simulators = [GreenhouseSimulator(seed=None if seed is None else seed + i, params=params,
+                                      utc_offset=utc_offset)
+                  for i in range(devices)]
+
+    history = {'timestamp': timestamps, 'temperature': [], 'humidity': [],
+               'light_level': [], 'soil_moisture': []}
+    for i, t in enumerate(timestamps):
+        states = {name: actuators[name][i] for name in ('light', 'fan', 'water_pump')}
+        readings = [sim.sample(t, states) for sim in simulators]
+        for metric in ('temperature', 'humidity', 'light_level', 'soil_moisture'):
+            history[metric].append([reading[metric] for reading in readings])
+    return history
+
+def _relax_series(initial, rate, target, dt):
+    """
+    Solve x[n] = target[n] + (x[n-1] - target[n]) * exp(-rate[n] * dt) for
+    every column at once.
+
+    The recurrence is linear with time-varying coefficients, so within a
+    chunk it is expressed with cumulative decay products and cumulative
+    sums; chunks are sized so the products stay representable.
+    """
+    exponent = rate * dt
+    steps = exponent.shape[0]
+    largest = float(exponent.max()) if steps else 0.0
+    chunk = steps if largest <= 0.0 else max(1, int(_MAX_CHUNK_EXPONENT // largest))
+
+    result = np.empty_like(target)
+    previous = initial
+    for lo in range(0, steps, chunk):
+        hi = min(lo + chunk, steps)
+        log_decay = -np.cumsum(exponent[lo:hi], axis=0)
+        decay = np.exp(log_decay)
+        forcing = -np.expm1(-exponent[lo:hi]) * target[lo:hi]
+        accumulated = np.cumsum(forcing * np.exp(-log_decay), axis=0)
+        result[lo:hi] = decay * (previous + accumulated)
+        previous = result[hi - 1]
+    return result
+
+def _generate_history_vectorized(start, steps, step_seconds, devices, seed,
+                                 params, actuators, utc_offset):
+    p = dict(DEFAULT_PARAMS, **(params or {}))
+    rng = np.random.default_rng(seed)
+
+    timestamps = start + step_seconds * np.arange(steps, dtype=np.float64)
+    hour = ((timestamps + utc_offset) % SECONDS_PER_DAY)[:, None] / 3600.0
+    light_on = np.asarray(actuators['light'], dtype=bool).reshape(steps, -1)
+    fan_on = np.asarray(actuators['fan'], dtype=bool).reshape(steps, -1)
+    pump_on = np.asarray(actuators['water_pump'], dtype=bool).reshape(steps, -1)
+    shape = (steps, devices)
+
+    outdoor_temp = p['outdoor_temp_mean'] + p['outdoor_temp_amplitude'] * np.cos(
+        2 * np.pi * (hour - p['outdoor_temp_peak_hour']) / 24.0)
+    outdoor_humidity = p['outdoor_humidity_mean'] + p['outdoor_humidity_amplitude'] * np.cos(
+        2 * np.pi * (hour - p['outdoor_humidity_peak_hour']) / 24.0)
+    phase = (hour - p['sunrise_hour']) / (p['sunset_hour'] - p['sunrise_hour'])
+    daylight = np.where((phase > 0.0) & (phase < 1.0),
+                        p['daylight_peak_lux'] * np.sin(np.pi * np.clip(phase, 0.0, 1.0)), 0.0)
+    lux = np.broadcast_to(daylight + light_on * p['grow_light_lux'], shape)
+
+    temperature_offset = rng.normal(0.0, 1.0, devices)
+    humidity_offset = rng.normal(0.0, 3.0, devices)
+    soil_initial = rng.uniform(40.0, 80.0, devices)
+
+    dry_rate = p['soil_dry_rate'] * (1.0 + lux * p['soil_light_dry_factor'])
+    fill_rate = np.broadcast_to(pump_on * p['soil_fill_rate'], shape)
+    soil_rate = dry_rate + fill_rate
+    soil = _relax_series(soil_initial, soil_rate, 100.0 * fill_rate / soil_rate, step_seconds)
+
+    fan = np.broadcast_to(fan_on, shape)
+    thermal_rate = p['thermal_rate'] + fan * p['fan_thermal_rate']
+    temp_target = outdoor_temp + p['thermal_rate'] * p['light_heat_gain'] * lux / thermal_rate + temperature_offset
+    temperature = _relax_series(temp_target[0], thermal_rate, temp_target, step_seconds)
+
+    humidity_rate = p['humidity_rate'] + fan * p['fan_humidity_rate']
+    inside_humidity = (p['humidity_reference']
+                       - p['humidity_temp_coefficient'] * (temperature - p['humidity_reference_temp'])
+                       + p['transpiration_humidity'] * soil / 100.0)
+    humidity_target = (p['humidity_rate'] * inside_humidity
+                       + fan * p['fan_humidity_rate'] * outdoor_humidity) / humidity_rate + humidity_offset
+    humidity = _relax_series(humidity_target[0], humidity_rate, humidity_target, step_seconds)
+
+    return {
+        'timestamp': timestamps,
+        'temperature': np.round(temperature + rng.normal(0.0, p['temperature_noise'], shape), 1),
+        'humidity': np.round(np.clip(humidity + rng.normal(0.0, p['humidity_noise'], shape), 0.0, 100.0), 1),
+        'light_level': np.round(np.maximum(lux * (1.0 + rng.normal(0.0, p['light_noise'], shape)), 0.0), 1),
+        'soil_moisture': np.round(np.clip(soil + rng.normal(0.0, p['soil_noise'], shape), 0.0, 100.0), 1),
+    }
@@ -0,0 +1,77 @@
+// alerts.js - Shows active alerts in a banner on every page
+
+// Render the active alerts into the banner
+function renderAlerts(alerts) {
+    const banner = document.getElementById('alert-banner');
+    if (!banner) {
+        return;
+    }
+    
+    banner.innerHTML = '';
+    alerts.filter(alert => !alert.acknowledged).forEach(alert => {
+        const item = document.createElement('div');
+        item.className = 'alert alert-dismissible fade show ' +
+            (alert.severity === 'critical' ? 'alert-danger' : 'alert-warning');
+        item.setAttribute('role', 'alert');
+        
+        const message = document.createElement('span');
+        message.textContent = alert.message;
+        item.appendChild(message);
+        
+        // Dismissing an alert acknowledges it
+        const button = document.createElement('button');
+        button.type = 'button';
+        button.className = 'btn-close';
+        button.setAttribute('aria-label', 'Acknowledge');
+        button.addEventListener('click', () => acknowledgeAlert(alert.id, item));
+        item.appendChild(button);
+        
+        banner.appendChild(item);
+    });
+}
+
+// Acknowledge an alert and remove it from the banner
+function acknowledgeAlert(id, item) {
+    fetch(`/api/alerts/${id}/acknowledge`, { method: 'POST' })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Failed to acknowledge alert');
+            }
+            item.remove();
+        })
+        .catch(error => {
+            console.error('Error acknowledging alert:', error);
+        });
+}
+
+// Seconds between alert checks; unchanged alerts are answered with 304 from the ETag
+const ALERT_POLL_INTERVAL = 15;
+
+// Fetch the active alerts once
+function pollAlerts() {
+    // Skip checks while the tab is in the background
+    if (document.hidden) {
+        return;
+    }
+    
+    // no-cache revalidates with If-None-Match instead of downloading the alerts again
+    fetch('/api/alerts?active=1', { cache: 'no-cache' })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Failed to fetch alerts');
+            }
+            return response.json();
+        })
+        .then(renderAlerts)
+        .catch(error => {
+            console.error('Error fetching alerts:', error);
+        });
+}
+
+// Poll for alert updates. A stream per open page would hold a server
+// thread for as long as the page is open, so short polls are used instead.
+document.addEventListener('DOMContentLoaded', function() {
+    pollAlerts();
+    setInterval(pollAlerts, ALERT_POLL_INTERVAL * 1000);
+    document.addEventListener('visibilitychange', pollAlerts);
+});
@@ -1,17 +1,19 @@
 // charts.js - Functions for creating and updating charts for history page
 
+// Format an epoch-ms timestamp as an hour label
+function formatHourLabel(timestamp) {
+    return new Date(timestamp).getHours() + ':00';
+}
+
 // Create temperature chart with daily and hourly data
 function createTemperatureChart(hourlyData, dailyData, container) {
     const ctx = document.getElementById(container);
     if (!ctx) return null;
     
-    // Format hourly data
-    const hourlyLabels = hourlyData.map(item => {
-        const date = new Date(item.timestamp);
-        return date.getHours() + ':00';
-    });
+    // Format hourly data (columnar: epoch-ms timestamps and parallel value arrays)
+    const hourlyLabels = hourlyData.timestamp.map(formatHourLabel);
     
-    const hourlyTemps = hourlyData.map(item => item.temperature);
+    const hourlyTemps = hourlyData.temperature;
     
     // Create chart
     const chart = new Chart(ctx, {
@@ -65,13 +67,10 @@ function createHumidityChart(hourlyData, dailyData, container) {
     const ctx = document.getElementById(container);
     if (!ctx) return null;
     
-    // Format hourly data
-    const hourlyLabels = hourlyData.map(item => {
-        const date = new Date(item.timestamp);
-        return date.getHours() + ':00';
-    });
+    // Format hourly data (columnar: epoch-ms timestamps and parallel value arrays)
+    const hourlyLabels = hourlyData.timestamp.map(formatHourLabel);
     
-    const hourlyHumidity = hourlyData.map(item => item.humidity);
+    const hourlyHumidity = hourlyData.humidity;
     
     // Create chart
     const chart = new Chart(ctx, {
@@ -125,13 +124,10 @@ function createLightChart(hourlyData, dailyData, container) {
     const ctx = document.getElementById(container);
     if (!ctx) return null;
     
-    // Format hourly data
-    const hourlyLabels = hourlyData.map(item => {
-        const date = new Date(item.timestamp);
-        return date.getHours() + ':00';
-    });
+    // Format hourly data (columnar: epoch-ms timestamps and parallel value arrays)
+    const hourlyLabels = hourlyData.timestamp.map(formatHourLabel);
     
-    const hourlyLight = hourlyData.map(item => item.light_level);
+    const hourlyLight = hourlyData.light_level;
     
     // Create chart
     const chart = new Chart(ctx, {
@@ -185,13 +181,10 @@ function createSoilMoistureChart(hourlyData, dailyData, container) {
     const ctx = document.getElementById(container);
     if (!ctx) return null;
     
-    // Format hourly data
-    const hourlyLabels = hourlyData.map(item => {
-        const date = new Date(item.timestamp);
-        return date.getHours() + ':00';
-    });
+    // Format hourly data (columnar: epoch-ms timestamps and parallel value arrays)
+    const hourlyLabels = hourlyData.timestamp.map(formatHourLabel);
     
-    const hourlySoil = hourlyData.map(item => item.soil_moisture);
+    const hourlySoil = hourlyData.soil_moisture;
     
     // Create chart
     const chart = new Chart(ctx, {
@@ -321,9 +314,11 @@ function createMinMaxChart(dailyData, dataType, container, label, color) {
     return chart;
 }
 
-// Fetch chart data with specified time range
-function fetchChartData(timeRange) {
-    // Convert time range to hours for API call
+// Chart data currently shown, kept to merge incremental updates into
+const chartState = { hours: null, hourly: null, daily: null };
+
+// Convert a time range selector value to hours
+function rangeToHours(timeRange) {
     let hours = 24;
     switch (timeRange) {
         case '12h':
@@ -341,6 +336,12 @@ function fetchChartData(timeRange) {
         default:
             hours = 24;
     }
+    return hours;
+}
+
+// Fetch chart data with specified time range
+function fetchChartData(timeRange) {
+    const hours = rangeToHours(timeRange);
     
     // Show loading indicator
     const loadingIndicator = document.getElementById('chart-loading');
@@ -348,37 +349,63 @@ function fetchChartData(timeRange) {
         loadingIndicator.style.display = 'block';
     }
     
-    // Fetch hourly data
-    fetch(`/api/sensors/hourly?hours=${hours}`)
-        .then(response => response.json())
-        .then(hourlyData => {
-            // Fetch daily data for min/max charts
-            fetch('/api/sensors/daily?days=7')
-                .then(response => response.json())
-                .then(dailyData => {
-                    // Initialize charts
-                    initializeCharts(hourlyData, dailyData);
-                    
-                    // Hide loading indicator
-                    if (loadingIndicator) {
-                        loadingIndicator.style.display = 'none';
-                    }
-                })
-                .catch(error => {
-                    console.error('Error fetching daily data:', error);
-                    if (loadingIndicator) {
-                        loadingIndicator.style.display = 'none';
-                    }
-                });
+    // Fetch hourly and daily data in one request
+    fetch(`/api/sensors/charts?hours=${hours}&days=7`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Failed to fetch chart data');
+            }
+            return response.json();
+        })
+        .then(data => {
+            chartState.hours = hours;
+            chartState.hourly = data.hourly;
+            chartState.daily = data.daily;
+            
+            // Initialize charts
+            initializeCharts(data.hourly, data.daily);
         })
         .catch(error => {
-            console.error('Error fetching hourly data:', error);
+            console.error('Error fetching chart data:', error);
+        })
+        .finally(() => {
+            // Hide loading indicator
             if (loadingIndicator) {
                 loadingIndicator.style.display = 'none';
             }
         });
 }
 
+// Fetch only the buckets that changed since the newest one shown and merge them in
+function refreshChartData() {
+    const hourly = chartState.hourly;
+    if (!hourly || hourly.timestamp.length === 0) {
+        return;
+    }
+    const hours = chartState.hours;
+    const since = hourly.timestamp[hourly.timestamp.length - 1];
+    
+    fetch(`/api/sensors/charts?hours=${hours}&days=7&since=${since}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Failed to fetch chart data');
+            }
+            return response.json();
+        })
+        .then(data => {
+            // Ignore updates for a range that is no longer selected
+            if (chartState.hours !== hours) {
+                return;
+            }
+            chartState.hourly = mergeColumns(chartState.hourly, data.hourly, hours * 3600000);
+            chartState.daily = mergeDailyRows(chartState.daily, data.daily, 7);
+            initializeCharts(chartState.hourly, chartState.daily);
+        })
+        .catch(error => {
+            console.error('Error refreshing chart data:', error);
+        });
+}
+
 // Initialize all charts with fetched data
 function initializeCharts(hourlyData, dailyData) {
     // Clear existing charts if needed
@@ -447,6 +474,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Fetch initial data and create charts
     fetchChartData(selectedRange);
     
+    // Merge in new data periodically
+    setInterval(refreshChartData, 60000);  // Update every minute
+    
     // Set up event listener for time range changes
     if (timeRangeSelect) {
         timeRangeSelect.addEventListener('change', function() {
@@ -1,41 +1,56 @@
 // controls.js - Handles the manual controls page functionality
 
-// Update control states
-function updateControlStates() {
-    fetch('/api/controls/status')
+// Section versions of the last controls snapshot
+const controlsVersions = {};
+
+// Fetch control states and settings in one request, skipping unchanged sections
+function refreshControls() {
+    const params = new URLSearchParams({ sections: 'controls,settings', ...controlsVersions });
+    fetch(`/api/dashboard/snapshot?${params}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error('Failed to fetch control status');
             }
             return response.json();
         })
-        .then(data => {
-            // Update fan switch
-            const fanSwitch = document.getElementById('fan-switch');
-            if (fanSwitch) {
-                fanSwitch.checked = data.fan;
-            }
-            
-            // Update light switch
-            const lightSwitch = document.getElementById('light-switch');
-            if (lightSwitch) {
-                lightSwitch.checked = data.light;
+        .then(snapshot => {
+            Object.assign(controlsVersions, snapshot.versions);
+            if (snapshot.sections.controls) {
+                updateControlStates(snapshot.sections.controls);
             }
-            
-            // Update water pump switch
-            const pumpSwitch = document.getElementById('pump-switch');
-            if (pumpSwitch) {
-                pumpSwitch.checked = data.water_pump;
+            if (snapshot.sections.settings) {
+                updateAutoSettings(snapshot.sections.settings);
             }
-            
-            // Update status badges
-            updateStatusBadges(data);
         })
         .catch(error => {
             console.error('Error fetching control status:', error);
         });
 }
 
+// Update control states
+function updateControlStates(data) {
+    // Update fan switch
+    const fanSwitch = document.getElementById('fan-switch');
+    if (fanSwitch) {
+        fanSwitch.checked = data.fan;
+    }
+    
+    // Update light switch
+    const lightSwitch = document.getElementById('light-switch');
+    if (lightSwitch) {
+        lightSwitch.checked = data.light;
+    }
+    
+    // Update water pump switch
+    const pumpSwitch = document.getElementById('pump-switch');
+    if (pumpSwitch) {
+        pumpSwitch.checked = data.water_pump;
+    }
+    
+    // Update status badges
+    updateStatusBadges(data);
+}
+
 // Update status badges for controls
 function updateStatusBadges(data) {
     // Fan status
@@ -61,31 +76,43 @@ function updateStatusBadges(data) {
 }
 
 // Update auto control settings
-function updateAutoSettings() {
-    fetch('/api/settings')
+function updateAutoSettings(settings) {
+    // Fan auto control
+    const fanAuto = document.getElementById('fan-auto');
+    if (fanAuto) {
+        fanAuto.checked = settings.fan_auto === 'true';
+    }
+    
+    // Light auto control
+    const lightAuto = document.getElementById('light-auto');
+    if (lightAuto) {
+        lightAuto.checked = settings.light_auto === 'true';
+    }
+    
+    // Water pump auto control
+    const waterAuto = document.getElementById('water-auto');
+    if (waterAuto) {
+        waterAuto.checked = settings.water_auto === 'true';
+    }
+}
+
+// Follow a control command the sensor Pi has not acknowledged yet (202
+// response) and resolve with the status that acknowledged it. Deferred
+// commands wait for the relay's minimum on/off time, so they are polled
+// more slowly and without using up the attempts.
+function waitForCommand(data, attempts = 20) {
+    const command = data.command;
+    if (!command || command.state === 'acknowledged') {
+        return Promise.resolve(command ? command.status : null);
+    }
+    const deferred = command.state === 'deferred';
+    if ((command.state !== 'pending' && !deferred) || attempts <= 0) {
+        return Promise.reject(new Error(`Command ${command.command} not acknowledged`));
+    }
+    return new Promise(resolve => setTimeout(resolve, deferred ? 2000 : 500))
+        .then(() => fetch(`/api/controls/commands/${command.id}`))
         .then(response => response.json())
-        .then(settings => {
-            // Fan auto control
-            const fanAuto = document.getElementById('fan-auto');
-            if (fanAuto) {
-                fanAuto.checked = settings.fan_auto === 'true';
-            }
-            
-            // Light auto control
-            const lightAuto = document.getElementById('light-auto');
-            if (lightAuto) {
-                lightAuto.checked = settings.light_auto === 'true';
-            }
-            
-            // Water pump auto control
-            const waterAuto = document.getElementById('water-auto');
-            if (waterAuto) {
-                waterAuto.checked = settings.water_auto === 'true';
-            }
-        })
-        .catch(error => {
-            console.error('Error fetching auto settings:', error);
-        });
+        .then(command => waitForCommand({ command: command }, deferred ? attempts : attempts - 1));
 }
 
 // Toggle fan state
@@ -103,12 +130,13 @@ function toggleFan(state) {
         }
         return response.json();
     })
-    .then(data => {
+    .then(data => waitForCommand(data).then(status => status ? status.fan : data.fan_state))
+    .then(result => {
         // Update UI after successful operation
         const fanStatus = document.getElementById('fan-status');
         if (fanStatus) {
-            fanStatus.textContent = data.fan_state ? 'ON' : 'OFF';
-            fanStatus.className = data.fan_state ? 'badge bg-success' : 'badge bg-secondary';
+            fanStatus.textContent = result ? 'ON' : 'OFF';
+            fanStatus.className = result ? 'badge bg-success' : 'badge bg-secondary';
         }
     })
     .catch(error => {
@@ -139,12 +167,13 @@ function toggleLight(state) {
         }
         return response.json();
     })
-    .then(data => {
+    .then(data => waitForCommand(data).then(status => status ? status.light : data.light_state))
+    .then(result => {
         // Update UI after successful operation
         const lightStatus = document.getElementById('light-status');
         if (lightStatus) {
-            lightStatus.textContent = data.light_state ? 'ON' : 'OFF';
-            lightStatus.className = data.light_state ? 'badge bg-success' : 'badge bg-secondary';
+            lightStatus.textContent = result ? 'ON' : 'OFF';
+            lightStatus.className = result ? 'badge bg-success' : 'badge bg-secondary';
         }
     })
     .catch(error => {
@@ -175,12 +204,13 @@ function toggleWaterPump(state) {
         }
         return response.json();
     })
-    .then(data => {
+    .then(data => waitForCommand(data).then(status => status ? status.water_pump : data.water_pump_state))
+    .then(result => {
         // Update UI after successful operation
         const pumpStatus = document.getElementById('pump-status');
         if (pumpStatus) {
-            pumpStatus.textContent = data.water_pump_state ? 'ON' : 'OFF';
-            pumpStatus.className = data.water_pump_state ? 'badge bg-success' : 'badge bg-secondary';
+            pumpStatus.textContent = result ? 'ON' : 'OFF';
+            pumpStatus.className = result ? 'badge bg-success' : 'badge bg-secondary';
         }
     })
     .catch(error => {
@@ -236,9 +266,8 @@ function toggleAutoControl(device, state) {
 
 // Initialize the controls page
 document.addEventListener('DOMContentLoaded', function() {
-    // Initial update of control states
-    updateControlStates();
-    updateAutoSettings();
+    // Initial update of control states and auto settings
+    refreshControls();
     
     // Setup event listeners for fan control
     const fanSwitch = document.getElementById('fan-switch');
@@ -287,5 +316,5 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     // Set interval for periodic updates
-    setInterval(updateControlStates, 5000);  // Update every 5 seconds
+    setInterval(refreshControls, 5000);  // Update every 5 seconds
 });
@@ -1,165 +1,183 @@
 // dashboard.js - Handles the dashboard page functionality
 
-// Update sensor readings periodically
-function updateSensorReadings() {
-    fetch('/api/sensors/current')
+// Versions and data of the dashboard snapshot sections received so far
+const dashboardState = { versions: {}, sections: {}, charts: {} };
+
+// Fetch the sections that changed since the last snapshot and update the page
+function refreshDashboard() {
+    // Send the known section versions so unchanged sections are left out,
+    // and the newest hourly bucket so only the trailing buckets are resent
+    const params = new URLSearchParams(dashboardState.versions);
+    const hourly = dashboardState.sections.hourly;
+    if (hourly && hourly.timestamp.length > 0) {
+        params.set('since', hourly.timestamp[hourly.timestamp.length - 1]);
+    }
+    fetch(`/api/dashboard/snapshot?${params}`)
         .then(response => {
             if (!response.ok) {
-                throw new Error('Failed to fetch sensor data');
+                throw new Error('Failed to fetch dashboard snapshot');
             }
             return response.json();
         })
-        .then(data => {
-            // Update temperature display
-            const tempElement = document.getElementById('current-temperature');
-            if (tempElement && data.temperature) {
-                tempElement.textContent = data.temperature.toFixed(1) + '°C';
+        .then(snapshot => {
+            const changed = snapshot.sections;
+            Object.assign(dashboardState.versions, snapshot.versions);
+            if (snapshot.partial.includes('hourly')) {
+                changed.hourly = mergeColumns(dashboardState.sections.hourly, changed.hourly, 24 * 3600000);
             }
+            Object.assign(dashboardState.sections, changed);
             
-            // Update humidity display
-            const humidityElement = document.getElementById('current-humidity');
-            if (humidityElement && data.humidity) {
-                humidityElement.textContent = data.humidity.toFixed(1) + '%';
+            if ((changed.sensors || changed.settings) && dashboardState.sections.sensors) {
+                updateSensorReadings(dashboardState.sections.sensors, dashboardState.sections.settings);
             }
-            
-            // Update light level display
-            const lightElement = document.getElementById('current-light');
-            if (lightElement && data.light_level) {
-                lightElement.textContent = data.light_level.toFixed(1) + ' lux';
+            if (changed.controls) {
+                updateControlStates(changed.controls);
             }
-            
-            // Update soil moisture display
-            const soilElement = document.getElementById('current-soil');
-            if (soilElement && data.soil_moisture) {
-                soilElement.textContent = data.soil_moisture.toFixed(1) + '%';
+            if (changed.hourly) {
+                updateDashboardCharts(changed.hourly);
             }
-            
-            // Update timestamp
-            const timestampElement = document.getElementById('reading-timestamp');
-            if (timestampElement && data.timestamp) {
-                const date = new Date(data.timestamp);
-                timestampElement.textContent = date.toLocaleString();
-            }
-            
-            // Update status indicators
-            updateStatusIndicators(data);
         })
         .catch(error => {
-            console.error('Error fetching sensor data:', error);
+            console.error('Error fetching dashboard snapshot:', error);
         });
 }
 
-// Update control states periodically
-function updateControlStates() {
-    fetch('/api/controls/status')
-        .then(response => {
-            if (!response.ok) {
-                throw new Error('Failed to fetch control status');
-            }
-            return response.json();
-        })
-        .then(data => {
-            // Update fan status
-            const fanElement = document.getElementById('fan-status');
-            if (fanElement) {
-                fanElement.textContent = data.fan ? 'ON' : 'OFF';
-                fanElement.className = data.fan ? 'badge bg-success' : 'badge bg-danger';
-            }
-            
-            // Update light status
-            const lightElement = document.getElementById('light-status');
-            if (lightElement) {
-                lightElement.textContent = data.light ? 'ON' : 'OFF';
-                lightElement.className = data.light ? 'badge bg-success' : 'badge bg-danger';
-            }
-            
-            // Update water pump status
-            const pumpElement = document.getElementById('pump-status');
-            if (pumpElement) {
-                lightElement.textContent = data.water_pump ? 'ON' : 'OFF';
-                lightElement.className = data.water_pump ? 'badge bg-success' : 'badge bg-danger';
-            }
-        })
-        .catch(error => {
-            console.error('Error fetching control status:', error);
-        });
+// Update sensor readings
+function updateSensorReadings(data, settings) {
+    // Update temperature display
+    const tempElement = document.getElementById('current-temperature');
+    if (tempElement && data.temperature) {
+        tempElement.textContent = data.temperature.toFixed(1) + '°C';
+    }
+    
+    // Update humidity display
+    const humidityElement = document.getElementById('current-humidity');
+    if (humidityElement && data.humidity) {
+        humidityElement.textContent = data.humidity.toFixed(1) + '%';
+    }
+    
+    // Update light level display
+    const lightElement = document.getElementById('current-light');
+    if (lightElement && data.light_level) {
+        lightElement.textContent = data.light_level.toFixed(1) + ' lux';
+    }
+    
+    // Update soil moisture display
+    const soilElement = document.getElementById('current-soil');
+    if (soilElement && data.soil_moisture) {
+        soilElement.textContent = data.soil_moisture.toFixed(1) + '%';
+    }
+    
+    // Update timestamp
+    const timestampElement = document.getElementById('reading-timestamp');
+    if (timestampElement && data.timestamp) {
+        const date = new Date(data.timestamp);
+        timestampElement.textContent = date.toLocaleString();
+    }
+    
+    // Update status indicators
+    if (settings) {
+        updateStatusIndicators(data, settings);
+    }
 }
 
-// Update status indicators based on sensor readings
-function updateStatusIndicators(data) {
-    // Fetch settings to get thresholds
-    fetch('/api/settings')
-        .then(response => response.json())
-        .then(settings => {
-            // Temperature status
-            const tempStatus = document.getElementById('temperature-status');
-            if (tempStatus && data.temperature) {
-                const tempMin = parseFloat(settings.temperature_min);
-                const tempMax = parseFloat(settings.temperature_max);
-                
-                if (data.temperature < tempMin) {
-                    tempStatus.textContent = 'TOO LOW';
-                    tempStatus.className = 'badge bg-info';
-                } else if (data.temperature > tempMax) {
-                    tempStatus.textContent = 'TOO HIGH';
-                    tempStatus.className = 'badge bg-danger';
-                } else {
-                    tempStatus.textContent = 'GOOD';
-                    tempStatus.className = 'badge bg-success';
-                }
-            }
-            
-            // Humidity status
-            const humidityStatus = document.getElementById('humidity-status');
-            if (humidityStatus && data.humidity) {
-                const humidityMin = parseFloat(settings.humidity_min);
-                const humidityMax = parseFloat(settings.humidity_max);
-                
-                if (data.humidity < humidityMin) {
-                    humidityStatus.textContent = 'TOO LOW';
-                    humidityStatus.className = 'badge bg-warning';
-                } else if (data.humidity > humidityMax) {
-                    humidityStatus.textContent = 'TOO HIGH';
-                    humidityStatus.className = 'badge bg-info';
-                } else {
-                    humidityStatus.textContent = 'GOOD';
-                    humidityStatus.className = 'badge bg-success';
-                }
-            }
-        })
-        .catch(error => {
-            console.error('Error fetching settings:', error);
-        });
+// Update control states
+function updateControlStates(data) {
+    // Update fan status
+    const fanElement = document.getElementById('fan-status');
+    if (fanElement) {
+        fanElement.textContent = data.fan ? 'ON' : 'OFF';
+        fanElement.className = data.fan ? 'badge bg-success' : 'badge bg-danger';
+    }
+    
+    // Update light status
+    const lightElement = document.getElementById('light-status');
+    if (lightElement) {
+        lightElement.textContent = data.light ? 'ON' : 'OFF';
+        lightElement.className = data.light ? 'badge bg-success' : 'badge bg-danger';
+    }
+    
+    // Update water pump status
+    const pumpElement = document.getElementById('pump-status');
+    if (pumpElement) {
+        pumpElement.textContent = data.water_pump ? 'ON' : 'OFF';
+        pumpElement.className = data.water_pump ? 'badge bg-success' : 'badge bg-danger';
+    }
 }
 
-// Initialize dashboard charts
-function initDashboardCharts() {
-    // Fetch 24-hour data for charts
-    fetch('/api/sensors/hourly?hours=24')
-        .then(response => response.json())
-        .then(data => {
-            createTemperatureChart(data);
-            createHumidityChart(data);
-            createLightChart(data);
-        })
-        .catch(error => {
-            console.error('Error fetching chart data:', error);
-        });
+// Update status indicators based on sensor readings and thresholds
+function updateStatusIndicators(data, settings) {
+    // Temperature status
+    const tempStatus = document.getElementById('temperature-status');
+    if (tempStatus && data.temperature) {
+        const tempMin = parseFloat(settings.temperature_min);
+        const tempMax = parseFloat(settings.temperature_max);
+        
+        if (data.temperature < tempMin) {
+            tempStatus.textContent = 'TOO LOW';
+            tempStatus.className = 'badge bg-info';
+        } else if (data.temperature > tempMax) {
+            tempStatus.textContent = 'TOO HIGH';
+            tempStatus.className = 'badge bg-danger';
+        } else {
+            tempStatus.textContent = 'GOOD';
+            tempStatus.className = 'badge bg-success';
+        }
+    }
+    
+    // Humidity status
+    const humidityStatus = document.getElementById('humidity-status');
+    if (humidityStatus && data.humidity) {
+        const humidityMin = parseFloat(settings.humidity_min);
+        const humidityMax = parseFloat(settings.humidity_max);
+        
+        if (data.humidity < humidityMin) {
+            humidityStatus.textContent = 'TOO LOW';
+            humidityStatus.className = 'badge bg-warning';
+        } else if (data.humidity > humidityMax) {
+            humidityStatus.textContent = 'TOO HIGH';
+            humidityStatus.className = 'badge bg-info';
+        } else {
+            humidityStatus.textContent = 'GOOD';
+            humidityStatus.className = 'badge bg-success';
+        }
+    }
+}
+
+// Create the dashboard charts from columnar hourly averages, or update them in place
+function updateDashboardCharts(data) {
+    const charts = dashboardState.charts;
+    if (Object.keys(charts).length === 0) {
+        charts.temperature = createTemperatureChart(data);
+        charts.humidity = createHumidityChart(data);
+        charts.light_level = createLightChart(data);
+        return;
+    }
+    
+    Object.entries(charts).forEach(([metric, chart]) => {
+        if (chart) {
+            chart.data.labels = data.timestamp.map(formatHourLabel);
+            chart.data.datasets[0].data = data[metric];
+            chart.update('none');
+        }
+    });
+}
+
+// Format an epoch-ms timestamp as an hour label
+function formatHourLabel(timestamp) {
+    return new Date(timestamp).getHours() + ':00';
 }
 
 // Create temperature chart
 function createTemperatureChart(data) {
     const ctx = document.getElementById('temperature-chart');
-    if (!ctx) return;
+    if (!ctx) return null;
     
-    const labels = data.map(item => {
-        const date = new Date(item.timestamp);
-        return date.getHours() + ':00';
-    });
+    const labels = data.timestamp.map(formatHourLabel);
     
-    const temperatures = data.map(item => item.temperature);
+    const temperatures = data.temperature;
     
-    new Chart(ctx, {
+    return new Chart(ctx, {
         type: 'line',
         data: {
             labels: labels,
@@ -206,16 +224,13 @@ function createTemperatureChart(data) {
 // Create humidity chart
 function createHumidityChart(data) {
     const ctx = document.getElementById('humidity-chart');
-    if (!ctx) return;
+    if (!ctx) return null;
     
-    const labels = data.map(item => {
-        const date = new Date(item.timestamp);
-        return date.getHours() + ':00';
-    });
+    const labels = data.timestamp.map(formatHourLabel);
     
-    const humidities = data.map(item => item.humidity);
+    const humidities = data.humidity;
     
-    new Chart(ctx, {
+    return new Chart(ctx, {
         type: 'line',
         data: {
             labels: labels,
@@ -262,16 +277,13 @@ function createHumidityChart(data) {
 // Create light level chart
 function createLightChart(data) {
     const ctx = document.getElementById('light-chart');
-    if (!ctx) return;
+    if (!ctx) return null;
     
-    const labels = data.map(item => {
-        const date = new Date(item.timestamp);
-        return date.getHours() + ':00';
-    });
+    const labels = data.timestamp.map(formatHourLabel);
     
-    const lightLevels = data.map(item => item.light_level);
+    const lightLevels = data.light_level;
     
-    new Chart(ctx, {
+    return new Chart(ctx, {
         type: 'line',
         data: {
             labels: labels,
@@ -317,12 +329,9 @@ function createLightChart(data) {
 
 // Initialize dashboard
 document.addEventListener('DOMContentLoaded', function() {
-    // Initial updates
-    updateSensorReadings();
-    updateControlStates();
-    initDashboardCharts();
+    // Initial update
+    refreshDashboard();
     
-    // Set intervals for updates
-    setInterval(updateSensorReadings, 30000);  // Update every 30 seconds
-    setInterval(updateControlStates, 10000);   // Update every 10 seconds
+    // Poll for changed sections
+    setInterval(refreshDashboard, 10000);  // Update every 10 seconds
 });
@@ -0,0 +1,40 @@
+// series.js - Merging incremental ("since") updates into chart data held by the page
+
+// Merge columnar buckets from the first updated one on into held columnar data,
+// dropping buckets older than windowMs before the newest one
+function mergeColumns(held, update, windowMs) {
+    if (!held || !held.timestamp || update.timestamp.length === 0) {
+        return held || update;
+    }
+    
+    // Buckets from the first updated one on are replaced by the update
+    const first = update.timestamp[0];
+    let cut = held.timestamp.findIndex(ts => ts >= first);
+    if (cut === -1) {
+        cut = held.timestamp.length;
+    }
+    
+    const merged = {};
+    Object.keys(held).forEach(name => {
+        merged[name] = held[name].slice(0, cut).concat(update[name] || []);
+    });
+    
+    // Drop buckets that slid out of the window
+    const newest = merged.timestamp[merged.timestamp.length - 1];
+    const start = merged.timestamp.findIndex(ts => ts > newest - windowMs);
+    if (start > 0) {
+        Object.keys(merged).forEach(name => {
+            merged[name] = merged[name].slice(start);
+        });
+    }
+    return merged;
+}
+
+// Merge daily rows from the first updated day on into held rows, keeping the last `days` days
+function mergeDailyRows(held, update, days) {
+    if (!held || update.length === 0) {
+        return held || update;
+    }
+    const first = update[0].date;
+    return held.filter(row => row.date < first).concat(update).slice(-days);
+}
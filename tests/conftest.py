@@ -0,0 +1,18 @@
+"""Shared fixtures"""
+
+import pytest
+
+@pytest.fixture
+def app(tmp_path):
+    """App on an empty SQLite database with no subsystems running, inside an app context"""
+    from app import create_app
+    from models import db
+    import channel_store
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'growbox.db'}"}, start=False)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+    channel_store.device_ids.clear()
+    channel_store.metric_ids.clear()
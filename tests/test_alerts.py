@@ -0,0 +1,71 @@
+"""Tests for the streaming alert engine"""
+
+import pytest
+
+from alerts import AlertEngine, get_alerts
+
+RULES = [
+    {'name': 'temperature_high', 'kind': 'threshold', 'metric': 'temperature', 'above': 'temperature_max',
+     'duration': 300, 'cooldown': 900},
+    {'name': 'temperature_rate', 'kind': 'rate', 'metric': 'temperature', 'max_rate': 2.0, 'window': 60},
+    {'name': 'device_offline', 'kind': 'offline', 'severity': 'critical'},
+]
+
+@pytest.fixture
+def engine(app):
+    engine = AlertEngine(RULES)
+    engine.settings = {'temperature_max': '30'}
+    # Keep the settings above instead of reading them from the database
+    engine.settings_loaded = float('inf')
+    return engine
+
+def evaluate(engine, ts, value, name='temperature_high'):
+    rule, = [rule for rules in engine.rules_by_metric.values() for rule in rules if rule.name == name]
+    engine._evaluate(rule, 'tent', ts, value, engine.settings)
+    return engine.states[(name, 'tent')]
+
+def test_threshold_is_raised_after_the_duration_once(engine):
+    assert evaluate(engine, 1000, 31.0).alert_id is None
+    assert evaluate(engine, 1299, 32.0).alert_id is None
+    state = evaluate(engine, 1300, 33.0)
+    assert state.alert_id is not None
+    evaluate(engine, 1400, 34.0)
+
+    alert, = get_alerts()
+    assert alert['rule'] == 'temperature_high' and alert['device'] == 'tent'
+    assert alert['value'] == 33.0 and alert['resolved_at'] is None
+    # The alert starts when the condition started
+    assert alert['started_at'] == '1970-01-01T00:16:40'
+
+def test_condition_must_hold_without_interruption(engine):
+    evaluate(engine, 1000, 31.0)
+    evaluate(engine, 1200, 25.0)
+    assert evaluate(engine, 1350, 31.0).alert_id is None
+    assert evaluate(engine, 1650, 31.0).alert_id is not None
+
+def test_resolved_alert_is_not_raised_again_before_the_cooldown(engine):
+    evaluate(engine, 1000, 31.0)
+    evaluate(engine, 1300, 31.0)
+    state = evaluate(engine, 1400, 25.0)
+    assert state.alert_id is None and state.cooldown_until == 2300
+    assert get_alerts(active_only=True) == []
+
+    evaluate(engine, 1500, 31.0)
+    assert evaluate(engine, 2299, 31.0).alert_id is None
+    assert evaluate(engine, 2300, 31.0).alert_id is not None
+    assert len(get_alerts()) == 2
+
+def test_rate_rule_measures_over_the_window(engine):
+    # 1.5 degrees in 10 s would be 9/min, but the window is 60 s
+    for ts, value in ((0, 20.0), (10, 21.5), (60, 21.6)):
+        engine.on_sample('tent', 'temperature', ts, value)
+    assert engine.states[('temperature_rate', 'tent')].alert_id is None
+
+    engine.on_sample('tent', 'temperature', 130, 25.0)
+    assert engine.states[('temperature_rate', 'tent')].alert_id is not None
+
+def test_offline_status_raises_and_resolves(engine):
+    engine.on_status('tent', 'offline', ts=1000)
+    assert get_alerts(active_only=True)[0]['rule'] == 'device_offline'
+    engine.on_status('tent', 'online', ts=1060)
+    assert get_alerts(active_only=True) == []
@@ -0,0 +1,30 @@
+"""Tests for the dashboard's automatic control rules"""
+
+from datetime import datetime, timedelta
+
+from models import db, SensorReading
+from data_storage import AUTOMATION_MAX_AGE, should_fan_be_on, update_setting
+
+def add_reading(temperature, age):
+    db.session.add(SensorReading(timestamp=datetime.utcnow() - timedelta(seconds=age), temperature=temperature,
+                                 humidity=50.0, light_level=100.0))
+    db.session.commit()
+
+def test_fan_follows_the_latest_reading_with_hysteresis(app):
+    assert should_fan_be_on() is None
+
+    add_reading(31.0, 60)
+    assert should_fan_be_on() is True
+    add_reading(29.0, 30)
+    assert should_fan_be_on() is None
+    add_reading(27.5, 0)
+    assert should_fan_be_on() is False
+
+def test_fan_is_left_alone_on_a_stale_reading(app):
+    add_reading(35.0, AUTOMATION_MAX_AGE + 60)
+    assert should_fan_be_on() is None
+
+def test_fan_is_left_alone_when_auto_control_is_off(app):
+    add_reading(35.0, 0)
+    update_setting('fan_auto', 'false')
+    assert should_fan_be_on() is None
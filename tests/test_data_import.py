@@ -0,0 +1,48 @@
+"""Tests for the bulk importer"""
+
+import io
+
+from sqlalchemy import select, func
+
+from models import db, SensorReading, MetricRollup
+from data_import import open_records, import_readings
+
+CSV = """timestamp,temperature,humidity,light_level,soil_moisture
+2024-05-01T10:00:00,21.5,55,1200,40
+2024-05-01T10:00:30,21.7,54,1210,
+2024-05-01T10:01:00,not a number,54,1210,40
+2024-05-01T10:01:30,150,54,1210,40
+"""
+
+NDJSON = """{"timestamp": "2024-05-01T10:00:00", "temperature": 21.5, "humidity": 55, "light_level": 1200}
+{"timestamp": "2024-05-01T10:00:30", "temperature": 21.7
+{"timestamp": 1714557660, "temperature": 21.9, "humidity": 54, "light_level": 1210}
+"""
+
+def test_csv_import_rejects_invalid_rows_and_builds_rollups(app, tmp_path):
+    path = tmp_path / 'readings.csv'
+    path.write_text(CSV)
+    stats = import_readings(open_records(str(path), chunk_size=1), chunk_size=1)
+
+    assert (stats['rows'], stats['rejected']) == (2, 2)
+    assert db.session.execute(select(func.count()).select_from(SensorReading)).scalar() == 2
+    assert db.session.execute(select(func.sum(MetricRollup.count))).scalar() == 7
+
+def test_malformed_ndjson_lines_are_rejected_one_by_one(app, tmp_path):
+    path = tmp_path / 'readings.ndjson'
+    path.write_text(NDJSON)
+    stats = import_readings(open_records(str(path)))
+
+    assert (stats['rows'], stats['rejected']) == (2, 1)
+
+def test_api_rejects_an_invalid_chunk_size(app):
+    client = app.test_client()
+    for chunk_size in ('many', '0'):
+        response = client.post(f'/api/sensors/import?format=csv&chunk_size={chunk_size}',
+                               data={'file': (io.BytesIO(CSV.encode()), 'readings.csv')})
+        assert response.status_code == 400
+        assert 'chunk_size' in response.get_json()['error']
+
+    response = client.post('/api/sensors/import?format=csv&chunk_size=2',
+                           data={'file': (io.BytesIO(CSV.encode()), 'readings.csv')})
+    assert response.get_json()['rows'] == 2
@@ -0,0 +1,57 @@
+"""Tests for the derived horticulture metrics"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from derived_metrics import DerivedMetrics, DLI_MAX_GAP, LUX_TO_PPFD, derive_dli_series, vapour_pressure_deficit
+from processing import QUALITY_OK, QUALITY_SUBSTITUTED, QUALITY_OUTLIER
+
+# 2024-05-01 06:00 UTC, the start of a photoperiod with light_start 6
+DAWN = int(datetime(2024, 5, 1, 6, tzinfo=timezone.utc).timestamp())
+
+def series(*samples):
+    """Light series dict from (epoch seconds, lux, quality) tuples"""
+    return {'timestamp': [ts * 1000 for ts, _, _ in samples], 'value': [value for _, value, _ in samples],
+            'quality': [quality for _, _, quality in samples]}
+
+def mol(lux, seconds):
+    return lux * LUX_TO_PPFD * seconds / 1e6
+
+def test_vpd_is_zero_at_saturation():
+    assert vapour_pressure_deficit(25.0, 100.0) == 0.0
+    assert vapour_pressure_deficit(25.0, 60.0) == pytest.approx(1.267, abs=1e-3)
+
+def test_dli_integrates_with_the_trapezoidal_rule():
+    result = derive_dli_series(series((DAWN, 10000, 0), (DAWN + 60, 20000, 0), (DAWN + 120, 20000, 0)),
+                               tz=timezone.utc)
+
+    assert result['timestamp'] == [DAWN * 1000, (DAWN + 60) * 1000, (DAWN + 120) * 1000]
+    assert result['dli'] == [0.0, pytest.approx(mol(15000, 60), abs=1e-4),
+                             pytest.approx(mol(15000, 60) + mol(20000, 60), abs=1e-4)]
+
+def test_dli_skips_substituted_samples_and_long_gaps():
+    gap = int(DLI_MAX_GAP) + 1
+    result = derive_dli_series(series((DAWN, 10000, 0), (DAWN + 30, 0, QUALITY_SUBSTITUTED),
+                                      (DAWN + 60, 10000, QUALITY_OUTLIER), (DAWN + 60 + gap, 10000, 0)),
+                               tz=timezone.utc)
+
+    assert result['quality'] == [QUALITY_OK, QUALITY_OUTLIER, QUALITY_OK]
+    # The gap is not integrated, the total carries on after it
+    assert result['dli'] == [0.0, pytest.approx(mol(10000, 60), abs=1e-4), pytest.approx(mol(10000, 60), abs=1e-4)]
+
+def test_dli_restarts_at_the_photoperiod_start():
+    result = derive_dli_series(series((DAWN - 60, 5000, 0), (DAWN - 30, 5000, 0), (DAWN + 30, 5000, 0)),
+                               tz=timezone.utc)
+    assert result['dli'][1] > 0.0
+    assert result['dli'][2] == 0.0
+
+def test_dli_series_matches_the_incremental_stage():
+    samples = [(DAWN - 90 + 45 * i, 1000.0 * (i % 7), 0) for i in range(40)]
+    samples[12] = (samples[12][0], 50000.0, QUALITY_SUBSTITUTED)
+    stage = DerivedMetrics()
+    stage.tz, stage.light_start, stage.settings_loaded = timezone.utc, 6.0, float('inf')
+    incremental = [value for ts, lux, quality in samples
+                   for _, _, value, _ in stage.on_sample('tent', 'light_level', ts, lux, quality)]
+
+    assert derive_dli_series(series(*samples), tz=timezone.utc)['dli'] == incremental
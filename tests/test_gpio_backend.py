@@ -0,0 +1,109 @@
+"""Tests for the in-memory GPIO backend and the code driving it"""
+
+import pytest
+
+from gpio_backend import MockGPIO, RISING
+from sensor_drivers import create_drivers
+
+class FakeClock:
+    """Monotonic clock advanced by hand"""
+
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def gpio(clock):
+    return MockGPIO(clock=clock)
+
+def test_write_records_one_entry_per_call(gpio, clock):
+    gpio.setup_output(5, False)
+    gpio.setup_output(6, False)
+    gpio.write({5: True, 6: True})
+    clock.advance(0.5)
+    gpio.write({6: False})
+
+    assert gpio.writes == [(100.0, {5: True, 6: True}), (100.5, {6: False})]
+    assert gpio.read(5) is True
+    assert gpio.read(6) is False
+
+def test_set_input_runs_callback_on_level_changes_only(gpio, clock):
+    edges = []
+    gpio.setup_input(17)
+    gpio.watch(17, lambda pin, level, ts: edges.append((pin, level, ts)))
+
+    assert gpio.set_input(17, True)
+    assert not gpio.set_input(17, True)
+    clock.advance(1.0)
+    assert gpio.set_input(17, False)
+    assert edges == [(17, True, 100.0), (17, False, 101.0)]
+
+def test_set_input_debounces_with_the_clock(gpio, clock):
+    edges = []
+    gpio.watch(17, lambda pin, level, ts: edges.append(ts), debounce_ms=50)
+
+    assert gpio.set_input(17, True)
+    clock.advance(0.02)
+    assert not gpio.set_input(17, False)
+    # The level still changes, only the callback is suppressed
+    assert gpio.read(17) is False
+    clock.advance(0.04)
+    assert gpio.set_input(17, True)
+    assert edges == [100.0, pytest.approx(100.06)]
+
+def test_watch_filters_edge_direction(gpio):
+    edges = []
+    gpio.watch(17, lambda pin, level, ts: edges.append(level), edge=RISING)
+
+    gpio.set_input(17, True)
+    gpio.set_input(17, False)
+    gpio.set_input(17, True)
+    assert edges == [True, True]
+
+def test_soil_edge_triggers_a_sample(gpio, clock):
+    config = {'sensors': [{'name': 'soil', 'type': 'soil_digital', 'pin': 17, 'pull': 'up', 'debounce': 50}]}
+    driver, = create_drivers(config, gpio=gpio)
+    assert not driver.simulated
+    assert gpio.modes[17] == 'in'
+
+    samples = []
+    driver.on_change = lambda: samples.append(driver.read())
+
+    # Pulled up: dry until the probe pulls the line low
+    clock.advance(1.0)
+    gpio.set_input(17, False)
+    clock.advance(0.01)
+    gpio.set_input(17, True)  # bounce, swallowed by the debounce
+    clock.advance(0.01)
+    gpio.set_input(17, False)
+
+    assert samples == [{'soil.moisture': 100.0}]
+    assert driver.read() == {'soil.moisture': 100.0}
+
+def test_relays_switch_in_one_batched_write(gpio, monkeypatch):
+    import sensor_client
+
+    monkeypatch.setattr(sensor_client, 'gpio', gpio)
+    monkeypatch.setattr(sensor_client, 'control_state', {'fan': False, 'light': False, 'water_pump': False})
+    monkeypatch.setattr(sensor_client, 'send_control_status', lambda acks=None, deferred=None: True)
+    for pin in sensor_client.ACTUATOR_PINS.values():
+        gpio.setup_output(pin, False)
+
+    processor = sensor_client.CommandProcessor(min_times={})
+    processor.submit('fan', True, 'a')
+    processor.submit_batch({'light': True, 'water_pump': True}, 'b')
+    processor.submit('water_pump', False, 'c')
+    processor.flush()
+
+    pins = sensor_client.ACTUATOR_PINS
+    assert gpio.writes == [(100.0, {pins['fan']: True, pins['light']: True})]
+    assert sensor_client.control_state == {'fan': True, 'light': True, 'water_pump': False}
@@ -0,0 +1,32 @@
+"""Tests for the dashboard side of actuator control"""
+
+import pytest
+
+import hardware
+import mqtt_client
+from models import db, ControlState
+
+@pytest.fixture
+def proxy(app, monkeypatch):
+    """A web worker in proxy mode whose local state disagrees with the stored one"""
+    monkeypatch.setattr(hardware, 'is_proxy', lambda: True)
+    monkeypatch.setattr(hardware, 'control_state', {'fan': False, 'light': False, 'water_pump': False})
+    monkeypatch.setattr(mqtt_client, 'command_channel_available', lambda: True)
+    db.session.add(ControlState(fan_state=True, light_state=True, water_pump_state=False))
+    db.session.commit()
+
+def command(monkeypatch, state, status=None):
+    sent = {'id': 'c1', 'state': state, 'status': status or {}}
+    monkeypatch.setattr(mqtt_client, 'send_control_command', lambda *args, **kwargs: sent)
+    return sent
+
+def test_pending_command_reports_the_stored_state(proxy, monkeypatch):
+    sent = command(monkeypatch, 'pending')
+    assert hardware.control_fan(False) == (True, sent)
+    assert hardware.control_actuators({'fan': False, 'light': False}) == (
+        {'fan': True, 'light': True, 'water_pump': False}, sent)
+
+def test_acknowledged_command_reports_the_status(proxy, monkeypatch):
+    sent = command(monkeypatch, 'acknowledged', {'fan': False})
+    assert hardware.control_fan(False) == (False, sent)
+    assert hardware.control_actuators({'fan': False})[0] == {'fan': False, 'light': True, 'water_pump': False}
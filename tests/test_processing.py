@@ -0,0 +1,58 @@
+"""Tests for the per-channel processing pipeline"""
+
+import pytest
+
+from processing import (ChannelProcessor, DEFAULT_SETTINGS, QUALITY_OK, QUALITY_SUBSTITUTED, QUALITY_OUTLIER,
+                        QUALITY_OUT_OF_RANGE, QUALITY_NO_DATA, apply_curve, pack_quality, unpack_quality)
+
+def processor(**settings):
+    return ChannelProcessor(dict(DEFAULT_SETTINGS, **settings))
+
+def test_substituted_values_bypass_the_filter_state():
+    channel = processor(hampel=None)
+    assert channel.process(42.0, substituted=True) == (42.0, QUALITY_SUBSTITUTED)
+    assert channel.smoothed is None and channel.last_good is None
+
+def test_curve_calibrates_and_extrapolates():
+    points = [[9000, 100], [21000, 0]]
+    assert apply_curve(points, 15000) == pytest.approx(50.0)
+    assert apply_curve(points, 24000) == pytest.approx(-25.0)
+    assert apply_curve([[1.0, 0.5]], 20.0) == pytest.approx(19.5)
+
+    channel = processor(curve=points, hampel=None)
+    assert channel.process(15000) == (pytest.approx(50.0), QUALITY_OK)
+
+def test_out_of_range_values_are_replaced_by_the_last_good_value():
+    channel = processor(range=[0.0, 100.0], hampel=None)
+    assert channel.process(150.0) == (150.0, QUALITY_OUT_OF_RANGE | QUALITY_NO_DATA)
+    assert channel.process(40.0) == (40.0, QUALITY_OK)
+    assert channel.process(-5.0) == (40.0, QUALITY_OUT_OF_RANGE)
+
+def test_hampel_filter_rejects_spikes_but_accepts_a_step():
+    channel = processor(hampel={'window': 5, 'k': 3.0, 'min_deviation': 0.5})
+    for value in (20.0, 20.1, 19.9, 20.0, 20.2):
+        assert channel.process(value)[1] == QUALITY_OK
+
+    assert channel.process(35.0) == (20.0, QUALITY_OUTLIER)
+    # The raw values enter the window, so a lasting change passes after a few samples
+    results = [channel.process(25.0) for _ in range(3)]
+    assert [quality for _, quality in results] == [QUALITY_OUTLIER, QUALITY_OUTLIER, QUALITY_OK]
+    assert results[-1][0] == 25.0
+
+def test_constant_window_without_minimum_deviation_does_not_flag():
+    channel = processor(hampel={'window': 3, 'k': 3.0})
+    for _ in range(3):
+        channel.process(10.0)
+    assert channel.process(10.5) == (10.5, QUALITY_OK)
+
+def test_ewma_smooths_the_output():
+    channel = processor(hampel=None, ewma=0.5)
+    assert channel.process(10.0) == (10.0, QUALITY_OK)
+    assert channel.process(20.0) == (15.0, QUALITY_OK)
+    assert channel.process(20.0) == (17.5, QUALITY_OK)
+
+def test_quality_packing_round_trips():
+    metrics = ('temperature', 'humidity', 'light_level')
+    flags = {'temperature': QUALITY_OUTLIER, 'light_level': QUALITY_SUBSTITUTED | QUALITY_NO_DATA}
+    packed = pack_quality(flags, metrics)
+    assert unpack_quality(packed, metrics) == dict(flags, humidity=QUALITY_OK)
@@ -0,0 +1,110 @@
+"""Tests for the one-minute rollup tier on SQLite"""
+
+from sqlalchemy import select
+
+from models import db, Device, Metric, SensorReading, MetricRollup, EdgeAggregate
+from channel_store import insert_samples, resolve_id, device_ids, metric_ids
+from processing import QUALITY_SUBSTITUTED
+from rollups import rebuild_rollups, _narrow_rollups, MINUTE_MS
+from sensor_data import LEGACY_DEVICE, _ms_to_datetime
+
+# Start of a minute, in epoch milliseconds
+BASE = 28000000 * MINUTE_MS
+
+def ids(device, metric):
+    return resolve_id(Device, device_ids, device), resolve_id(Metric, metric_ids, metric)
+
+def add_samples(device, metric, samples):
+    device_id, metric_id = ids(device, metric)
+    insert_samples([{'metric_id': metric_id, 'device_id': device_id, 'ts': ts, 'value': value,
+                     'quality': quality} for ts, value, quality in samples])
+
+def rollups(device, metric):
+    """{minute offset from BASE: (count, sum, min, max)} of one series"""
+    device_id, metric_id = ids(device, metric)
+    rows = db.session.execute(
+        select(MetricRollup.minute, MetricRollup.count, MetricRollup.sum, MetricRollup.min, MetricRollup.max)
+        .where(MetricRollup.device_id == device_id, MetricRollup.metric_id == metric_id)
+    ).all()
+    return {minute - BASE // MINUTE_MS: tuple(values) for minute, *values in rows}
+
+def test_narrow_samples_roll_up_per_minute_without_substitutes(app):
+    add_samples('tent', 'temperature', [
+        (BASE, 20.0, 0), (BASE + 30000, 22.0, 0), (BASE + 45000, 99.0, QUALITY_SUBSTITUTED),
+        (BASE + MINUTE_MS, 24.0, 0),
+    ])
+    rebuild_rollups()
+
+    assert rollups('tent', 'temperature') == {0: (2, 42.0, 20.0, 22.0), 1: (1, 24.0, 24.0, 24.0)}
+
+def test_rebuild_is_limited_to_the_written_series(app):
+    add_samples('tent', 'temperature', [(BASE, 20.0, 0)])
+    add_samples('tent', 'humidity', [(BASE, 50.0, 0)])
+    add_samples('cellar', 'temperature', [(BASE, 12.0, 0)])
+    rebuild_rollups()
+
+    add_samples('tent', 'temperature', [(BASE + 10000, 22.0, 0)])
+    add_samples('cellar', 'temperature', [(BASE + 10000, 14.0, 0)])
+    rebuild_rollups(BASE, BASE + 10000, {('tent', 'temperature')})
+
+    assert rollups('tent', 'temperature') == {0: (2, 42.0, 20.0, 22.0)}
+    assert rollups('tent', 'humidity') == {0: (1, 50.0, 50.0, 50.0)}
+    # Not part of the rebuilt series, so the new sample is not rolled up yet
+    assert rollups('cellar', 'temperature') == {0: (1, 12.0, 12.0, 12.0)}
+
+    rebuild_rollups(BASE, BASE, {('cellar', None)})
+    assert rollups('cellar', 'temperature') == {0: (2, 26.0, 12.0, 14.0)}
+
+def test_wide_rows_only_count_before_the_first_narrow_sample(app):
+    for minute, value in enumerate((18.0, 19.0, 20.0, 21.0, 22.0)):
+        db.session.add(SensorReading(timestamp=_ms_to_datetime(BASE + minute * MINUTE_MS), temperature=value,
+                                     humidity=50.0, light_level=100.0))
+    add_samples(LEGACY_DEVICE, 'temperature', [(BASE + 3 * MINUTE_MS + 5000, 30.0, 0)])
+    rebuild_rollups()
+
+    assert rollups(LEGACY_DEVICE, 'temperature') == {
+        0: (1, 18.0, 18.0, 18.0),
+        1: (1, 19.0, 19.0, 19.0),
+        2: (1, 20.0, 20.0, 20.0),
+        3: (1, 30.0, 30.0, 30.0),
+    }
+    # Metrics without narrow samples come from the wide table throughout
+    assert len(rollups(LEGACY_DEVICE, 'humidity')) == 5
+
+def test_edge_aggregates_only_fill_windows_without_raw_samples(app):
+    device_id, metric_id = ids('tent', 'light_level')
+    for start in (BASE, BASE + 2 * MINUTE_MS):
+        db.session.add(EdgeAggregate(metric_id=metric_id, device_id=device_id, start=start, interval=60,
+                                     count=6, sum=600.0, sumsq=60000.0, min=90.0, max=110.0))
+    add_samples('tent', 'light_level', [(BASE + 20000, 95.0, 0)])
+    rebuild_rollups()
+
+    assert rollups('tent', 'light_level') == {0: (1, 95.0, 95.0, 95.0), 2: (6, 600.0, 90.0, 110.0)}
+
+def test_repeated_rebuilds_replace_rows(app):
+    add_samples('tent', 'temperature', [(BASE, 20.0, 0)])
+    rebuild_rollups()
+    rebuild_rollups(BASE, BASE, {('tent', 'temperature')})
+    # Writing a minute that already has a rollup replaces it
+    db.session.execute(_narrow_rollups(None, None))
+
+    assert rollups('tent', 'temperature') == {0: (1, 20.0, 20.0, 20.0)}
+
+def test_failed_channel_flush_keeps_the_readings(app, monkeypatch):
+    import channel_store
+
+    monkeypatch.setattr(channel_store, 'pending_readings', [])
+    channel_store.add_channel_reading('tent', 'temperature', BASE, 20.0)
+    channel_store.add_channel_reading('tent', 'temperature', BASE + 1000, 22.0)
+
+    def fail(rows):
+        raise RuntimeError('database is locked')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(channel_store, 'insert_samples', fail)
+        assert channel_store.flush_channel_readings() is None
+    assert len(channel_store.pending_readings) == 2
+
+    assert channel_store.flush_channel_readings() == 2
+    assert channel_store.pending_readings == []
+    assert rollups('tent', 'temperature') == {0: (2, 42.0, 20.0, 22.0)}
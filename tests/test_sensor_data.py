@@ -0,0 +1,95 @@
+"""Tests for the dashboard queries in sensor_data"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models import db, Device, Metric, SensorReading
+from channel_store import insert_samples, resolve_id, device_ids, metric_ids
+from rollups import rebuild_rollups
+from sensor_data import (LEGACY_DEVICE, STEP_MAX_HOLD, _step_means, _since_start, to_epoch_ms,
+                         get_readings_time_range_columnar, get_hourly_average_columnar, get_metric_series,
+                         get_daily_min_max)
+
+HOUR_MS = 3600000
+
+def add_readings(*readings):
+    """Add (timestamp, temperature) wide readings and return their ids"""
+    rows = [SensorReading(timestamp=timestamp, temperature=value, humidity=50.0, light_level=100.0)
+            for timestamp, value in readings]
+    db.session.add_all(rows)
+    db.session.commit()
+    return [row.id for row in rows]
+
+def test_step_means_weight_each_value_by_its_hold():
+    raw = [('t', 0, 10.0), ('t', 60000, 20.0), ('t', 90000, 30.0), ('h', 0, 50.0)]
+    means = _step_means(raw, lambda ts: ts - ts % 120000, 120000)
+
+    assert means[('t', 0)] == pytest.approx((10.0 * 60 + 20.0 * 30 + 30.0 * 30) / 120)
+    assert means[('h', 0)] == 50.0
+
+def test_step_means_cap_the_hold_and_keep_it_in_the_sampled_bucket():
+    hold = STEP_MAX_HOLD * 1000
+    raw = [('t', 0, 10.0), ('t', 3 * hold, 40.0), ('t', 3 * hold + 1000, 50.0)]
+    means = _step_means(raw, lambda ts: 0 if ts < 3 * hold else 1, 3 * hold + 2000)
+
+    # The gap counts for at most STEP_MAX_HOLD, all of it in the first bucket
+    assert means[('t', 0)] == 10.0
+    assert means[('t', 1)] == pytest.approx(45.0)
+
+def test_since_start_backs_up_one_bucket():
+    start = datetime(2024, 5, 1)
+    since = to_epoch_ms(datetime(2024, 5, 2, 10, 30))
+    assert _since_start(start, None, HOUR_MS) == start
+    assert _since_start(start, since, HOUR_MS) == datetime(2024, 5, 2, 9)
+    assert _since_start(datetime(2024, 5, 2, 9, 45), since, HOUR_MS) == datetime(2024, 5, 2, 9, 45)
+
+def test_readings_since_id_returns_only_newer_rows(app):
+    now = datetime.utcnow()
+    first, second = add_readings((now - timedelta(minutes=2), 20.0), (now - timedelta(minutes=1), 21.0))
+
+    assert get_readings_time_range_columnar(1)['id'] == [first, second]
+    assert get_readings_time_range_columnar(1, since_id=first)['id'] == [second]
+    assert get_readings_time_range_columnar(1, since_id=second)['id'] == []
+
+def test_hourly_since_recomputes_the_previous_hour(app):
+    now = datetime.utcnow()
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    add_readings((hour - timedelta(minutes=119), 18.0), (hour - timedelta(minutes=30), 10.0),
+                 (hour - timedelta(minutes=2), 20.0))
+    since = get_hourly_average_columnar(4)['timestamp'][-1]
+    assert since == to_epoch_ms(hour) - HOUR_MS
+
+    # A new sample ends the hold of the one before it, which lies in an older hour
+    add_readings((now, 30.0))
+    update = get_hourly_average_columnar(4, since)
+    assert update['timestamp'] == [since - HOUR_MS, since, since + HOUR_MS]
+    assert update['temperature'] == get_hourly_average_columnar(4)['temperature'][-3:]
+
+def test_metric_series_since_returns_later_samples(app):
+    now_ms = to_epoch_ms(datetime.utcnow())
+    device_id, metric_id = resolve_id(Device, device_ids, 'tent'), resolve_id(Metric, metric_ids, 'co2')
+    insert_samples([{'metric_id': metric_id, 'device_id': device_id, 'ts': ts, 'value': value, 'quality': 0}
+                    for ts, value in ((now_ms - 20000, 400.0), (now_ms - 10000, 410.0))])
+    db.session.commit()
+
+    assert get_metric_series('co2', 1, 'tent')['value'] == [400.0, 410.0]
+    assert get_metric_series('co2', 1, 'tent', since=now_ms - 20000)['value'] == [410.0]
+
+def test_daily_average_is_hold_weighted(app):
+    now = datetime.utcnow()
+    # Local noon, so the samples of the last minutes fall on one day
+    tz = timezone(timedelta(hours=12 - now.hour))
+    now_ms = to_epoch_ms(now)
+    start = now_ms - 20 * 60000
+    device_id, metric_id = resolve_id(Device, device_ids, LEGACY_DEVICE), resolve_id(Metric, metric_ids, 'temperature')
+    insert_samples([{'metric_id': metric_id, 'device_id': device_id, 'ts': ts, 'value': value, 'quality': 0}
+                    for ts, value in ((start, 10.0), (start + 60000, 20.0), (start + 120000, 20.0))])
+    rebuild_rollups()
+    db.session.commit()
+
+    day, = get_daily_min_max(1, tz=tz)
+    hold = min(STEP_MAX_HOLD * 1000, now_ms - start - 120000)
+    assert day['temperature']['min'] == 10.0 and day['temperature']['max'] == 20.0
+    assert day['temperature']['avg'] == pytest.approx((10.0 * 60000 + 20.0 * 60000 + 20.0 * hold) / (120000 + hold),
+                                                      rel=1e-3)